@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_PATH = os.path.join(ROOT_PATH, "src")
+STARTUP_MODULES = ["conv_package.conv", "conv_package.daemon"]
+FORBIDDEN_MODULES = ["lxml", "conv_package.package", "conv_package.project", "conv_package.conversion", "conv_package.msbuild"]
+
+def measure_imports(python, modules):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(x for x in [SRC_PATH, env.get("PYTHONPATH")] if x)
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {', '.join(modules)}"], env=env, capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        imports.append((name.strip(), len(name) - len(name.lstrip()), int(parts[1])))
+    return imports
+
+def get_startup_time(imports):
+    # cumulative time of the top-level imports made for conv itself, python startup is not counted
+    return sum(cumulative for (name, depth, cumulative) in imports if depth == 1 and name.startswith("conv_package"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if conv cold start imports too much or takes too long.")
+    parser.add_argument("--budget-ms", dest="budget_ms", type=float, default=50.0, help="Maximum import time of the conv entry point and daemon client.")
+    parser.add_argument("--runs", dest="runs", type=int, default=5, help="Number of runs, the fastest one is compared with the budget.")
+    parser.add_argument("--python", dest="python", default=sys.executable)
+    args = parser.parse_args()
+
+    runs = [measure_imports(args.python, STARTUP_MODULES) for _ in range(args.runs)]
+    best_us = min(get_startup_time(x) for x in runs)
+    imported_modules = set(name for (name, depth, cumulative) in runs[0])
+    forbidden = sorted(x for x in imported_modules if any(x == f or x.startswith(f + ".") for f in FORBIDDEN_MODULES))
+
+    print(f"conv startup imports: {best_us / 1000:.1f} ms (budget {args.budget_ms:.1f} ms), {len(imported_modules)} modules")
+    failed = False
+    if len(forbidden) > 0:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(forbidden)}")
+        failed = True
+    if best_us > args.budget_ms * 1000:
+        print("FAIL: startup import time is over budget")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
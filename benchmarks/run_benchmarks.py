@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import SyntheticRepoOptions, generate
+
+class Benchmark:
+    def __init__(self, name, run, setup=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+
+def measure(benchmark, repeat):
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = benchmark.setup() if benchmark.setup is not None else None
+            start = time.perf_counter()
+            benchmark.run(state)
+            timings.append(time.perf_counter() - start)
+    return {
+        "runs": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+    }
+
+def create_benchmarks(work_path):
+    from conv_package.cache import FileCache
+    from conv_package.conv import main
+    from conv_package.msbuild import document_cache, property_evaluator
+    from conv_package.package import PackageInfoBuilder, PackageStorage
+    from conv_package.project import ProjectInfo
+
+    repo_path = os.path.join(work_path, "repo")
+    cache_path = os.path.join(work_path, "cache", "packages.pickle")
+    index_path = os.path.join(work_path, "cache", "index.sqlite")
+    maui_solution_path = os.path.join(work_path, "MauiSolution")
+    xamarin_solution_path = os.path.join(work_path, "XamarinSolution")
+    pristine_path = os.path.join(work_path, "pristine")
+    for solution_path in [maui_solution_path, xamarin_solution_path]:
+        shutil.copytree(solution_path, os.path.join(pristine_path, os.path.basename(solution_path)))
+
+    def create_builder(cache=None):
+        return PackageInfoBuilder(repo_path, "nuspec", "scripts/nuget", cache)
+
+    def reset_caches():
+        document_cache.clear()
+        property_evaluator.clear()
+
+    def restore_solution(solution_path):
+        shutil.rmtree(solution_path)
+        shutil.copytree(os.path.join(pristine_path, os.path.basename(solution_path)), solution_path)
+        reset_caches()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        packages = create_builder().build_packages()
+        create_builder(FileCache(cache_path)).build_packages()
+        index_builder = create_builder()
+        index_builder.export_index(index_builder.build_packages(), index_path)
+    storage = PackageStorage(packages)
+    maui_project_path = sorted(x.path for x in os.scandir(maui_solution_path) if x.name.startswith("Maui"))[0]
+    maui_project_path = os.path.join(maui_project_path, os.path.basename(maui_project_path) + ".csproj")
+    xamarin_project_path = sorted(x.path for x in os.scandir(xamarin_solution_path) if x.name.startswith("Xamarin"))[0]
+    xamarin_project_path = os.path.join(xamarin_project_path, os.path.basename(xamarin_project_path) + ".csproj")
+    reset_caches()
+    maui_package_references = ProjectInfo(maui_project_path).get_package_references()
+    xamarin_package_references = ProjectInfo(xamarin_project_path).get_package_references()
+    maui_dll_references = {"android": sorted(set(r for p in storage.get_maui_packages() for r in p.android_references))[:20]}
+
+    def fresh_storage():
+        # resolution results are memoized per storage, every run has to start cold
+        return PackageStorage(packages)
+
+    def load_project(_):
+        reset_caches()
+        return ProjectInfo(maui_project_path)
+
+    def mutate_project(project):
+        (android_references, ios_references, packages_to_remove) = storage.find_maui_references_to_process(maui_package_references)
+        project.add_references(android_references, repo_path=repo_path, platform="android")
+        project.add_references(ios_references, repo_path=repo_path, platform="ios")
+        project.remove_package_references(packages_to_remove)
+        return project
+
+    def setup_save():
+        restore_solution(maui_solution_path)
+        return mutate_project(load_project(None))
+
+    def run_main(argv, solution_path):
+        current_dir = os.getcwd()
+        os.chdir(solution_path)
+        old_argv = sys.argv
+        sys.argv = ["conv"] + argv
+        try:
+            main()
+        finally:
+            sys.argv = old_argv
+            os.chdir(current_dir)
+
+    main_args = ["-w", repo_path, "--no-daemon", "-j", "1"]
+    return [
+        Benchmark("build_packages.cold", lambda _: create_builder().build_packages()),
+        Benchmark("build_packages.cached", lambda _: create_builder(FileCache(cache_path)).build_packages()),
+        Benchmark("PackageInfoBuilder.export_index", lambda _: index_builder.export_index(packages, index_path + ".bench")),
+        Benchmark("PackageInfoBuilder.load_index", lambda _: index_builder.load_index(index_path)),
+        Benchmark("PackageStorage.init", lambda _: PackageStorage(packages)),
+        Benchmark("PackageStorage.find_common_references", lambda s: s.find_common_references(xamarin_package_references), fresh_storage),
+        Benchmark("PackageStorage.find_android_references", lambda s: s.find_android_references(xamarin_package_references), fresh_storage),
+        Benchmark("PackageStorage.find_ios_references", lambda s: s.find_ios_references(xamarin_package_references), fresh_storage),
+        Benchmark("PackageStorage.find_maui_references_to_process", lambda s: s.find_maui_references_to_process(maui_package_references), fresh_storage),
+        Benchmark("PackageStorage.find_maui_partitions", lambda s: s.find_maui_partitions(maui_package_references), fresh_storage),
+        Benchmark("PackageStorage.find_maui_packages", lambda s: s.find_maui_packages(maui_dll_references), fresh_storage),
+        Benchmark("ProjectInfo.load", load_project),
+        Benchmark("ProjectInfo.mutate", mutate_project, lambda: load_project(None)),
+        Benchmark("ProjectInfo.save", lambda p: p.save(), setup_save),
+        Benchmark("main.maui", lambda _: run_main(main_args + ["--no-cache"], maui_solution_path), lambda: restore_solution(maui_solution_path)),
+        Benchmark("main.maui.cached", lambda _: run_main(main_args, maui_solution_path), lambda: restore_solution(maui_solution_path)),
+        Benchmark("main.xamarin", lambda _: run_main(main_args + ["--no-cache"], xamarin_solution_path), lambda: restore_solution(xamarin_solution_path)),
+        Benchmark("main.xamarin.cached", lambda _: run_main(main_args, xamarin_solution_path), lambda: restore_solution(xamarin_solution_path)),
+    ]
+
+def run(args):
+    options = SyntheticRepoOptions(args.nuspecs, args.depth, args.bundles, args.projects, args.props_depth, args.seed)
+    work_path = tempfile.mkdtemp(prefix="conv-bench-")
+    # cache files and backups of the saved projects stay inside the synthetic tree
+    os.environ["XDG_CACHE_HOME"] = os.path.join(work_path, "cache")
+    try:
+        generate(work_path, options)
+        benchmarks = create_benchmarks(work_path)
+        results = dict()
+        for benchmark in benchmarks:
+            if args.filter is not None and args.filter not in benchmark.name:
+                continue
+            results[benchmark.name] = measure(benchmark, args.repeat)
+            print(f"{benchmark.name:<50} {results[benchmark.name]['median'] * 1000:10.2f} ms")
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": options.to_dict(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+def compare(baseline, current, threshold):
+    if baseline["options"] != current["options"]:
+        print("Warning: runs were made on different synthetic repositories")
+    regressions = 0
+    print(f"{'benchmark':<50} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for (name, result) in current["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:<50} {'-':>10} {result['median'] * 1000:10.2f}")
+            continue
+        baseline_median = baseline["results"][name]["median"]
+        ratio = result["median"] / baseline_median if baseline_median > 0 else 1.0
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = " SLOWER"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            mark = " faster"
+        print(f"{name:<50} {baseline_median * 1000:10.2f} {result['median'] * 1000:10.2f} {ratio:7.2f}{mark}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the conversion pipeline on a synthetic repository.")
+    parser.add_argument("--nuspecs", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=6, help="Dependency depth of the package graph.")
+    parser.add_argument("--bundles", type=int, default=100)
+    parser.add_argument("--projects", type=int, default=40)
+    parser.add_argument("--props-depth", dest="props_depth", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark, the median is reported.")
+    parser.add_argument("--filter", help="Run only benchmarks whose name contains this text.")
+    parser.add_argument("-o", "--output", help="Write results to this JSON file.")
+    parser.add_argument("--compare", help="Compare with the results of an earlier run.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change reported as a regression with --compare.")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, result, args.threshold) > 0:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import ntpath
+import os
+import random
+import shutil
+
+NUSPEC_NAMESPACE = "http://schemas.microsoft.com/packaging/2013/05/nuspec.xsd"
+MSBUILD_NAMESPACE = "http://schemas.microsoft.com/developer/msbuild/2003"
+
+class SyntheticRepoOptions:
+    def __init__(self, nuspecs=200, depth=6, bundles=100, projects=40, props_depth=3, seed=1):
+        self.nuspecs = nuspecs
+        self.depth = depth
+        self.bundles = bundles
+        self.projects = projects
+        self.props_depth = props_depth
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="\n") as f:
+        f.write(content)
+
+def get_package_id(index, is_maui):
+    return f"DevExpress.Maui.Synthetic{index}" if is_maui else f"DevExpress.XamarinForms.Synthetic{index}"
+
+def get_dependencies(index, options, rng):
+    layer = index % options.depth
+    if layer == 0:
+        return []
+    # depend on a couple of packages from the previous layer, so the graph is exactly "depth" levels deep
+    candidates = [x for x in range(index) if x % options.depth == layer - 1]
+    return sorted(set(rng.choice(candidates) for _ in range(min(2, len(candidates)))))
+
+def write_maui_nuspec(repo_path, index, dependencies):
+    package_id = get_package_id(index, True)
+    dependency_nodes = "".join(f'<dependency id="{get_package_id(x, True)}" version="22.2.1" />' for x in dependencies)
+    files = [
+        (f"..\\bin\\android\\{package_id}.dll", f"lib\\net6.0-android31.0\\{package_id}.dll"),
+        (f"..\\bin\\android\\{package_id}.Android.dll", f"lib\\net6.0-android31.0\\{package_id}.Android.dll"),
+        (f"..\\bin\\ios\\{package_id}.dll", f"lib\\net6.0-ios15.4\\{package_id}.dll"),
+        (f"..\\bin\\ios\\{package_id}.iOS.dll", f"lib\\net6.0-ios15.4\\{package_id}.iOS.dll"),
+    ]
+    file_nodes = "\n".join(f'    <file src="{source}" target="{target}" />' for (source, target) in files)
+    write_file(os.path.join(repo_path, "nuspec", f"{package_id}.nuspec"), f'''<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="{NUSPEC_NAMESPACE}">
+  <metadata>
+    <id>{package_id}</id>
+    <version>22.2.1</version>
+    <dependencies>
+      <group targetFramework="net6.0-android31.0">{dependency_nodes}</group>
+      <group targetFramework="net6.0-ios15.4">{dependency_nodes}</group>
+    </dependencies>
+  </metadata>
+  <files>
+{file_nodes}
+  </files>
+</package>
+''')
+    for reference in [package_id, f"{package_id}.Android", f"{package_id}.iOS"]:
+        write_file(os.path.join(repo_path, "xamarin", "maui", package_id, f"{reference}.csproj"), '<Project Sdk="Microsoft.NET.Sdk">\n</Project>\n')
+    return [source for (source, target) in files]
+
+def write_xamarin_nuspec(repo_path, index, dependencies):
+    package_id = get_package_id(index, False)
+    dependency_nodes = "".join(f'<dependency id="{get_package_id(x, False)}" version="22.2.1" />' for x in dependencies)
+    files = [
+        (f"bin\\{package_id}.dll", "lib\\netstandard2.0"),
+        (f"bin\\{package_id}.Android.dll", "lib\\MonoAndroid"),
+        (f"bin\\{package_id}.iOS.dll", "lib\\Xamarin.iOS"),
+    ]
+    file_nodes = "\n".join(f'    <file src="{source}" target="{target}" />' for (source, target) in files)
+    for reference in [package_id, f"{package_id}.Android", f"{package_id}.iOS"]:
+        write_file(os.path.join(repo_path, "xamarin", "maui", package_id, f"{reference}.csproj"), '<Project Sdk="Microsoft.NET.Sdk">\n</Project>\n')
+    write_file(os.path.join(repo_path, "nuspec", f"{package_id}.nuspec"), f'''<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="{NUSPEC_NAMESPACE}">
+  <metadata>
+    <id>{package_id}</id>
+    <version>22.2.1</version>
+    <dependencies>
+      <group>{dependency_nodes}</group>
+    </dependencies>
+    <references>
+      <group><reference file="{package_id}.dll" /></group>
+      <group targetFramework="MonoAndroid"><reference file="{package_id}.Android.dll" /></group>
+      <group targetFramework="Xamarin.iOS"><reference file="{package_id}.iOS.dll" /></group>
+    </references>
+  </metadata>
+  <files>
+{file_nodes}
+  </files>
+</package>
+''')
+    return [source for (source, target) in files]
+
+def write_bundle(repo_path, package_id, sources):
+    components = [{"source": f"xamarin/maui/{package_id}/bin/Release/{ntpath.basename(x)}", "target": f".\\{x}"} for x in sources]
+    write_file(os.path.join(repo_path, "scripts", "nuget", f"{package_id}.json"), json.dumps({"bundle": {"id": package_id, "components": components}}, indent=2))
+
+def write_props_chain(repo_path, options):
+    maui_path = os.path.join(repo_path, "xamarin", "Maui")
+    write_file(os.path.join(maui_path, "Build.props"), '''<Project>
+  <ItemGroup>
+    <PackageReference Include="DevExpress.Data" Version="22.2.1" />
+  </ItemGroup>
+</Project>
+''')
+    write_file(os.path.join(maui_path, "Directory.Build.props"), '''<Project>
+  <Import Project="$(MSBuildThisFileDirectory)Versions.props" />
+  <PropertyGroup>
+    <LangVersion>latest</LangVersion>
+  </PropertyGroup>
+</Project>
+''')
+    write_file(os.path.join(maui_path, "Versions.props"), '''<Project>
+  <PropertyGroup>
+    <DevExpress_Data>22.2.3</DevExpress_Data>
+  </PropertyGroup>
+</Project>
+''')
+    project_dir = maui_path
+    for level in range(options.props_depth):
+        project_dir = os.path.join(project_dir, f"Level{level}")
+        write_file(os.path.join(project_dir, "Directory.Build.props"), f'''<Project>
+  <Import Project="..\\Directory.Build.props" />
+  <PropertyGroup>
+    <Level{level}>true</Level{level}>
+  </PropertyGroup>
+</Project>
+''')
+    write_file(os.path.join(project_dir, "DevExpress.Data.Maui.csproj"), '''<Project Sdk="Microsoft.NET.Sdk">
+  <PropertyGroup>
+    <TargetFramework>net6.0</TargetFramework>
+  </PropertyGroup>
+</Project>
+''')
+
+def generate_repo(repo_path, options):
+    rng = random.Random(options.seed)
+    shutil.rmtree(repo_path, ignore_errors=True)
+    packages = {True: [], False: []}
+    for index in range(options.nuspecs):
+        # even packages are MAUI, odd ones Xamarin; each family has its own dependency layers
+        is_maui = index % 2 == 0
+        family_index = index // 2
+        dependencies = [x * 2 + index % 2 for x in get_dependencies(family_index, options, rng)]
+        if is_maui:
+            sources = write_maui_nuspec(repo_path, index, dependencies)
+        else:
+            sources = write_xamarin_nuspec(repo_path, index, dependencies)
+        packages[is_maui].append(get_package_id(index, is_maui))
+        if index < options.bundles:
+            write_bundle(repo_path, get_package_id(index, is_maui), sources)
+    write_props_chain(repo_path, options)
+    return (packages[True], packages[False])
+
+def get_package_reference_nodes(packages):
+    return "\n".join(f'    <PackageReference Include="{x}" Version="22.2.1" />' for x in packages)
+
+def get_project_reference_group(project_paths):
+    if len(project_paths) == 0:
+        return ""
+    nodes = "".join(f'    <ProjectReference Include="{x}" />\n' for x in project_paths)
+    return f"  <ItemGroup>\n{nodes}  </ItemGroup>\n"
+
+def get_project_content(kind, packages, project_references=[]):
+    if kind in ["maui", "xamarin"]:
+        target_framework = "<TargetFrameworks>net6.0-android;net6.0-ios</TargetFrameworks>\n    <OutputType>Exe</OutputType>\n    <UseMaui>true</UseMaui>" if kind == "maui" else "<TargetFramework>netstandard2.0</TargetFramework>"
+        return f'''<Project Sdk="Microsoft.NET.Sdk">
+  <PropertyGroup>
+    {target_framework}
+  </PropertyGroup>
+  <ItemGroup>
+{get_package_reference_nodes(packages)}
+    <PackageReference Include="Newtonsoft.Json" Version="13.0.1" />
+  </ItemGroup>
+</Project>
+'''
+    if kind in ["android", "ios"]:
+        targets = "Xamarin.Android.CSharp.targets" if kind == "android" else "Xamarin.iOS.CSharp.targets"
+        return f'''<?xml version="1.0" encoding="utf-8"?>
+<Project ToolsVersion="15.0" xmlns="{MSBUILD_NAMESPACE}">
+  <PropertyGroup>
+    <OutputType>Exe</OutputType>
+  </PropertyGroup>
+  <ItemGroup>
+    <Reference Include="System" />
+    <Reference Include="System.Core" />
+  </ItemGroup>
+{get_project_reference_group(project_references)}  <Import Project="$(MSBuildExtensionsPath)\\Xamarin\\{targets}" />
+</Project>
+'''
+    return '''<Project Sdk="Microsoft.NET.Sdk">
+  <PropertyGroup>
+    <TargetFramework>net6.0</TargetFramework>
+  </PropertyGroup>
+  <ItemGroup>
+    <PackageReference Include="xunit" Version="2.4.1" />
+  </ItemGroup>
+</Project>
+'''
+
+def generate_solution(solution_path, kinds, packages, options):
+    # conv converts every maui, xamarin common, android and ios project; test projects only cost discovery and
+    # classification. Projects draw their packages from a few shared sets, like projects of one product do, so
+    # resolutions are shared. An android or ios head references the common project before it.
+    rng = random.Random(options.seed)
+    shutil.rmtree(solution_path, ignore_errors=True)
+    package_sets = [rng.sample(packages, min(5, len(packages))) for _ in range(max(1, options.projects // 8))]
+    solution_projects = []
+    common_project = None
+    for index in range(options.projects):
+        kind = kinds[index % len(kinds)]
+        name = f"{kind.capitalize()}Project{index}"
+        project_packages = rng.choice(package_sets) if kind in ["maui", "xamarin"] else []
+        project_references = [f"..\\{common_project}\\{common_project}.csproj"] if kind in ["android", "ios"] and common_project is not None else []
+        if kind == "xamarin":
+            common_project = name
+        write_file(os.path.join(solution_path, name, f"{name}.csproj"), get_project_content(kind, project_packages, project_references))
+        # build output folders are what the project discovery has to skip
+        write_file(os.path.join(solution_path, name, "obj", f"{name}.csproj.nuget.g.props"), "<Project />\n")
+        solution_projects.append((name, f"{name}\\{name}.csproj"))
+    solution_lines = ["Microsoft Visual Studio Solution File, Format Version 12.00"]
+    for (index, (name, project_path)) in enumerate(solution_projects):
+        solution_lines.append(f'Project("{{9A19103F-16F7-4668-BE54-9A1E7A4F7556}}") = "{name}", "{project_path}", "{{00000000-0000-0000-0000-{index:012d}}}"')
+        solution_lines.append("EndProject")
+    write_file(os.path.join(solution_path, f"{os.path.basename(solution_path)}.sln"), "\r\n".join(solution_lines) + "\r\n")
+
+def generate(output_path, options):
+    (maui_packages, xamarin_packages) = generate_repo(os.path.join(output_path, "repo"), options)
+    generate_solution(os.path.join(output_path, "MauiSolution"), ["maui", "test"], maui_packages, options)
+    generate_solution(os.path.join(output_path, "XamarinSolution"), ["xamarin", "android", "ios", "test"], xamarin_packages, options)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic native-mobile repository and solution for benchmarks.")
+    parser.add_argument("output", help="Folder for the generated repo, MauiSolution and XamarinSolution folders.")
+    parser.add_argument("--nuspecs", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=6, help="Dependency depth of the package graph.")
+    parser.add_argument("--bundles", type=int, default=100)
+    parser.add_argument("--projects", type=int, default=40)
+    parser.add_argument("--props-depth", dest="props_depth", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    options = SyntheticRepoOptions(args.nuspecs, args.depth, args.bundles, args.projects, args.props_depth, args.seed)
+    generate(args.output, options)
+
+if __name__ == "__main__":
+    main()
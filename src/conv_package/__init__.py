@@ -1 +1 @@
-from .conv import main
\ No newline at end of file
+from conv_package.conv import main
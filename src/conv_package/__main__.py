@@ -1,3 +1,4 @@
-import conv_package
+import sys
+from conv_package.conv import main
 if __name__ == '__main__':
-    conv_package.conv.main()
\ No newline at end of file
+    sys.exit(main())
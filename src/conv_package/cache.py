@@ -0,0 +1,126 @@
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import time
+
+CACHE_VERSION = 4
+
+def get_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "conv")
+
+def get_repo_cache_path(repo_path, name, extension=".pickle"):
+    repo_key = hashlib.sha1(os.path.abspath(repo_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(get_cache_dir(), f"{name}-{repo_key}{extension}")
+
+def get_file_digest(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def write_file_atomic(file_path, content):
+    file_dir = os.path.dirname(file_path)
+    os.makedirs(file_dir, exist_ok=True)
+    (fd, temp_path) = tempfile.mkstemp(dir=file_dir, prefix=f".{os.path.basename(file_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        if os.path.exists(file_path):
+            os.chmod(temp_path, stat.S_IMODE(os.stat(file_path).st_mode))
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class BackupStore:
+    # Content-addressed copies of overwritten files plus an append-only index of "time, hash, path" lines.
+    def __init__(self, store_path=None):
+        self.store_path = store_path if store_path is not None else os.path.join(get_cache_dir(), "backups")
+        self.index_path = os.path.join(self.store_path, "index.log")
+
+    def get_object_path(self, digest):
+        return os.path.join(self.store_path, "objects", digest[:2], digest)
+
+    def backup(self, file_path, content):
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self.get_object_path(digest)
+        if not os.path.exists(object_path):
+            write_file_atomic(object_path, content)
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(f"{time.strftime('%Y-%m-%dT%H:%M:%S')}\t{digest}\t{os.path.abspath(file_path)}\n")
+        return object_path
+
+    def get_backups(self, file_path):
+        backups = []
+        if not os.path.exists(self.index_path):
+            return backups
+        file_path = os.path.abspath(file_path)
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                (backup_time, digest, backup_file_path) = line.rstrip("\n").split("\t", 2)
+                if backup_file_path == file_path:
+                    backups.append((backup_time, self.get_object_path(digest)))
+        return backups
+
+class FileCache:
+    # Stores one pickled result per source file, keyed by path and validated by mtime, size and content hash.
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.entries = dict()
+        self.fingerprints = dict()
+        self.is_dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "rb") as f:
+                (version, entries) = pickle.load(f)
+        except Exception:
+            print(f"Ignore broken cache file {self.cache_path}")
+            return
+        if version == CACHE_VERSION:
+            self.entries = entries
+
+    def save(self):
+        if not self.is_dirty:
+            return
+        try:
+            write_file_atomic(self.cache_path, pickle.dumps((CACHE_VERSION, self.entries), protocol=pickle.HIGHEST_PROTOCOL))
+            self.is_dirty = False
+        except OSError as e:
+            print(f"Can't write cache file {self.cache_path}: {e}")
+
+    def lookup(self, file_path):
+        stat = os.stat(file_path)
+        entry = self.entries.get(file_path)
+        if entry is not None:
+            (mtime, size, digest, payload) = entry
+            if mtime == stat.st_mtime_ns and size == stat.st_size:
+                return (True, pickle.loads(payload))
+        digest = get_file_digest(file_path)
+        self.fingerprints[file_path] = (stat.st_mtime_ns, stat.st_size, digest)
+        if entry is not None and entry[2] == digest:
+            self.entries[file_path] = (stat.st_mtime_ns, stat.st_size, digest, entry[3])
+            self.is_dirty = True
+            return (True, pickle.loads(entry[3]))
+        return (False, None)
+
+    def store(self, file_path, data):
+        fingerprint = self.fingerprints.pop(file_path, None)
+        if fingerprint is None:
+            stat = os.stat(file_path)
+            fingerprint = (stat.st_mtime_ns, stat.st_size, get_file_digest(file_path))
+        (mtime, size, digest) = fingerprint
+        self.entries[file_path] = (mtime, size, digest, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+        self.is_dirty = True
+
+    def retain(self, file_paths):
+        stale_paths = set(self.entries) - set(file_paths)
+        for file_path in stale_paths:
+            del self.entries[file_path]
+        if len(stale_paths) > 0:
+            self.is_dirty = True
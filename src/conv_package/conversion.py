@@ -0,0 +1,351 @@
+import os
+import io
+import sys
+import contextlib
+import copy
+import functools
+import multiprocessing
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from conv_package.package import PackageInfoBuilder, PackageStorage, get_reference_path_key
+from conv_package.project import ProjectInfo, classify_project
+from conv_package.cache import FileCache, get_repo_cache_path
+from conv_package.graph import DependencyCycleError
+from conv_package.msbuild import get_property_matches
+from conv_package.discovery import DEFAULT_PRUNE_DIRS, DirectoryIndex, find_project_files, walk_files
+from conv_package.timings import timings
+
+__all__ = ["build_package_storage", "create_package_builder", "convert", "convert_in_dir", "convert_batch", "convert_solution", "find_data_version", "sortout_projects"]
+
+def create_package_builder(args):
+    full_repo_path = os.path.expanduser(args.repo_path)
+    if args.no_cache:
+        return PackageInfoBuilder(full_repo_path, "nuspec", "scripts/nuget", None, args.jobs)
+    cache = FileCache(get_repo_cache_path(full_repo_path, "packages"))
+    project_index = DirectoryIndex(get_repo_cache_path(full_repo_path, "projects"))
+    return PackageInfoBuilder(full_repo_path, "nuspec", "scripts/nuget", cache, args.jobs, project_index)
+
+def build_package_storage(args, mp_context=None):
+    builder = create_package_builder(args)
+    builder.mp_context = mp_context
+    packages = None
+    if args.index_path is not None:
+        packages = builder.load_index(args.index_path)
+    if packages is None:
+        packages = builder.build_packages()
+        if args.index_path is not None:
+            builder.export_index(packages, args.index_path)
+    with timings.phase("dependency_graph"):
+        return PackageStorage(packages)
+
+def convert(args):
+    working_dir = os.getcwd()
+    if args.jobs <= 1:
+        return convert_in_dir(args, build_package_storage(args), working_dir)
+    # The package index and the solution (its projects, then the data version when MAUI projects are converted)
+    # don't depend on each other and are prepared by concurrent tasks, conversion starts when both are done.
+    tasks = [functools.partial(build_package_storage, args, get_worker_context())]
+    if args.batch is not None:
+        tasks.append(functools.partial(find_solution_dirs, args.batch if len(args.batch) > 0 else [working_dir], DEFAULT_PRUNE_DIRS + args.prune_dirs, working_dir))
+    else:
+        tasks.append(functools.partial(prepare_solution, working_dir, args, args.jobs))
+    with timings.phase("prepare"):
+        (package_storage, prepared) = run_project_jobs(tasks, len(tasks))
+    if args.batch is not None:
+        return convert_batch(args, package_storage, working_dir, prepared)
+    convert_solution(working_dir, package_storage, args, prepared)
+    return 0
+
+def get_worker_context():
+    # Nuspec workers are started from a forkserver, forking next to running threads can copy a held lock.
+    # Platforms without forkserver (Windows) already spawn their workers.
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return None
+    mp_context = multiprocessing.get_context("forkserver")
+    mp_context.set_forkserver_preload(["conv_package.package"])
+    return mp_context
+
+def convert_in_dir(args, package_storage, working_dir):
+    if args.batch is not None:
+        return convert_batch(args, package_storage, working_dir)
+    convert_solution(working_dir, package_storage, args)
+    return 0
+
+def find_solution_dirs(root_dirs, prune_dirs, working_dir):
+    solution_dirs = []
+    for root_dir in root_dirs:
+        root_dir = os.path.abspath(os.path.join(working_dir, os.path.expanduser(root_dir)))
+        found_dirs = sorted(set(os.path.dirname(x) for x in walk_files(root_dir, ".sln", prune_dirs)))
+        for solution_dir in found_dirs if len(found_dirs) > 0 else [root_dir]:
+            if solution_dir not in solution_dirs:
+                solution_dirs.append(solution_dir)
+    return solution_dirs
+
+batch_package_storage = None
+batch_args = None
+
+def init_batch_worker(package_storage, args):
+    global batch_package_storage, batch_args
+    batch_package_storage = package_storage
+    batch_args = args
+
+def convert_solution_job(solution_dir):
+    output = io.StringIO()
+    processed_projects = []
+    error = None
+    with contextlib.redirect_stdout(output):
+        try:
+            processed_projects = convert_solution(solution_dir, batch_package_storage, batch_args)
+        except Exception as e:
+            error = str(e) if isinstance(e, DependencyCycleError) else traceback.format_exc()
+    return (solution_dir, output.getvalue(), processed_projects, error)
+
+def convert_solution_process_job(solution_dir):
+    # worker processes hand their timings back to the parent report
+    return (convert_solution_job(solution_dir), timings.take())
+
+def convert_batch(args, package_storage, working_dir, solution_dirs=None):
+    if solution_dirs is None:
+        solution_dirs = find_solution_dirs(args.batch if len(args.batch) > 0 else [working_dir], DEFAULT_PRUNE_DIRS + args.prune_dirs, working_dir)
+    jobs = min(args.jobs, len(solution_dirs))
+    if jobs <= 1:
+        init_batch_worker(package_storage, args)
+        results = [convert_solution_job(x) for x in solution_dirs]
+    else:
+        # the -j budget is split between the solution processes and the project threads of each one
+        worker_args = copy.copy(args)
+        worker_args.jobs = max(1, args.jobs // jobs)
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_batch_worker, initargs=(package_storage, worker_args)) as executor:
+            results = []
+            for (result, job_timings) in executor.map(convert_solution_process_job, solution_dirs):
+                timings.merge(job_timings)
+                results.append(result)
+    failed = 0
+    for (solution_dir, output, processed_projects, error) in results:
+        print(f"=== {solution_dir}")
+        print(output, end="")
+        if error is not None:
+            print(error)
+    print("Summary:")
+    for (solution_dir, output, processed_projects, error) in results:
+        if error is not None:
+            failed += 1
+            print(f"  FAILED    {solution_dir}")
+        elif len(processed_projects) == 0:
+            print(f"  SKIPPED   {solution_dir} (no projects to convert)")
+        else:
+            print(f"  CONVERTED {solution_dir} ({len(processed_projects)} projects)")
+    return 1 if failed > 0 else 0
+
+def find_solution_projects(solution_dir, args, jobs):
+    with timings.phase("project_discovery"):
+        proj_files = find_project_files(solution_dir, DEFAULT_PRUNE_DIRS + args.prune_dirs)
+    with timings.phase("classification"):
+        return sortout_projects(proj_files, jobs)
+
+def prepare_solution(solution_dir, args, jobs):
+    # the data version is only added to converted MAUI projects
+    projects = find_solution_projects(solution_dir, args, jobs)
+    maui_projects = projects[3]
+    data_package_version = find_data_package_version(args.repo_path) if len(maui_projects) > 0 and not args.reverse else None
+    return (projects, data_package_version)
+
+def convert_solution(solution_dir, package_storage, args, prepared=None):
+    # prepared is the result of prepare_solution when convert already ran it
+    repo_path = args.repo_path
+    convert_to_package_references = args.reverse
+    version = args.version
+    use_dll = args.use_dll
+    project_refs = args.project_refs
+    jobs = max(1, args.jobs)
+    project_jobs = []
+    processed_projects = []
+
+    if prepared is None:
+        prepared = prepare_solution(solution_dir, args, jobs)
+    (projects, data_package_version) = prepared
+    (xamarin_projects, android_projects, ios_projects, maui_projects) = projects
+
+    # references are resolved up front in this thread (results are shared by projects with the same packages),
+    # the projects are patched and saved by the job pool
+    if len(xamarin_projects) > 0 and convert_to_package_references:
+        for (projects, platform, title) in [(xamarin_projects, "common", "xamarin common"), (android_projects, "android", "android"), (ios_projects, "ios", "ios")]:
+            for project in projects:
+                with timings.phase("resolution"):
+                    (packages_to_add, references_to_remove) = package_storage.find_xamarin_packages(platform, project.get_reference_items())
+                project_jobs.append(functools.partial(convert_xamarin_project_to_packages, project, platform, title, packages_to_add, references_to_remove, version))
+                processed_projects.append(project.proj_file_path)
+    elif len(xamarin_projects) > 0:
+        head_projects = [(x, "android") for x in android_projects] + [(x, "ios") for x in ios_projects]
+        with timings.phase("resolution"):
+            common_resolved = [package_storage.resolve_references(x.get_package_references()) for x in xamarin_projects]
+            head_resolved = [package_storage.resolve_references(get_head_package_references(x, xamarin_projects)) for (x, _) in head_projects]
+        for (project, resolved) in zip(xamarin_projects, common_resolved):
+            project_jobs.append(functools.partial(convert_xamarin_common_project, project, resolved, repo_path))
+            processed_projects.append(project.proj_file_path)
+        for ((project, platform), resolved) in zip(head_projects, head_resolved):
+            project_jobs.append(functools.partial(convert_xamarin_head_project, project, platform, resolved, repo_path))
+            processed_projects.append(project.proj_file_path)
+
+    if len(maui_projects) > 0 and convert_to_package_references:
+        for project in maui_projects:
+            with timings.phase("resolution"):
+                (packages_to_add, references_to_remove) = package_storage.find_maui_packages(project.get_references())
+            project_jobs.append(functools.partial(convert_maui_project_to_packages, project, packages_to_add, references_to_remove, version))
+            processed_projects.append(project.proj_file_path)
+    elif len(maui_projects) > 0:
+        for project in maui_projects:
+            package_references = project.get_package_references()
+            with timings.phase("resolution"):
+                if use_dll:
+                    common_references = set()
+                    (android_references, ios_references, packages_to_remove) = package_storage.find_maui_references_to_process(package_references)
+                else:
+                    (common_references, android_references, ios_references, packages_to_remove) = package_storage.find_maui_partitions(package_references)
+            if not use_dll and project_refs:
+                android_references = package_storage.replace_project_refs_suffix(android_references)
+                ios_references = package_storage.replace_project_refs_suffix(ios_references)
+                common_references = package_storage.replace_project_refs_suffix(common_references)
+            references = (common_references, android_references, ios_references, packages_to_remove)
+            project_jobs.append(functools.partial(convert_maui_project, project, references, data_package_version, repo_path, use_dll))
+            processed_projects.append(project.proj_file_path)
+
+    run_project_jobs(project_jobs, jobs)
+    return processed_projects
+
+def convert_xamarin_common_project(project, resolved, repo_path):
+    print(f"Process xamarin common project {project.proj_file_path}")
+    project.add_references(resolved.common_references, repo_path)
+    project.remove_package_references(resolved.packages_to_remove)
+    project.save()
+
+def convert_xamarin_head_project(project, platform, resolved, repo_path):
+    print(f"Process {platform} project {project.proj_file_path}")
+    if platform == "android":
+        project.add_package_reference("Xamarin.Kotlin.StdLib", "1.5.31.2")
+        project.add_references(resolved.android_references, repo_path)
+    else:
+        project.add_references(resolved.ios_references, repo_path)
+    project.remove_package_references(resolved.packages_to_remove)
+    project.save()
+
+def get_head_package_references(head_project, xamarin_projects):
+    # packages of the common projects the head references, of every common project when it references none
+    project_paths = set(get_reference_path_key(x.project_path) for x in head_project.get_reference_items().values() if x.project_path is not None)
+    common_projects = [x for x in xamarin_projects if get_reference_path_key(os.path.abspath(x.proj_file_path)) in project_paths]
+    package_references = []
+    for project in common_projects if len(common_projects) > 0 else xamarin_projects:
+        package_references.extend(project.get_package_references())
+    return list(dict.fromkeys(package_references))
+
+def convert_xamarin_project_to_packages(project, platform, title, packages_to_add, references_to_remove, version):
+    print(f"Process {title} project {project.proj_file_path}")
+    project.remove_reference_elements(references_to_remove)
+    project.add_package_references(packages_to_add, version)
+    if platform == "android":
+        project.remove_package_references(["Xamarin.Kotlin.StdLib"])
+    project.clean_empty_groups()
+    project.save()
+
+def convert_maui_project_to_packages(project, packages_to_add, references_to_remove, version):
+    print(f"Process maui project {project.proj_file_path}")
+    project.remove_references(references_to_remove)
+    project.add_package_references(packages_to_add, version)
+    project.remove_package_references(["Xamarin.Kotlin.StdLib"])
+    project.clean_empty_groups()
+    project.save()
+
+def convert_maui_project(project, references, data_package_version, repo_path, use_dll):
+    print(f"Process maui project {project.proj_file_path}")
+    (common_references, android_references, ios_references, packages_to_remove) = references
+    if data_package_version != None:
+        project.add_package_reference("DevExpress.Data", data_package_version)
+    if not use_dll:
+        project.add_references(common_references, repo_path=repo_path, platform="", use_dll=False)
+    if project.has_maui_android_platform():
+        project.add_references(android_references, repo_path=repo_path, platform="android", use_dll=use_dll)
+        #project.add_package_reference("Xamarin.Kotlin.StdLib", "1.6.20.1", "android")
+    if project.has_maui_ios_platform():
+        project.add_references(ios_references, repo_path=repo_path, platform="ios", use_dll=use_dll)
+    project.remove_package_references(packages_to_remove)
+    project.save()
+
+def find_data_package_version(repo_path):
+    build_props_path = os.path.expanduser(f"{repo_path}/xamarin/Maui/Build.props")
+    if not os.path.exists(build_props_path):
+        return None
+    with timings.phase("data_version"):
+        data_versions = find_data_version(os.path.expanduser(f"{repo_path}/xamarin/Maui"))
+    build_props = ProjectInfo(build_props_path)
+    data_package_info = build_props.find_package_reference("DevExpress.Data")
+    if data_package_info == None:
+        return None
+    (_, data_package_version) = data_package_info
+    return data_versions[0] if data_versions != None else data_package_version
+
+def find_data_version(maui_path):
+    data_version = None
+    if not os.path.exists(maui_path):
+        return data_version
+    proj_files = walk_files(maui_path, ".csproj")
+    for proj_path in proj_files:
+        data_version = get_property_matches(proj_path, "DevExpress_Data")
+        if data_version != None:
+            break
+    return data_version
+
+class ThreadOutput:
+    # Stands in for stdout while project jobs run: each worker thread prints into its own buffer.
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def run(self, job):
+        self.local.buffer = io.StringIO()
+        try:
+            return (job(), self.local.buffer.getvalue(), None)
+        except Exception as e:
+            return (None, self.local.buffer.getvalue(), e)
+        finally:
+            self.local.buffer = None
+
+def run_project_jobs(project_jobs, jobs):
+    # lxml parses and serializes without holding the GIL; the output of every job is printed in job order
+    if jobs <= 1 or len(project_jobs) <= 1:
+        return [job() for job in project_jobs]
+    # a pool started by a job (classification inside a convert task) prints through the ThreadOutput in place
+    if isinstance(sys.stdout, ThreadOutput):
+        redirect = contextlib.nullcontext(sys.stdout)
+    else:
+        redirect = contextlib.redirect_stdout(ThreadOutput(sys.stdout))
+    with redirect as output:
+        with ThreadPoolExecutor(max_workers=min(jobs, len(project_jobs))) as executor:
+            results = list(executor.map(output.run, project_jobs))
+    error = None
+    for (result, text, job_error) in results:
+        print(text, end="")
+        if error is None:
+            error = job_error
+    if error is not None:
+        raise error
+    return [x[0] for x in results]
+
+def sortout_projects(proj_files, jobs=1):
+    timings.count("projects_classified", len(proj_files))
+    kinds = run_project_jobs([functools.partial(classify_project, x) for x in proj_files], jobs)
+    projects = dict((x, []) for x in ["xamarin", "android", "ios", "maui"])
+    for (proj_path, kind) in zip(proj_files, kinds):
+        if kind is not None:
+            projects[kind].append(proj_path)
+    loaded = run_project_jobs([functools.partial(ProjectInfo, x) for kind in projects for x in projects[kind]], jobs)
+    for kind in projects:
+        (projects[kind], loaded) = (loaded[:len(projects[kind])], loaded[len(projects[kind]):])
+    return (projects["xamarin"], projects["android"], projects["ios"], projects["maui"])
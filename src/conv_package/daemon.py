@@ -0,0 +1,204 @@
+import json
+import os
+import socket
+import struct
+from conv_package.cache import get_repo_cache_path
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+def get_socket_path(repo_path):
+    return get_repo_cache_path(os.path.expanduser(repo_path), "daemon", ".sock")
+
+class InotifyWatcher:
+    def __init__(self, watch_dirs):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = dict()
+        for watch_dir in watch_dirs:
+            if not os.path.isdir(watch_dir):
+                continue
+            watch = libc.inotify_add_watch(self.fd, os.fsencode(watch_dir), WATCH_MASK)
+            if watch < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {watch_dir}")
+            self.watches[watch] = watch_dir
+
+    def read_changes(self):
+        changes = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                (watch, mask, cookie, name_length) = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + name_length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + name_length
+                changes.add(os.path.join(self.watches.get(watch, ""), os.fsdecode(name)))
+        return changes
+
+class PollingWatcher:
+    def __init__(self, watch_dirs):
+        self.watch_dirs = watch_dirs
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = dict()
+        for watch_dir in self.watch_dirs:
+            if not os.path.isdir(watch_dir):
+                continue
+            for entry in os.scandir(watch_dir):
+                stat = entry.stat()
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def read_changes(self):
+        snapshot = self.take_snapshot()
+        changes = set(x for x in set(snapshot) | set(self.snapshot) if snapshot.get(x) != self.snapshot.get(x))
+        self.snapshot = snapshot
+        return changes
+
+def create_watcher(watch_dirs):
+    try:
+        return InotifyWatcher(watch_dirs)
+    except (OSError, AttributeError):
+        return PollingWatcher(watch_dirs)
+
+class ConvDaemon:
+    def __init__(self, args):
+        from conv_package.conversion import create_package_builder
+        from conv_package.package import PackageStorage
+        self.builder = create_package_builder(args)
+        self.watcher = create_watcher([self.builder.path_to_nuspec_files, self.builder.path_to_nuget_bundle_config])
+        self.package_storage = PackageStorage(self.builder.build_packages())
+
+    def refresh(self):
+        changes = self.watcher.read_changes()
+        # xamarin/maui is a tree the watcher doesn't cover, the builder's directory index lists it with a stat per folder
+        reference_projects = self.builder.find_reference_projects()
+        if len(changes) == 0 and reference_projects == self.builder.reference_projects:
+            return
+        # only the packages of the changed files are built again, the memo of the others stays warm
+        packages = self.builder.update_packages(self.package_storage.package_info_list, changes, reference_projects)
+        if len(packages) == 0:
+            return
+        affected = self.package_storage.update_packages(packages)
+        print(f"Reload packages {', '.join(sorted(packages))}, changed files: {len(changes)}, dropped closures: {len(affected)}")
+
+    def handle_request(self, request):
+        import contextlib
+        import io
+        import traceback
+        from conv_package.conv import build_parser
+        from conv_package.conversion import convert_in_dir
+        from conv_package.graph import DependencyCycleError
+        from conv_package.msbuild import document_cache, property_evaluator
+        from conv_package.timings import run_instrumented
+        self.refresh()
+        document_cache.clear()
+        property_evaluator.clear()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            try:
+                args = build_parser().parse_args(request["argv"])
+                args.repo_path = os.path.join(request["cwd"], os.path.expanduser(args.repo_path))
+                for name in ["timings_path", "profile_path"]:
+                    if getattr(args, name) is not None:
+                        setattr(args, name, os.path.join(request["cwd"], getattr(args, name)))
+                exit_code = run_instrumented(args, lambda: convert_in_dir(args, self.package_storage, request["cwd"]))
+            except DependencyCycleError as e:
+                print(f"Error: {e}")
+                exit_code = 1
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 2
+            except Exception:
+                print(traceback.format_exc(), end="")
+                exit_code = 1
+        return {"output": output.getvalue(), "exit_code": exit_code}
+
+def receive_message(connection):
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return json.loads(b"".join(chunks).decode("utf-8"))
+
+def send_message(connection, message):
+    connection.sendall(json.dumps(message).encode("utf-8"))
+    connection.shutdown(socket.SHUT_WR)
+
+def connect(socket_path):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except OSError:
+        connection.close()
+        return None
+    return connection
+
+def serve(args):
+    if not hasattr(socket, "AF_UNIX"):
+        print("Daemon mode needs unix sockets")
+        return 1
+    socket_path = get_socket_path(args.repo_path)
+    connection = connect(socket_path) if os.path.exists(socket_path) else None
+    if connection is not None:
+        connection.close()
+        print(f"Daemon is already running on {socket_path}")
+        return 1
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    daemon = ConvDaemon(args)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen()
+    print(f"Listening on {socket_path}")
+    try:
+        while True:
+            (connection, _) = server.accept()
+            with connection:
+                try:
+                    request = receive_message(connection)
+                    print(f"Convert {request['cwd']} {' '.join(request['argv'])}")
+                    send_message(connection, daemon.handle_request(request))
+                except (OSError, ValueError) as e:
+                    print(f"Request failed: {e}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove(socket_path)
+    return 0
+
+def run_in_daemon(args, argv):
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    socket_path = get_socket_path(args.repo_path)
+    if not os.path.exists(socket_path):
+        return None
+    connection = connect(socket_path)
+    if connection is None:
+        return None
+    with connection:
+        send_message(connection, {"cwd": os.getcwd(), "argv": argv + ["--no-daemon"]})
+        response = receive_message(connection)
+    print(response["output"], end="")
+    return response["exit_code"]
@@ -0,0 +1,197 @@
+import glob
+import hashlib
+import os
+import sqlite3
+import time
+from conv_package.timings import timings
+
+__all__ = ["INDEX_VERSION", "PackageDatabase", "get_index_path", "get_projects_fingerprint", "list_source_files"]
+
+INDEX_VERSION = 3
+PLATFORMS = ["common", "android", "ios"]
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE sources (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER);
+CREATE TABLE packages (id TEXT PRIMARY KEY COLLATE NOCASE, position INTEGER, is_maui INTEGER);
+CREATE TABLE dependencies (package_id TEXT COLLATE NOCASE, platform TEXT, dependency_id TEXT COLLATE NOCASE, position INTEGER);
+CREATE INDEX dependencies_package ON dependencies (package_id, platform);
+CREATE INDEX dependencies_dependency ON dependencies (dependency_id, platform);
+CREATE TABLE assembly_references (package_id TEXT COLLATE NOCASE, platform TEXT, reference TEXT COLLATE NOCASE, path TEXT, project_path TEXT, position INTEGER);
+CREATE INDEX assembly_references_package ON assembly_references (package_id);
+CREATE INDEX assembly_references_reference ON assembly_references (reference, platform);
+CREATE INDEX assembly_references_path ON assembly_references (path);
+CREATE TABLE bundle_paths (bundle_path TEXT, package_id TEXT COLLATE NOCASE, source_path TEXT, logical_path TEXT);
+CREATE INDEX bundle_paths_package ON bundle_paths (package_id);
+"""
+
+# UNION drops ids already reached, so cycles end the recursion
+CLOSURE_QUERY = """
+WITH RECURSIVE closure(id) AS (
+    SELECT dependency_id FROM dependencies WHERE package_id = ? AND platform = ?
+    UNION
+    SELECT dependencies.dependency_id FROM dependencies JOIN closure ON dependencies.package_id = closure.id WHERE dependencies.platform = ?
+)
+SELECT id FROM closure ORDER BY id
+"""
+
+DEPENDENTS_QUERY = """
+WITH RECURSIVE dependents(id) AS (
+    SELECT package_id FROM dependencies WHERE dependency_id = ? AND platform = ?
+    UNION
+    SELECT dependencies.package_id FROM dependencies JOIN dependents ON dependencies.dependency_id = dependents.id WHERE dependencies.platform = ?
+)
+SELECT id FROM dependents ORDER BY id
+"""
+
+def get_index_path(repo_path):
+    from conv_package.cache import get_repo_cache_path
+    return get_repo_cache_path(repo_path, "index", ".sqlite")
+
+def list_source_files(nuspec_path, bundle_path):
+    return sorted(glob.glob(f"{nuspec_path}/*.nuspec")) + sorted(glob.glob(f"{bundle_path}/*.json"))
+
+def get_projects_fingerprint(project_paths):
+    # the project_path columns only depend on the names and places of the projects under xamarin/maui
+    return hashlib.sha1("\n".join(sorted(project_paths)).encode("utf-8")).hexdigest()
+
+def get_platform_dependencies(package):
+    return [("common", package.dependencies), ("android", package.android_dependencies), ("ios", package.ios_dependencies)]
+
+class PackageDatabase:
+    # SQLite copy of the package index (packages, dependencies, per-platform references, bundle paths) for queries
+    # and for loading PackageStorage without parsing nuspec files. A rewrite replaces the whole file.
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def is_current(self, source_files, projects_fingerprint):
+        # same index version, the same nuspec and bundle files (by mtime and size) and the same reference projects
+        if not os.path.exists(self.path):
+            return False
+        try:
+            connection = self.connect()
+            meta = dict(connection.execute("SELECT key, value FROM meta"))
+            if meta.get("version") != str(INDEX_VERSION) or meta.get("projects") != projects_fingerprint:
+                return False
+            sources = dict((path, (mtime, size)) for (path, mtime, size) in connection.execute("SELECT path, mtime, size FROM sources"))
+        except sqlite3.Error:
+            self.close()
+            return False
+        if len(sources) != len(source_files):
+            return False
+        for source_file in source_files:
+            stat = os.stat(source_file)
+            if sources.get(source_file) != (stat.st_mtime_ns, stat.st_size):
+                return False
+        return True
+
+    def write(self, packages, source_files, projects_fingerprint, bundle_paths, repo_path):
+        self.close()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        connection = sqlite3.connect(temp_path)
+        try:
+            with connection:
+                connection.executescript(SCHEMA)
+                connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+                    ("version", str(INDEX_VERSION)),
+                    ("repo_path", os.path.abspath(repo_path)),
+                    ("projects", projects_fingerprint),
+                    ("created", time.strftime("%Y-%m-%dT%H:%M:%S")),
+                ])
+                sources = []
+                for source_file in source_files:
+                    stat = os.stat(source_file)
+                    sources.append((source_file, stat.st_mtime_ns, stat.st_size))
+                connection.executemany("INSERT INTO sources VALUES (?, ?, ?)", sources)
+                connection.executemany("INSERT INTO packages VALUES (?, ?, ?)", [(x.id, i, int(x.is_maui())) for (i, x) in enumerate(packages.values())])
+                dependencies = []
+                references = []
+                for package in packages.values():
+                    for (platform, platform_dependencies) in get_platform_dependencies(package):
+                        dependencies.extend((package.id, platform, x, i) for (i, x) in enumerate(platform_dependencies))
+                    for platform in PLATFORMS:
+                        project_references = package.get_platform_project_references(platform)
+                        for (i, (reference, path)) in enumerate(package.get_platform_references(platform).items()):
+                            references.append((package.id, platform, reference, path, project_references.get(reference), i))
+                connection.executemany("INSERT INTO dependencies VALUES (?, ?, ?, ?)", dependencies)
+                connection.executemany("INSERT INTO assembly_references VALUES (?, ?, ?, ?, ?, ?)", references)
+                connection.executemany("INSERT INTO bundle_paths VALUES (?, ?, ?, ?)", bundle_paths)
+        except BaseException:
+            connection.close()
+            os.remove(temp_path)
+            raise
+        connection.close()
+        os.replace(temp_path, self.path)
+
+    def load_packages(self, package_class):
+        connection = self.connect()
+        packages = dict()
+        for (package_id,) in connection.execute("SELECT id FROM packages ORDER BY position"):
+            packages[package_id] = package_class(package_id)
+        for (package_id, platform, dependency_id) in connection.execute("SELECT package_id, platform, dependency_id FROM dependencies ORDER BY rowid"):
+            package = packages[package_id]
+            if platform == "android":
+                package.add_android_dependency(dependency_id)
+            elif platform == "ios":
+                package.add_ios_dependency(dependency_id)
+            else:
+                package.add_dependency(dependency_id)
+        for (package_id, platform, reference, path, project_path) in connection.execute("SELECT package_id, platform, reference, path, project_path FROM assembly_references ORDER BY rowid"):
+            package = packages[package_id]
+            package.set_reference_slot(platform, reference, path)
+            if project_path is not None and platform == "common":
+                package.add_project_reference(reference, project_path)
+            elif project_path is not None and platform == "android":
+                package.add_android_project_reference(reference, project_path)
+            elif project_path is not None and platform == "ios":
+                package.add_ios_project_reference(reference, project_path)
+        for package in packages.values():
+            package.freeze()
+        timings.count("index_packages_loaded", len(packages))
+        return packages
+
+    def find_package(self, package_id):
+        row = self.connect().execute("SELECT id FROM packages WHERE id = ?", (package_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def get_closure(self, package_id, platform="common", direct=False):
+        if direct:
+            rows = self.connect().execute("SELECT DISTINCT dependency_id FROM dependencies WHERE package_id = ? AND platform = ? ORDER BY dependency_id", (package_id, platform))
+        else:
+            rows = self.connect().execute(CLOSURE_QUERY, (package_id, platform, platform))
+        return [x for (x,) in rows]
+
+    def get_dependents(self, package_id, platform="common", direct=False):
+        if direct:
+            rows = self.connect().execute("SELECT DISTINCT package_id FROM dependencies WHERE dependency_id = ? AND platform = ? ORDER BY package_id", (package_id, platform))
+        else:
+            rows = self.connect().execute(DEPENDENTS_QUERY, (package_id, platform, platform))
+        return [x for (x,) in rows]
+
+    def find_owners(self, reference, platform=None):
+        # reference is an assembly name, a dll file name or a full path
+        if reference.lower().endswith(".dll") and os.path.basename(reference) == reference:
+            reference = reference[:-len(".dll")]
+        query = "SELECT package_id, platform, reference, path, project_path FROM assembly_references WHERE (reference = ? OR path = ?)"
+        parameters = [reference, reference]
+        if platform is not None:
+            query += " AND platform = ?"
+            parameters.append(platform)
+        return self.connect().execute(query + " ORDER BY package_id, platform", parameters).fetchall()
+
+    def get_bundle_paths(self, package_id):
+        return self.connect().execute("SELECT bundle_path, source_path, logical_path FROM bundle_paths WHERE package_id = ? ORDER BY rowid", (package_id,)).fetchall()
@@ -0,0 +1,177 @@
+import fnmatch
+import os
+import pickle
+import re
+import time
+from conv_package.cache import CACHE_VERSION, write_file_atomic
+from conv_package.timings import timings
+
+DEFAULT_PRUNE_DIRS = ["bin", "obj", ".git", ".vs", ".idea", "node_modules", "packages"]
+IGNORE_FILE_NAME = ".convignore"
+RECENT_MTIME_NS = 2 * 1000 * 1000 * 1000
+
+solution_project_regex = re.compile(r'^Project\("\{[^}]*\}"\)\s*=\s*"[^"]*"\s*,\s*"([^"]*)"', re.MULTILINE)
+
+def find_solution_files(solution_dir):
+    solution_files = [x.path for x in os.scandir(solution_dir) if x.name.lower().endswith(".sln") and x.is_file()]
+    return sorted(solution_files)
+
+def read_solution_projects(solution_file, extension=".csproj"):
+    with open(solution_file, encoding="utf-8-sig", errors="replace") as f:
+        content = f.read()
+    solution_dir = os.path.dirname(solution_file)
+    projects = []
+    for match in solution_project_regex.finditer(content):
+        project_path = match.group(1).replace("\\", "/")
+        if not project_path.lower().endswith(extension):
+            continue
+        project_path = os.path.normpath(os.path.join(solution_dir, project_path))
+        if os.path.isfile(project_path):
+            projects.append(project_path)
+    return projects
+
+def read_ignore_patterns(root_dir, ignore_file_name=IGNORE_FILE_NAME):
+    ignore_file = os.path.join(root_dir, ignore_file_name)
+    if not os.path.isfile(ignore_file):
+        return []
+    patterns = []
+    with open(ignore_file) as f:
+        for line in f:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            patterns.append(line.rstrip("/"))
+    return patterns
+
+def is_ignored(relative_path, name, ignore_patterns):
+    for pattern in ignore_patterns:
+        if pattern.startswith("/"):
+            if fnmatch.fnmatch(relative_path, pattern[1:]):
+                return True
+        elif fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern):
+            return True
+    return False
+
+def list_directory(current_dir, root_dir, extension, prune_dirs, ignore_patterns):
+    try:
+        entries = sorted(os.scandir(current_dir), key=lambda x: x.name)
+    except OSError:
+        return None
+    files = []
+    sub_dirs = []
+    for entry in entries:
+        if len(ignore_patterns) > 0 and is_ignored(os.path.relpath(entry.path, root_dir).replace(os.sep, "/"), entry.name, ignore_patterns):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name.lower() not in prune_dirs:
+                sub_dirs.append(entry.name)
+        elif entry.name.lower().endswith(extension) and entry.is_file():
+            files.append(entry.name)
+    return (files, sub_dirs)
+
+def walk_files(root_dir, extension, prune_dirs=DEFAULT_PRUNE_DIRS, ignore_file_name=IGNORE_FILE_NAME):
+    prune_dirs = set(x.lower() for x in prune_dirs)
+    ignore_patterns = read_ignore_patterns(root_dir, ignore_file_name)
+    result = []
+    dirs_to_scan = [root_dir]
+    while len(dirs_to_scan) > 0:
+        current_dir = dirs_to_scan.pop()
+        listing = list_directory(current_dir, root_dir, extension, prune_dirs, ignore_patterns)
+        if listing is None:
+            continue
+        (files, sub_dirs) = listing
+        result.extend(os.path.join(current_dir, x) for x in files)
+        dirs_to_scan.extend(reversed([os.path.join(current_dir, x) for x in sub_dirs]))
+    return result
+
+class DirectoryIndex:
+    # Persisted listings of every directory walked under a root; a directory is listed again only when its
+    # mtime changed, unchanged subtrees cost one stat per directory.
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.roots = dict()
+        self.is_dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "rb") as f:
+                (version, roots) = pickle.load(f)
+        except Exception:
+            print(f"Ignore broken cache file {self.cache_path}")
+            return
+        if version == CACHE_VERSION:
+            self.roots = roots
+
+    def save(self):
+        if not self.is_dirty:
+            return
+        try:
+            write_file_atomic(self.cache_path, pickle.dumps((CACHE_VERSION, self.roots), protocol=pickle.HIGHEST_PROTOCOL))
+            self.is_dirty = False
+        except OSError as e:
+            print(f"Can't write cache file {self.cache_path}: {e}")
+
+    def walk_files(self, root_dir, extension, prune_dirs=DEFAULT_PRUNE_DIRS, ignore_file_name=IGNORE_FILE_NAME):
+        prune_dirs = set(x.lower() for x in prune_dirs)
+        ignore_patterns = read_ignore_patterns(root_dir, ignore_file_name)
+        key = (os.path.abspath(root_dir), extension)
+        settings = (sorted(prune_dirs), ignore_patterns)
+        (old_settings, old_listings) = self.roots.get(key, (None, dict()))
+        if old_settings != settings:
+            old_listings = dict()
+        listings = dict()
+        scan_time = time.time_ns()
+        result = []
+        dirs_to_scan = [root_dir]
+        while len(dirs_to_scan) > 0:
+            current_dir = dirs_to_scan.pop()
+            listing = self.get_listing(current_dir, old_listings.get(current_dir), root_dir, extension, prune_dirs, ignore_patterns, scan_time)
+            if listing is None:
+                continue
+            listings[current_dir] = listing
+            (mtime, files, sub_dirs) = listing
+            result.extend(os.path.join(current_dir, x) for x in files)
+            dirs_to_scan.extend(reversed([os.path.join(current_dir, x) for x in sub_dirs]))
+        if listings != old_listings or old_settings != settings:
+            self.roots[key] = (settings, listings)
+            self.is_dirty = True
+        return result
+
+    def get_listing(self, current_dir, old_listing, root_dir, extension, prune_dirs, ignore_patterns, scan_time):
+        try:
+            mtime = os.stat(current_dir).st_mtime_ns
+        except OSError:
+            return None
+        if old_listing is not None and old_listing[0] == mtime:
+            timings.count("directories_reused")
+            return old_listing
+        timings.count("directories_listed")
+        listing = list_directory(current_dir, root_dir, extension, prune_dirs, ignore_patterns)
+        if listing is None:
+            return None
+        # a directory changed within the mtime resolution of this scan may change again unnoticed, list it next time too
+        if mtime >= scan_time - RECENT_MTIME_NS:
+            mtime = None
+        return (mtime, listing[0], listing[1])
+
+def find_reference_projects(repo_path, project_index=None):
+    # projects under xamarin/maui, the package references of the same name become project references
+    projects_dir = os.path.join(repo_path, "xamarin/maui")
+    if project_index is None:
+        return walk_files(projects_dir, ".csproj")
+    return project_index.walk_files(projects_dir, ".csproj")
+
+def find_project_files(solution_dir, prune_dirs=DEFAULT_PRUNE_DIRS):
+    projects = []
+    seen_projects = set()
+    for solution_file in find_solution_files(solution_dir):
+        for project in read_solution_projects(solution_file):
+            if project not in seen_projects:
+                seen_projects.add(project)
+                projects.append(project)
+    if len(projects) > 0:
+        return projects
+    return walk_files(solution_dir, ".csproj", prune_dirs)
@@ -0,0 +1,104 @@
+from collections import deque
+
+class DependencyCycleError(Exception):
+    def __init__(self, cycle):
+        self.cycle = cycle
+        super().__init__("Dependency cycle detected: " + " -> ".join(cycle))
+
+class DependencyGraph:
+    def __init__(self, dependencies):
+        self.dependencies = dependencies
+        # package id -> ids of the packages that list it, in insertion order
+        self.dependents = dict()
+        self.closures = dict()
+        self.topological_order = []
+        self.cyclic_packages = set()
+        for (package_id, package_dependencies) in dependencies.items():
+            self.add_edges(package_id, package_dependencies)
+        self.build(list(dependencies))
+
+    def add_edges(self, package_id, dependencies):
+        for dependency in dependencies:
+            self.dependents.setdefault(dependency, dict())[package_id] = None
+
+    def build(self, package_ids):
+        # closures of package_ids, the closures of the other packages are finished already (or they are cyclic)
+        package_set = set(package_ids)
+        pending = dict()
+        ready = deque()
+        for package_id in package_ids:
+            # a dependency that never finishes (a cyclic package outside package_ids) keeps this one pending too
+            waiting_dependencies = set(x for x in self.dependencies[package_id] if x in package_set or x in self.cyclic_packages)
+            pending[package_id] = len(waiting_dependencies)
+            if len(waiting_dependencies) == 0:
+                ready.append(package_id)
+        # dependencies are finished before their dependents, so each closure is built from finished closures
+        while len(ready) > 0:
+            package_id = ready.popleft()
+            self.topological_order.append(package_id)
+            closure = set()
+            for dependency in self.dependencies[package_id]:
+                closure.add(dependency)
+                closure.update(self.closures.get(dependency, ()))
+            self.closures[package_id] = frozenset(closure)
+            for dependent in self.dependents.get(package_id, ()):
+                if dependent in pending:
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0:
+                        ready.append(dependent)
+        self.cyclic_packages.update(x for x in package_ids if x not in self.closures)
+
+    def update(self, dependencies):
+        # dependencies maps package ids to their new dependencies, None removes the package. The closures of these
+        # packages and of everything that depends on them are built again, the ids of these packages are returned.
+        for (package_id, package_dependencies) in dependencies.items():
+            for dependency in self.dependencies.get(package_id, ()):
+                self.dependents.get(dependency, dict()).pop(package_id, None)
+            if package_dependencies is None:
+                self.dependencies.pop(package_id, None)
+            else:
+                self.dependencies[package_id] = package_dependencies
+                self.add_edges(package_id, package_dependencies)
+        affected = set()
+        package_ids = list(dependencies)
+        while len(package_ids) > 0:
+            package_id = package_ids.pop()
+            if package_id in affected:
+                continue
+            affected.add(package_id)
+            package_ids.extend(self.dependents.get(package_id, ()))
+        for package_id in affected:
+            self.closures.pop(package_id, None)
+            self.cyclic_packages.discard(package_id)
+        self.topological_order = [x for x in self.topological_order if x not in affected]
+        self.build([x for x in self.dependencies if x in affected])
+        return affected
+
+    def get_closure(self, package_id):
+        closure = self.closures.get(package_id)
+        if closure is not None:
+            return closure
+        if package_id in self.cyclic_packages:
+            raise DependencyCycleError(self.find_cycle(package_id))
+        return frozenset()
+
+    def find_cycle(self, package_id):
+        path = []
+        path_index = dict()
+        while package_id not in path_index:
+            path_index[package_id] = len(path)
+            path.append(package_id)
+            package_id = next(x for x in self.dependencies[package_id] if x in self.cyclic_packages)
+        return path[path_index[package_id]:] + [package_id]
+
+    def get_cycles(self):
+        cycles = []
+        visited = set()
+        for package_id in self.dependencies:
+            if package_id not in self.cyclic_packages or package_id in visited:
+                continue
+            cycle = self.find_cycle(package_id)
+            if not any(x in visited for x in cycle):
+                cycles.append(cycle)
+            visited.update(cycle)
+        return cycles
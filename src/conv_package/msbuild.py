@@ -0,0 +1,154 @@
+import lxml
+import lxml.etree
+import os
+import re
+from lxml.etree import XMLParser
+from conv_package.timings import timings
+
+class DocumentEntry:
+    def __init__(self, mtime, size, content):
+        self.mtime = mtime
+        self.size = size
+        self.content = content
+        self.text = None
+        self.document = None
+
+class DocumentCache:
+    # Shared by every reader in the process; parsed documents are read-only, callers that edit must parse their own copy.
+    def __init__(self):
+        self.entries = dict()
+
+    def get_entry(self, path):
+        real_path = os.path.realpath(path)
+        stat = os.stat(real_path)
+        entry = self.entries.get(real_path)
+        if entry is None or entry.mtime != stat.st_mtime_ns or entry.size != stat.st_size:
+            with open(real_path, "rb") as f:
+                entry = DocumentEntry(stat.st_mtime_ns, stat.st_size, f.read())
+            timings.count("files_read")
+            self.entries[real_path] = entry
+        return entry
+
+    def read_bytes(self, path):
+        return self.get_entry(path).content
+
+    def read_text(self, path):
+        entry = self.get_entry(path)
+        if entry.text is None:
+            entry.text = entry.content.decode("utf-8-sig", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+        return entry.text
+
+    def parse(self, path):
+        entry = self.get_entry(path)
+        if entry.document is None:
+            entry.document = parse_document(entry.content)
+            timings.count("documents_parsed")
+        return entry.document
+
+    def clear(self):
+        self.entries.clear()
+
+document_cache = DocumentCache()
+
+def parse_document(content):
+    return lxml.etree.fromstring(content, XMLParser(remove_blank_text=True)).getroottree()
+
+comment_regex = re.compile(r'<!--.*?-->', flags=re.DOTALL)
+property_regex = re.compile(r'<([A-Za-z_][\w.-]*)(?:\s[^>]*)?>([^\n]*?)</\1>\s*\n')
+import_regex = re.compile(r'<Import\s+Project\s*=\s*"(.+?)"')
+
+def get_file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+class PropertyEvaluator:
+    # Mirrors the old regex lookup: own properties win, then imports in order (a missing import ends the chain),
+    # then the nearest Directory.Build.props. Each file is evaluated once for all properties; an evaluation is
+    # reused while every file it read or looked for keeps its mtime and size (None for a missing file).
+    def __init__(self, documents):
+        self.documents = documents
+        self.properties = dict()
+
+    def clear(self):
+        self.properties.clear()
+
+    def get_property(self, project_path, property_name, is_end_point=False):
+        properties = self.evaluate(project_path, is_end_point)
+        if properties is None:
+            return None
+        return properties.get(property_name)
+
+    def evaluate(self, project_path, is_end_point=False):
+        entry = self.get_entry(project_path, is_end_point, frozenset())
+        return entry[1] if entry is not None else None
+
+    def get_entry(self, project_path, is_end_point, in_progress):
+        # in_progress holds the files of the import chain being evaluated by this call, so threads don't share it
+        key = (project_path, is_end_point)
+        entry = self.properties.get(key)
+        if entry is not None and all(get_file_stamp(path) == stamp for (path, stamp) in entry[0].items()):
+            return entry
+        stamp = get_file_stamp(project_path)
+        if stamp is None or key in in_progress:
+            return None
+        stamps = {project_path: stamp}
+        properties = self.evaluate_file(project_path, is_end_point, stamps, in_progress | {key})
+        entry = (stamps, properties)
+        self.properties[key] = entry
+        return entry
+
+    def evaluate_file(self, project_path, is_end_point, stamps, in_progress):
+        content = comment_regex.sub('', self.documents.read_text(project_path))
+        properties = dict()
+        for match in property_regex.finditer(content):
+            properties.setdefault(match.group(1), []).append(match.group(2))
+
+        base_path = os.path.dirname(project_path)
+        for import_match in import_regex.finditer(content):
+            imported_project_name = import_match.group(1).replace('$(MSBuildThisFileDirectory)', '')
+            imported_project_path = os.path.join(base_path, imported_project_name).replace('\\', '/')
+            stamps[imported_project_path] = get_file_stamp(imported_project_path)
+            if stamps[imported_project_path] is None:
+                imported_project_path = import_match.group(1).replace('\\', '/')
+                stamps[imported_project_path] = get_file_stamp(imported_project_path)
+            if stamps[imported_project_path] is None:
+                return properties
+            self.merge(properties, stamps, self.get_entry(imported_project_path, is_end_point, in_progress))
+
+        # Already at the end of the import chain
+        if is_end_point:
+            return properties
+
+        props_file = self.find_directory_props(base_path, stamps)
+        if props_file is not None:
+            self.merge(properties, stamps, self.get_entry(props_file, True, in_progress))
+        return properties
+
+    def merge(self, properties, stamps, imported_entry):
+        if imported_entry is None:
+            return
+        (imported_stamps, imported_properties) = imported_entry
+        stamps.update(imported_stamps)
+        for (property_name, values) in imported_properties.items():
+            if property_name not in properties:
+                properties[property_name] = values
+
+    def find_directory_props(self, workspace_path, stamps):
+        # the Directory.Build.props files looked for are recorded too, adding one nearer the project changes the result
+        while True:
+            props_path = os.path.join(workspace_path, 'Directory.Build.props')
+            stamps[props_path] = get_file_stamp(props_path)
+            if stamps[props_path] is not None and os.path.isfile(props_path):
+                return props_path
+            parent_directory = os.path.dirname(workspace_path)
+            if parent_directory == workspace_path:
+                return None
+            workspace_path = parent_directory
+
+property_evaluator = PropertyEvaluator(document_cache)
+
+def get_property_matches(project_path, property_name, is_end_point=False):
+    return property_evaluator.get_property(project_path, property_name, is_end_point)
@@ -4,41 +4,104 @@ import lxml.etree
 import glob
 import json
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from conv_package.graph import DependencyGraph
+from conv_package.database import PackageDatabase, get_projects_fingerprint, list_source_files
+from conv_package.discovery import find_reference_projects
+from conv_package.timings import timings
 
 from lxml.etree import XMLParser
+
+__all__ = ["MauiPackageInfo", "PackageInfoBuilder", "PackageStorage", "ReferenceInfo", "ResolvedReferences"]
+
+MIN_NUSPEC_FILES_PER_JOB = 8
+
+def read_nuspec_file_job(nuspec_file):
+    return PackageInfoBuilder("", "", "").read_nuspec_file(nuspec_file)
+
+def intern_string(value):
+    # xpath results are str subclasses that keep their element (and the whole nuspec tree) alive
+    return sys.intern(str(value))
+
+def intern_list(values):
+    return [intern_string(x) for x in values]
+
+def intern_dict(values):
+    return dict((intern_string(key), intern_string(value)) for (key, value) in values.items())
+
+def get_reference_path_key(path):
+    # project references written with -p point to the .Refs variant of the head project
+    path = os.path.normcase(os.path.normpath(path.replace("\\", "/")))
+    if path.endswith(".Refs.csproj"):
+        path = path[:-len(".Refs.csproj")] + ".csproj"
+    return path
+
 class MauiPackageInfo:
+    # Package ids, assembly names and paths are interned; reference_slots is only built while bundles are applied
+    # and dropped by freeze(). The ReferenceInfo records are created on first use and shared by every resolution.
+    __slots__ = ("id", "dependencies", "android_dependencies", "ios_dependencies", "references", "android_references", "ios_references",
+                 "project_references", "android_project_references", "ios_project_references", "reference_slots", "reference_infos")
+    platforms = ("common", "android", "ios")
+
     def __init__(self, id):
-        self.id = id
+        self.id = intern_string(id)
         self.dependencies = []
         self.android_dependencies = []
+        self.project_references = dict()
         self.android_project_references = dict()
         self.ios_dependencies = []
         self.ios_references = dict()
         self.ios_project_references = dict()
         self.android_references = dict()
         self.references = dict()
-        
+        # (platform, path) -> references with that path, kept in sync with the three reference dicts
+        self.reference_slots = None
+        # ReferenceInfo tuples in the order of platforms, reset by every change of the references
+        self.reference_infos = None
+
+    def __getstate__(self):
+        return (self.id, self.dependencies, self.android_dependencies, self.ios_dependencies, self.references, self.android_references,
+                self.ios_references, self.project_references, self.android_project_references, self.ios_project_references)
+
+    def __setstate__(self, state):
+        (id, dependencies, android_dependencies, ios_dependencies, references, android_references, ios_references,
+         project_references, android_project_references, ios_project_references) = state
+        self.id = intern_string(id)
+        self.dependencies = intern_list(dependencies)
+        self.android_dependencies = intern_list(android_dependencies)
+        self.ios_dependencies = intern_list(ios_dependencies)
+        self.references = intern_dict(references)
+        self.android_references = intern_dict(android_references)
+        self.ios_references = intern_dict(ios_references)
+        self.project_references = intern_dict(project_references)
+        self.android_project_references = intern_dict(android_project_references)
+        self.ios_project_references = intern_dict(ios_project_references)
+        self.reference_slots = None
+        self.reference_infos = None
 
     def is_maui(self):
         return ".maui." in self.id.lower()
 
+    def add_project_reference(self, common_reference, local_package_path):
+        self.project_references[intern_string(common_reference)] = intern_string(local_package_path)
+        self.reference_infos = None
+
     def add_android_project_reference(self, android_reference, local_package_path):
-        self.android_project_references[android_reference] = local_package_path
+        self.android_project_references[intern_string(android_reference)] = intern_string(local_package_path)
+        self.reference_infos = None
 
     def add_ios_project_reference(self, ios_reference, local_package_path):
-        self.ios_project_references[ios_reference] = local_package_path
+        self.ios_project_references[intern_string(ios_reference)] = intern_string(local_package_path)
+        self.reference_infos = None
 
 
     def make_all_reference_paths_absolute(self, root_path):
-        for reference in self.references:
-            if not os.path.isabs(self.references[reference]):
-                self.references[reference] = self.get_absolute_path(root_path, self.references[reference])
-        for reference in self.ios_references:
-            if not os.path.isabs(self.ios_references[reference]):
-                self.ios_references[reference] = self.get_absolute_path(root_path, self.ios_references[reference])
-        for reference in self.android_references:
-            if not os.path.isabs(self.android_references[reference]):
-                self.android_references[reference] = self.get_absolute_path(root_path, self.android_references[reference])
+        for platform in ["common", "ios", "android"]:
+            references = self.get_platform_references(platform)
+            for reference in references:
+                if not os.path.isabs(references[reference]):
+                    self.set_reference_slot(platform, reference, self.get_absolute_path(root_path, references[reference]))
     
     def get_absolute_path(self, root_path, path):
         if os.path.isabs(path):
@@ -47,71 +110,115 @@ class MauiPackageInfo:
         return os.path.abspath(joined_path)
 
     def add_dependency(self, dependency):
-        self.dependencies.append(dependency)
+        self.dependencies.append(intern_string(dependency))
 
     def add_android_dependency(self, android_dependency):
-        self.android_dependencies.append(android_dependency)
+        self.android_dependencies.append(intern_string(android_dependency))
     
     def add_ios_dependency(self, ios_dependency):
-        self.ios_dependencies.append(ios_dependency)
+        self.ios_dependencies.append(intern_string(ios_dependency))
 
     def add_reference(self, common_reference, local_package_path):
-        self.references[common_reference] = local_package_path
+        self.set_reference_slot("common", common_reference, local_package_path)
 
     def add_ios_reference(self, ios_reference, local_package_path):
-        self.ios_references[ios_reference] = local_package_path
+        self.set_reference_slot("ios", ios_reference, local_package_path)
     
     def add_android_reference(self, android_reference, local_package_path):
-        self.android_references[android_reference] = local_package_path
+        self.set_reference_slot("android", android_reference, local_package_path)
+
+    def get_platform_references(self, platform):
+        if platform == "android":
+            return self.android_references
+        if platform == "ios":
+            return self.ios_references
+        return self.references
+
+    def get_reference_slots(self):
+        if self.reference_slots is None:
+            self.reference_slots = dict()
+            for platform in self.platforms:
+                for (reference, path) in self.get_platform_references(platform).items():
+                    self.reference_slots.setdefault((platform, path), []).append(reference)
+        return self.reference_slots
+
+    def set_reference_slot(self, platform, reference, path):
+        reference = intern_string(reference)
+        path = intern_string(path)
+        references = self.get_platform_references(platform)
+        reference_slots = self.reference_slots
+        if reference_slots is not None and reference in references:
+            key = (platform, references[reference])
+            slot = reference_slots[key]
+            slot.remove(reference)
+            if len(slot) == 0:
+                del reference_slots[key]
+        references[reference] = path
+        if reference_slots is not None:
+            reference_slots.setdefault((platform, path), []).append(reference)
+        self.reference_infos = None
 
     def set_reference_path(self, logical_reference_path, reference_path):
         result = False
-        for reference in self.android_references:
-            if self.android_references[reference] == logical_reference_path:
-                self.android_references[reference] = reference_path
-                result = True
-                break
-        for reference in self.ios_references:
-            if self.ios_references[reference] == logical_reference_path:
-                self.ios_references[reference] = reference_path
-                result = True
-                break
-        for reference in self.references:
-            if self.references[reference] == logical_reference_path:
-                self.references[reference] = reference_path
-                result = True
-                break
+        reference_slots = self.get_reference_slots()
+        for platform in ["android", "ios", "common"]:
+            slot = reference_slots.get((platform, logical_reference_path))
+            if slot is None:
+                continue
+            # only the first reference in dict order is rewritten, the same one a scan of the dict would find
+            reference = slot[0] if len(slot) == 1 else min(slot, key=list(self.get_platform_references(platform)).index)
+            self.set_reference_slot(platform, reference, reference_path)
+            result = True
         return result
 
+    def freeze(self):
+        self.dependencies = tuple(self.dependencies)
+        self.android_dependencies = tuple(self.android_dependencies)
+        self.ios_dependencies = tuple(self.ios_dependencies)
+        self.reference_slots = None
+
     def get_dependencies(self):
-        result = []
-        for dependency in self.dependencies:
-            result.append(dependency)
-        return result
+        return list(self.dependencies)
+
+    def get_platform_project_references(self, platform):
+        if platform == "android":
+            return self.android_project_references
+        if platform == "ios":
+            return self.ios_project_references
+        return self.project_references
+
+    def get_platform_reference_infos(self, platform):
+        # project_path is None when no project under xamarin/maui has the name of the assembly
+        if self.reference_infos is None:
+            self.reference_infos = tuple(
+                tuple(ReferenceInfo(reference, path, self.get_platform_project_references(x).get(reference)) for (reference, path) in self.get_platform_references(x).items())
+                for x in self.platforms)
+        return self.reference_infos[self.platforms.index(platform)]
 
     def get_reference_infos(self):
-        result = []        
-        for reference in self.references:
-            result.append(ReferenceInfo(reference, self.references[reference]))
-        return result
+        return self.get_platform_reference_infos("common")
 
     def get_ios_reference_infos(self):
-        result = []
-        for reference in self.ios_references:
-            result.append(ReferenceInfo(reference, self.ios_references[reference], self.ios_project_references[reference]))
-        return result
+        return self.get_platform_reference_infos("ios")
     
     def get_android_reference_infos(self):
-        result = []
-        for reference in self.android_references:
-            result.append(ReferenceInfo(reference, self.android_references[reference], self.android_project_references[reference]))
-        return result
+        return self.get_platform_reference_infos("android")
 
 class ReferenceInfo:
+    # Immutable, equality and hash only look at the assembly name and the path.
+    __slots__ = ("reference", "path", "project_path", "hash_value")
+
     def __init__(self, reference, path, project_path):
-        self.reference = reference
-        self.path = path
-        self.project_path = project_path
+        object.__setattr__(self, "reference", reference)
+        object.__setattr__(self, "path", path)
+        object.__setattr__(self, "project_path", project_path)
+        object.__setattr__(self, "hash_value", hash(reference) ^ hash(path))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ReferenceInfo is immutable, can't set {name}")
+
+    def __reduce__(self):
+        return (ReferenceInfo, (self.reference, self.path, self.project_path))
     
     def __str__(self):
         return self.reference + " " + self.path
@@ -120,57 +227,262 @@ class ReferenceInfo:
         return self.reference == other.reference and self.path == other.path
     
     def __hash__(self):
-        return hash(self.reference) ^ hash(self.path)
+        return self.hash_value
+
+class ResolvedReferences:
+    def __init__(self):
+        self.common_references = set()
+        self.android_references = set()
+        self.ios_references = set()
+        self.packages_to_remove = []
+        # (common, android only, ios only) split of the android and ios references, see find_maui_partitions
+        self.maui_partitions = None
+        # the listed packages and the packages of their closures, an update of any of them drops this resolution
+        self.package_ids = frozenset()
+
+    def with_packages_to_remove(self, packages_to_remove):
+        # shares the references with this resolution, for a project that lists the same packages in another order
+        result = ResolvedReferences()
+        result.common_references = self.common_references
+        result.android_references = self.android_references
+        result.ios_references = self.ios_references
+        result.packages_to_remove = packages_to_remove
+        result.maui_partitions = self.maui_partitions
+        result.package_ids = self.package_ids
+        return result
 
 class PackageInfoBuilder:
-    def __init__(self, repo_path, path_to_nuspec_files, path_to_nuget_bundle_config):
+    def __init__(self, repo_path, path_to_nuspec_files, path_to_nuget_bundle_config, cache=None, jobs=1, project_index=None):
         self.path_to_nuspec_files = os.path.join(repo_path, path_to_nuspec_files)
         self.path_to_nuget_bundle_config = os.path.join(repo_path, path_to_nuget_bundle_config)
         self.repo_path = repo_path
+        self.cache = cache
+        self.jobs = jobs
+        self.project_index = project_index
+        # project files under xamarin/maui found by the last build, their names give the project references
+        self.reference_projects = []
+        # multiprocessing context of the nuspec workers, set when other threads run while the index is built
+        self.mp_context = None
+        # (bundle file, package id, source path, logical path) of the components applied by the last build
+        self.bundle_paths = []
+        # nuspec file -> package id and bundle file -> package id of the last build, see update_packages
+        self.nuspec_ids = dict()
+        self.bundle_ids = dict()
     
     def build_packages(self):
         packages = dict()
         print(f"Process nuspec files in {self.path_to_nuspec_files}")
-        nuspec_files = glob.glob(f"{self.path_to_nuspec_files}/*.nuspec", recursive=True)
-        for nuspec_file in nuspec_files:
-            package = self.read_nuspec_file(nuspec_file)
-            if package is not None:
-                packages[package.id] = package
+        with timings.phase("nuspec_parse"):
+            nuspec_files = glob.glob(f"{self.path_to_nuspec_files}/*.nuspec", recursive=True)
+            self.nuspec_ids = dict()
+            for (nuspec_file, package) in zip(nuspec_files, self.read_nuspec_files(nuspec_files)):
+                if package is not None:
+                    packages[package.id] = package
+                    self.nuspec_ids[nuspec_file] = package.id
         print(f"Process nuget bundle config file {self.path_to_nuget_bundle_config}")
-        nuget_files = glob.glob(f"{self.path_to_nuget_bundle_config}/*.json", recursive=True)
-        project_reference_dict = self.get_reference_project_dict(os.path.join(self.repo_path, "xamarin/maui"))
-        for nuget_file in nuget_files:
-            with open(nuget_file) as f:
-                data = json.load(f)
-                bundle = data["bundle"]
-                id = bundle["id"]
+        with timings.phase("repo_project_index"):
+            self.reference_projects = self.find_reference_projects()
+            project_reference_dict = self.get_reference_project_dict(self.reference_projects)
+        with timings.phase("bundle_apply"):
+            nuget_files = glob.glob(f"{self.path_to_nuget_bundle_config}/*.json", recursive=True)
+            timings.count("bundle_files", len(nuget_files))
+            self.bundle_paths = []
+            self.bundle_ids = dict()
+            for nuget_file in nuget_files:
+                (id, components) = self.read_cached(nuget_file, self.read_bundle_file)
+                self.bundle_ids[nuget_file] = id
                 if id == "":
                     continue
                 package = packages.get(id)                
                 if package is None:
                     continue
-                for component in bundle["components"]:
-                    reference_path = os.path.join(self.repo_path, component["source"])
-                    logical_path = self.trim_path(component["target"])
-                    package.set_reference_path(logical_path, reference_path)
-        #process all reference - if they not absolute path - make them absolute
-        for package in packages.values():
-            package.make_all_reference_paths_absolute(self.path_to_nuspec_files)
-            for android_reference in package.android_references:
-                if android_reference in project_reference_dict:
-                    package.add_android_project_reference(android_reference, project_reference_dict[android_reference])
-            for ios_reference in package.ios_references:
-                if ios_reference in project_reference_dict:
-                    package.add_ios_project_reference(ios_reference, project_reference_dict[ios_reference])
-            
+                self.bundle_paths.extend(self.apply_bundle(package, nuget_file, components))
+            for package in packages.values():
+                self.finish_package(package, project_reference_dict)
+        self.save_caches(nuspec_files + nuget_files)
         return packages
-    def get_reference_project_dict(self, projects_dir):
+
+    def update_packages(self, packages, changed_files, reference_projects):
+        # Builds again only the packages of changed nuspec and bundle files (by their old and new ids) and the ones
+        # whose projects under xamarin/maui changed. Returns the new package of every such id, None for removed ones.
+        with timings.phase("nuspec_parse"):
+            nuspec_files = glob.glob(f"{self.path_to_nuspec_files}/*.nuspec", recursive=True)
+            nuspec_ids = dict((x, self.nuspec_ids.get(x)) for x in nuspec_files if x not in changed_files)
+            changed_ids = set(id for (nuspec_file, id) in self.nuspec_ids.items() if nuspec_ids.get(nuspec_file) is None)
+            files_to_parse = [x for x in nuspec_files if nuspec_ids.get(x) is None]
+            parsed_packages = dict()
+            for (nuspec_file, package) in zip(files_to_parse, self.read_nuspec_files(files_to_parse)):
+                if package is not None:
+                    parsed_packages[nuspec_file] = package
+                    changed_ids.add(package.id)
+            # in the order of nuspec_files, a later file with the same id wins like in build_packages
+            nuspec_ids = dict((x, parsed_packages[x].id if x in parsed_packages else nuspec_ids.get(x)) for x in nuspec_files)
+            nuspec_ids = dict((x, id) for (x, id) in nuspec_ids.items() if id is not None)
+        with timings.phase("bundle_apply"):
+            nuget_files = glob.glob(f"{self.path_to_nuget_bundle_config}/*.json", recursive=True)
+            bundle_ids = dict()
+            for nuget_file in nuget_files:
+                if nuget_file in self.bundle_ids and nuget_file not in changed_files:
+                    bundle_ids[nuget_file] = self.bundle_ids[nuget_file]
+                    continue
+                (id, components) = self.read_cached(nuget_file, self.read_bundle_file)
+                bundle_ids[nuget_file] = id
+                changed_ids.add(id)
+            changed_ids.update(id for (nuget_file, id) in self.bundle_ids.items() if nuget_file not in bundle_ids or nuget_file in changed_files)
+            changed_ids.discard("")
+        with timings.phase("repo_project_index"):
+            project_reference_dict = self.get_reference_project_dict(reference_projects)
+            if reference_projects != self.reference_projects:
+                changed_ids.update(x.id for x in packages.values() if not self.has_project_references(x, project_reference_dict))
+        with timings.phase("bundle_apply"):
+            nuspec_files_by_id = dict((id, x) for (x, id) in nuspec_ids.items())
+            bundle_paths = [x for x in self.bundle_paths if x[1] not in changed_ids]
+            result = dict()
+            for id in sorted(changed_ids):
+                nuspec_file = nuspec_files_by_id.get(id)
+                if nuspec_file is None:
+                    if id in packages:
+                        result[id] = None
+                    continue
+                package = parsed_packages.get(nuspec_file)
+                if package is None:
+                    package = self.read_nuspec_files([nuspec_file])[0]
+                for nuget_file in nuget_files:
+                    if bundle_ids[nuget_file] == id:
+                        (_, components) = self.read_cached(nuget_file, self.read_bundle_file)
+                        bundle_paths.extend(self.apply_bundle(package, nuget_file, components))
+                self.finish_package(package, project_reference_dict)
+                result[id] = package
+        self.nuspec_ids = nuspec_ids
+        self.bundle_ids = bundle_ids
+        self.bundle_paths = bundle_paths
+        self.reference_projects = reference_projects
+        self.save_caches(nuspec_files + nuget_files)
+        return result
+
+    def apply_bundle(self, package, nuget_file, components):
+        bundle_paths = []
+        for (reference_path, logical_path) in components:
+            package.set_reference_path(logical_path, reference_path)
+            bundle_paths.append((nuget_file, package.id, reference_path, logical_path))
+        return bundle_paths
+
+    def finish_package(self, package, project_reference_dict):
+        #process all reference - if they not absolute path - make them absolute
+        package.make_all_reference_paths_absolute(self.path_to_nuspec_files)
+        for reference in package.references:
+            if reference in project_reference_dict:
+                package.add_project_reference(reference, project_reference_dict[reference])
+        for android_reference in package.android_references:
+            if android_reference in project_reference_dict:
+                package.add_android_project_reference(android_reference, project_reference_dict[android_reference])
+        for ios_reference in package.ios_references:
+            if ios_reference in project_reference_dict:
+                package.add_ios_project_reference(ios_reference, project_reference_dict[ios_reference])
+        package.freeze()
+
+    def has_project_references(self, package, project_reference_dict):
+        # True when the project references of the package are the ones finish_package would give it
+        for platform in package.platforms:
+            project_references = dict((x, project_reference_dict[x]) for x in package.get_platform_references(platform) if x in project_reference_dict)
+            if package.get_platform_project_references(platform) != project_references:
+                return False
+        return True
+
+    def save_caches(self, source_files):
+        if self.cache is not None:
+            self.cache.retain(source_files)
+            self.cache.save()
+        if self.project_index is not None:
+            self.project_index.save()
+
+    def get_source_files(self):
+        return list_source_files(self.path_to_nuspec_files, self.path_to_nuget_bundle_config)
+
+    def export_index(self, packages, index_path):
+        with timings.phase("index_export"):
+            PackageDatabase(index_path).write(packages, self.get_source_files(), get_projects_fingerprint(self.reference_projects), self.bundle_paths, self.repo_path)
+
+    def load_index(self, index_path):
+        # packages from the SQLite index, None when it is missing, older than the nuspec and bundle files or
+        # made for other projects under xamarin/maui
+        database = PackageDatabase(index_path)
+        try:
+            with timings.phase("index_load"):
+                self.reference_projects = self.find_reference_projects()
+                if self.project_index is not None:
+                    self.project_index.save()
+                if not database.is_current(self.get_source_files(), get_projects_fingerprint(self.reference_projects)):
+                    return None
+                print(f"Load package index {index_path}")
+                return database.load_packages(MauiPackageInfo)
+        finally:
+            database.close()
+
+    def read_nuspec_files(self, nuspec_files):
+        packages = dict()
+        files_to_parse = []
+        for nuspec_file in nuspec_files:
+            (is_hit, package) = self.cache.lookup(nuspec_file) if self.cache is not None else (False, None)
+            if is_hit:
+                packages[nuspec_file] = package
+            else:
+                files_to_parse.append(nuspec_file)
+        timings.count("nuspec_files_cached", len(nuspec_files) - len(files_to_parse))
+        timings.count("nuspec_files_parsed", len(files_to_parse))
+        for (nuspec_file, package) in zip(files_to_parse, self.parse_nuspec_files(files_to_parse)):
+            packages[nuspec_file] = package
+            if self.cache is not None:
+                self.cache.store(nuspec_file, package)
+        return [packages[nuspec_file] for nuspec_file in nuspec_files]
+
+    def parse_nuspec_files(self, nuspec_files):
+        jobs = min(self.jobs, len(nuspec_files) // MIN_NUSPEC_FILES_PER_JOB)
+        if jobs <= 1:
+            return [self.read_nuspec_file(nuspec_file) for nuspec_file in nuspec_files]
+        chunk_size = max(1, len(nuspec_files) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=self.mp_context) as executor:
+            return list(executor.map(read_nuspec_file_job, nuspec_files, chunksize=chunk_size))
+
+    def read_cached(self, file_path, read_file):
+        if self.cache is None:
+            return read_file(file_path)
+        (is_hit, data) = self.cache.lookup(file_path)
+        if is_hit:
+            return data
+        data = read_file(file_path)
+        self.cache.store(file_path, data)
+        return data
+
+    def read_bundle_file(self, nuget_file):
+        with open(nuget_file) as f:
+            data = json.load(f)
+        bundle = data["bundle"]
+        components = []
+        if bundle["id"] == "":
+            return (bundle["id"], components)
+        for component in bundle["components"]:
+            reference_path = os.path.join(self.repo_path, component["source"])
+            logical_path = self.trim_path(component["target"])
+            components.append((reference_path, logical_path))
+        return (bundle["id"], components)
+
+    def find_reference_projects(self):
+        # listed again on every build, the directory index only lists the folders whose mtime changed
+        return find_reference_projects(self.repo_path, self.project_index)
+
+    def get_reference_project_dict(self, projects):
         result = dict()
-        projects = glob.glob(f"{projects_dir}/**/*.csproj", recursive=True)
+        duplicates = dict()
         for project in projects:
             project_name = os.path.basename(project)
             project_name = project_name.replace(".csproj", "")
+            if project_name in result:
+                duplicates.setdefault(project_name, [result[project_name]]).append(project)
+                continue
             result[project_name] = project            
+        for (project_name, paths) in duplicates.items():
+            print(f"Duplicate project name {project_name}, use {paths[0]}, skip {', '.join(paths[1:])}")
         return result
     def trim_path(self, path):
         if path.startswith(".\\"):
@@ -268,88 +580,138 @@ class PackageInfoBuilder:
 class PackageStorage:
     def __init__(self, package_info_list):
         self.package_info_list = package_info_list
+        self.resolved_references = dict()
+        self.maui_reference_index = None
+        self.xamarin_reference_index = None
+        self.dependency_graph = DependencyGraph({x.id: x.get_dependencies() for x in package_info_list.values()})
+        for cycle in self.dependency_graph.get_cycles():
+            print(f"Dependency cycle detected: {' -> '.join(cycle)}")
 
     def get_package_info_list(self):
         return self.package_info_list
 
+    def update_packages(self, packages):
+        # packages maps ids to new packages, None removes the package. The closures and resolutions that reach one of
+        # them are dropped, the rest of the memo is kept. Returns the ids of the packages with a dropped closure.
+        for (package_id, package_info) in packages.items():
+            if package_info is None:
+                self.package_info_list.pop(package_id, None)
+            else:
+                self.package_info_list[package_id] = package_info
+        affected = self.dependency_graph.update(dict((x, y.get_dependencies() if y is not None else None) for (x, y) in packages.items()))
+        self.resolved_references = dict((x, y) for (x, y) in self.resolved_references.items() if y.package_ids.isdisjoint(affected))
+        # the assembly indexes are built again on first use
+        self.maui_reference_index = None
+        self.xamarin_reference_index = None
+        for cycle in self.dependency_graph.get_cycles():
+            if not affected.isdisjoint(cycle):
+                print(f"Dependency cycle detected: {' -> '.join(cycle)}")
+        return affected
+
     def get_package_info(self, package_id):
         if package_id in self.package_info_list:
             return self.package_info_list[package_id]
         return None 
     
     def get_dependent_packages(self, package_id):
-        result = set()
-        package_info = self.get_package_info(package_id)
-        if package_info is None:
-            return result
-        dependencies = package_info.get_dependencies()
-        if dependencies == None:
-            return result
-        for dependent_package_id in dependencies:
-            result.add(dependent_package_id)
-            dependent_packages = self.get_dependent_packages(dependent_package_id)
-            if dependent_packages == None:
-                continue
-            result.update(dependent_packages)
+        return self.dependency_graph.get_closure(package_id)
+
+    def get_package_closure(self, package_id):
+        result = [self.package_info_list[package_id]]
+        for dependent_package_id in self.get_dependent_packages(package_id):
+            package_info = self.get_package_info(dependent_package_id)
+            if package_info is not None:
+                result.append(package_info)
         return result
 
-    def find_common_references(self, package_references):
-        common_references = set()
-        packages_to_remove = []
+    def resolve_references(self, package_references):
+        # packages_to_remove keeps the order of package_references, the references come from the shared resolution
+        resolved = self.resolve_package_set(package_references)
+        packages_to_remove = self.get_packages_to_remove(package_references)
+        if packages_to_remove == resolved.packages_to_remove:
+            return resolved
+        return resolved.with_packages_to_remove(packages_to_remove)
+
+    def resolve_package_set(self, package_references):
+        # the references don't depend on the order of the packages, projects with the same package set share them
+        key = tuple(sorted(set(package_references)))
+        resolved = self.resolved_references.get(key)
+        if resolved is not None:
+            timings.count("resolutions_reused")
+            return resolved
+        resolved = ResolvedReferences()
+        resolved.packages_to_remove = self.get_packages_to_remove(package_references)
+        visited = set()
+        for package_reference in key:
+            if self.get_package_info(package_reference) == None:
+                continue
+            for package_info in self.get_package_closure(package_reference):
+                if package_info.id in visited:
+                    continue
+                visited.add(package_info.id)
+                resolved.common_references.update(package_info.get_reference_infos())
+                resolved.android_references.update(package_info.get_android_reference_infos())
+                resolved.ios_references.update(package_info.get_ios_reference_infos())
+        resolved.package_ids = frozenset(key) | frozenset(visited)
+        self.resolved_references[key] = resolved
+        return resolved
+
+    def get_packages_to_remove(self, package_references):
+        result = []
         for package_reference in package_references:
             package = self.get_package_info(package_reference)
-            if package == None:
-                continue
-            packages_to_remove.append(package.id)
-            reference_info = package.get_reference_infos()
-            common_references.update(reference_info)
-            (dependent_references, _) = self.find_common_references(self.get_dependent_packages(package_reference))
-            common_references.update(dependent_references)
-        return (common_references, packages_to_remove)
+            if package != None:
+                result.append(package.id)
+        return result
+
+    def find_common_references(self, package_references):
+        resolved = self.resolve_references(package_references)
+        return (set(resolved.common_references), list(resolved.packages_to_remove))
 
     def find_android_references(self, package_references):
-        android_references = set()
-        packages_to_remove = []
-        for package_reference in package_references:
-            package = self.get_package_info(package_reference)
-            if package == None:
-                continue
-            packages_to_remove.append(package.id)
-            reference_info = package.get_android_reference_infos()
-            android_references.update(reference_info)
-            (dependent_references, _) = self.find_android_references(self.get_dependent_packages(package_reference))
-            android_references.update(dependent_references)
-        return (android_references, packages_to_remove)
+        resolved = self.resolve_references(package_references)
+        return (set(resolved.android_references), list(resolved.packages_to_remove))
 
     def find_ios_references(self, package_references):
-        ios_references = set()
-        packages_to_remove = []
-        for package_reference in package_references:
-            package = self.get_package_info(package_reference)
-            if package == None:
-                continue
-            packages_to_remove.append(package.id)
-            reference_info = package.get_ios_reference_infos()
-            ios_references.update(reference_info)
-            (dependent_references, _) = self.find_ios_references(self.get_dependent_packages(package_reference))
-            ios_references.update(dependent_references)
-        return (ios_references, packages_to_remove)
+        resolved = self.resolve_references(package_references)
+        return (set(resolved.ios_references), list(resolved.packages_to_remove))
 
     def find_maui_references_to_process(self, package_references):
-        android_references = set()
-        ios_references = set()
-        packages_to_remove = []
-        for package_reference in package_references:
-            package = self.get_package_info(package_reference)
-            if package == None:
-                continue
-            packages_to_remove.append(package.id)
-            android_references.update(package.get_android_reference_infos())
-            ios_references.update(package.get_ios_reference_infos())
-            (dependent_android_references, dependent_ios_references, _) = self.find_maui_references_to_process(self.get_dependent_packages(package_reference))
-            android_references.update(dependent_android_references)
-            ios_references.update(dependent_ios_references)
-        return (android_references, ios_references, packages_to_remove)
+        resolved = self.resolve_references(package_references)
+        return (set(resolved.android_references), set(resolved.ios_references), list(resolved.packages_to_remove))
+
+    def find_maui_partitions(self, package_references):
+        resolved = self.resolve_package_set(package_references)
+        if resolved.maui_partitions is None:
+            resolved.maui_partitions = self.split_references_by_project(resolved.android_references, resolved.ios_references)
+        (common_references, android_references, ios_references) = resolved.maui_partitions
+        return (set(common_references), set(android_references), set(ios_references), self.get_packages_to_remove(package_references))
+
+    def split_references_by_project(self, android_references, ios_references):
+        # hash join on project_path: a project built for both platforms is referenced once, with its android record
+        ios_by_project = dict()
+        for reference in ios_references:
+            ios_by_project.setdefault(reference.project_path, []).append(reference)
+        common_references = set()
+        android_only_references = set()
+        shared_projects = set()
+        for reference in android_references:
+            if reference.project_path in ios_by_project:
+                common_references.add(reference)
+                shared_projects.add(reference.project_path)
+            else:
+                android_only_references.add(reference)
+        ios_only_references = set(x for x in ios_references if x.project_path not in shared_projects)
+        return (frozenset(common_references), frozenset(android_only_references), frozenset(ios_only_references))
+
+    def replace_project_refs_suffix(self, references):
+        result = set()
+        for reference in references:
+            project_path = reference.project_path
+            if project_path is not None and project_path.endswith(".csproj"):
+                project_path = project_path[:-len(".csproj")] + ".Refs.csproj"
+            result.add(ReferenceInfo(reference.reference, reference.path, project_path))
+        return result
 
     def get_maui_packages(self):
         result = []
@@ -358,31 +720,77 @@ class PackageStorage:
                 result.append(package_info)
         return result
 
+    def get_maui_reference_index(self):
+        if self.maui_reference_index is None:
+            index = {"android": dict(), "ios": dict()}
+            for package_info in self.get_maui_packages():
+                for reference in package_info.android_references:
+                    index["android"].setdefault(reference, []).append(package_info.id)
+                for reference in package_info.ios_references:
+                    index["ios"].setdefault(reference, []).append(package_info.id)
+            self.maui_reference_index = index
+        return self.maui_reference_index
+
+    def get_xamarin_reference_index(self):
+        # dll paths, head project paths and (platform, assembly) of the xamarin packages -> package ids
+        if self.xamarin_reference_index is None:
+            index = {"paths": dict(), "projects": dict(), "assemblies": dict()}
+            for package_info in self.package_info_list.values():
+                if package_info.is_maui():
+                    continue
+                for platform in ["common", "android", "ios"]:
+                    for (reference, path) in package_info.get_platform_references(platform).items():
+                        index["assemblies"].setdefault((platform, reference), []).append(package_info.id)
+                        index["paths"].setdefault(get_reference_path_key(path), []).append(package_info.id)
+                for platform in ["common", "android", "ios"]:
+                    for project_path in package_info.get_platform_project_references(platform).values():
+                        index["projects"].setdefault(get_reference_path_key(project_path), []).append(package_info.id)
+            self.xamarin_reference_index = index
+        return self.xamarin_reference_index
+
+    def find_xamarin_reference_packages(self, platform, reference):
+        index = self.get_xamarin_reference_index()
+        if reference.project_path is not None:
+            package_ids = index["projects"].get(get_reference_path_key(reference.project_path))
+            if package_ids is not None:
+                return package_ids
+        if reference.path is not None:
+            package_ids = index["paths"].get(get_reference_path_key(reference.path))
+            if package_ids is not None:
+                return package_ids
+        return index["assemblies"].get((platform, reference.reference))
+
+    def find_xamarin_packages(self, platform, references):
+        packages_to_process = set()
+        references_to_remove = []
+        for (key, reference) in references.items():
+            package_ids = self.find_xamarin_reference_packages(platform, reference)
+            if package_ids is None:
+                continue
+            packages_to_process.update(package_ids)
+            references_to_remove.append(key)
+        return (self.trim_implied_packages(packages_to_process), references_to_remove)
+
+    def trim_implied_packages(self, package_ids):
+        implied_packages = set()
+        for package_id in package_ids:
+            implied_packages.update(self.get_dependent_packages(package_id))
+        return sorted(x for x in package_ids if x not in implied_packages)
+
     def find_maui_packages(self, grouped_by_platform_references):
         maui_packages_to_process = set()
         references_to_remove = dict()
         references_to_remove["android"] = set()
         references_to_remove["ios"] = set()
-        if "android" in grouped_by_platform_references:
-            android_references = grouped_by_platform_references["android"]
-            for package in self.get_maui_packages():
-                references = package.get_android_reference_infos()
-                for reference_info in references:
-                    if reference_info.reference in android_references:
-                        maui_packages_to_process.add(package.id)
-                        references_to_remove["android"].add(reference_info.reference)
-        if "ios" in grouped_by_platform_references:
-            ios_references = grouped_by_platform_references["ios"]
-            for package in self.get_maui_packages():
-                references = package.get_ios_reference_infos()
-                for reference_info in references:
-                    if reference_info.reference in ios_references:
-                        maui_packages_to_process.add(package.id)
-                        references_to_remove["ios"].add(reference_info.reference)
-        trimmed_packages = list(maui_packages_to_process)
-        for package in maui_packages_to_process:
-            dependent_packages = self.get_dependent_packages(package)
-            for dependent_package in dependent_packages:
-                if dependent_package in trimmed_packages:
-                    trimmed_packages.remove(dependent_package)
-        return (trimmed_packages, references_to_remove)
\ No newline at end of file
+        index = self.get_maui_reference_index()
+        for platform in ["android", "ios"]:
+            if platform not in grouped_by_platform_references:
+                continue
+            platform_index = index[platform]
+            for reference in grouped_by_platform_references[platform]:
+                package_ids = platform_index.get(reference)
+                if package_ids is None:
+                    continue
+                maui_packages_to_process.update(package_ids)
+                references_to_remove[platform].add(reference)
+        return (self.trim_implied_packages(maui_packages_to_process), references_to_remove)
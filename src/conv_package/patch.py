@@ -0,0 +1,236 @@
+import copy
+import re
+import lxml
+import lxml.etree
+
+__all__ = ["NodeSpan", "ProjectPatch", "scan_nodes"]
+
+token_regex = re.compile(rb'<(?:(!--.*?--)|(!\[CDATA\[.*?\]\])|(\?.*?\?)|(!DOCTYPE[^\[>]*(?:\[.*?\])?\s*)|/([^\s>]+)\s*|([^\s/>!?]+)(?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|\'[^\']*\'))*\s*(/?))>', re.DOTALL)
+encoding_regex = re.compile(rb'^(?:\xef\xbb\xbf)?<\?xml[^>]*encoding\s*=\s*["\']([^"\']+)["\']')
+
+class NodeSpan:
+    def __init__(self, kind, name, start, start_tag_end, parent):
+        self.kind = kind
+        self.name = name
+        self.start = start
+        self.start_tag_end = start_tag_end
+        self.end_tag_start = start_tag_end
+        self.end = start_tag_end
+        self.parent = parent
+        self.is_empty = True
+        self.children = []
+
+def scan_nodes(content):
+    # Byte spans of the elements, comments and processing instructions inside the root element, in document order.
+    # Returns None for content the splice writer doesn't handle (DTD subsets, unbalanced or unknown markup).
+    nodes = []
+    stack = []
+    position = 0
+    for match in token_regex.finditer(content):
+        if content.find(b"<", position, match.start()) != -1:
+            return None
+        position = match.end()
+        (comment, cdata, instruction, doctype, end_name, start_name, self_closing) = match.groups()
+        parent = stack[-1] if len(stack) > 0 else None
+        if comment is not None or instruction is not None:
+            if parent is not None:
+                nodes.append(NodeSpan("comment" if comment is not None else "pi", None, match.start(), match.end(), parent))
+        elif doctype is not None:
+            if b"[" in doctype:
+                return None
+        elif end_name is not None:
+            if parent is None or parent.name != end_name:
+                return None
+            stack.pop()
+            parent.end_tag_start = match.start()
+            parent.end = match.end()
+        elif start_name is not None:
+            if parent is None and len(nodes) > 0:
+                return None
+            node = NodeSpan("element", start_name, match.start(), match.end(), parent)
+            nodes.append(node)
+            if self_closing != b"/":
+                node.is_empty = False
+                stack.append(node)
+    if len(stack) > 0 or content.find(b"<", position) != -1 or len(nodes) == 0:
+        return None
+    return nodes
+
+def get_node_kind(node):
+    if isinstance(node.tag, str):
+        return "element"
+    if node.tag is lxml.etree.Comment:
+        return "comment"
+    if node.tag is lxml.etree.ProcessingInstruction:
+        return "pi"
+    return None
+
+def map_spans(content, root):
+    match = encoding_regex.match(content)
+    if match is not None and match.group(1).lower() not in [b"utf-8", b"utf8"]:
+        return None
+    try:
+        content.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    nodes = scan_nodes(content)
+    if nodes is None:
+        return None
+    elements = list(root.iter())
+    if len(elements) != len(nodes):
+        return None
+    spans = dict()
+    span_elements = dict()
+    for (element, node) in zip(elements, nodes):
+        kind = get_node_kind(element)
+        if kind != node.kind:
+            return None
+        if kind == "element" and lxml.etree.QName(element).localname.encode("utf-8") != node.name.split(b":")[-1]:
+            return None
+        spans[element] = node
+        span_elements[id(node)] = element
+    for node in nodes:
+        if node.parent is not None:
+            node.parent.children.append(span_elements[id(node)])
+    return spans
+
+class ProjectPatch:
+    # Turns the edits made to a parsed project into byte splices of the original file: removed children lose
+    # their line, new children are serialized with the indentation of their siblings. render() returns None
+    # when the change can't be expressed that way and the caller has to write the whole document.
+    def __init__(self, content, root):
+        self.content = content
+        self.root = root
+        self.spans = map_spans(content, root)
+        self.changed_parents = []
+        self.is_edited = False
+        self.newline = b"\r\n" if b"\r\n" in content else b"\n"
+        self.indent_unit = None
+
+    def record(self, parent):
+        self.is_edited = True
+        if self.spans is not None and parent in self.spans and parent not in self.changed_parents:
+            self.changed_parents.append(parent)
+
+    def render(self):
+        if self.spans is None:
+            return None
+        edits = []
+        for parent in self.changed_parents:
+            if parent is not self.root and not any(x is self.root for x in parent.iterancestors()):
+                continue
+            parent_edits = self.get_edits(parent)
+            if parent_edits is None:
+                return None
+            edits.extend(parent_edits)
+        edits.sort(key=lambda x: (x[0], x[1]))
+        result = []
+        position = 0
+        for (start, end, replacement) in edits:
+            if start < position:
+                return None
+            result.append(self.content[position:start])
+            result.append(replacement)
+            position = end
+        result.append(self.content[position:])
+        return b"".join(result)
+
+    def get_edits(self, parent):
+        span = self.spans[parent]
+        current = list(parent)
+        originals = [x for x in current if x in self.spans]
+        kept = set(originals)
+        if originals != [x for x in span.children if x in kept]:
+            return None
+        new_children = [x for x in current if x not in kept]
+        if len(new_children) > 0 and span.is_empty:
+            return None
+        for child in new_children:
+            if any(isinstance(x.tag, str) and x.tag.startswith("{") for x in child.iter()):
+                return None
+        indent = self.get_child_indent(span)
+        edits = []
+        if len(originals) == 0:
+            # nothing of the old content is left, an emptied element keeps no whitespace text
+            fragment = b"".join(self.serialize(x, indent) for x in new_children)
+            if len(new_children) > 0:
+                fragment += self.newline + (self.get_indent(span) or b"")
+            elif span.is_empty or len(span.children) == 0:
+                return []
+            return [(span.start_tag_end, span.end_tag_start, fragment)]
+        removed_spans = dict((self.spans[x].start, self.spans[x].end) for x in span.children if x not in kept)
+        for (start, end) in removed_spans.items():
+            edits.append(self.get_removal(start, end, removed_spans))
+        anchor = span.start_tag_end
+        pending = []
+        for child in current + [None]:
+            if child is not None and child not in kept:
+                pending.append(child)
+                continue
+            if len(pending) > 0:
+                edits.append((anchor, anchor, b"".join(self.serialize(x, indent) for x in pending)))
+                pending = []
+            if child is not None:
+                anchor = self.spans[child].end
+        return edits
+
+    def serialize(self, element, indent):
+        # a detached copy doesn't repeat the namespace declarations of the document
+        text = lxml.etree.tostring(copy.deepcopy(element), pretty_print=True, encoding="utf-8", with_tail=False)
+        unit = self.get_indent_unit()
+        lines = []
+        for line in text.rstrip(b"\n").split(b"\n"):
+            stripped = line.lstrip(b" ")
+            lines.append(self.newline + indent + unit * ((len(line) - len(stripped)) // 2) + stripped)
+        return b"".join(lines)
+
+    def get_removal(self, start, end, removed_spans):
+        # a removed node loses its line, unless a kept node (a trailing comment) follows it on that line:
+        # then only the node and the spaces after it go, and the kept node moves to its place
+        line_end = end
+        while True:
+            while line_end < len(self.content) and self.content[line_end:line_end + 1] in [b" ", b"\t"]:
+                line_end += 1
+            if line_end not in removed_spans:
+                break
+            line_end = removed_spans[line_end]
+        if line_end < len(self.content) and self.content[line_end:line_end + 1] not in [b"\r", b"\n"]:
+            while end < len(self.content) and self.content[end:end + 1] in [b" ", b"\t"]:
+                end += 1
+            return (start, end, b"")
+        return (self.get_line_start(start), end, b"")
+
+    def get_line_start(self, start):
+        while start > 0 and self.content[start - 1:start] in [b" ", b"\t"]:
+            start -= 1
+        if start > 0 and self.content[start - 1:start] == b"\n":
+            start -= 1
+            if start > 0 and self.content[start - 1:start] == b"\r":
+                start -= 1
+        return start
+
+    def get_indent(self, span):
+        start = span.start
+        while start > 0 and self.content[start - 1:start] in [b" ", b"\t"]:
+            start -= 1
+        if start == 0 or self.content[start - 1:start] in [b"\n", b"\r"]:
+            return self.content[start:span.start]
+        return None
+
+    def get_child_indent(self, span):
+        for child in span.children:
+            indent = self.get_indent(self.spans[child])
+            if indent is not None:
+                return indent
+        return (self.get_indent(span) or b"") + self.get_indent_unit()
+
+    def get_indent_unit(self):
+        if self.indent_unit is None:
+            self.indent_unit = b"  "
+            root_span = self.spans[self.root]
+            for child in root_span.children:
+                indent = self.get_indent(self.spans[child])
+                if indent:
+                    self.indent_unit = indent
+                    break
+        return self.indent_unit
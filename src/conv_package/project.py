@@ -1,39 +1,227 @@
+import io
 import lxml
 import lxml.etree
 import os
-import re
-from conv_package.package import *
+import threading
+from conv_package.msbuild import document_cache, get_property_matches
+from conv_package.package import ReferenceInfo
+from conv_package.cache import BackupStore, write_file_atomic
+from conv_package.patch import ProjectPatch
+from conv_package.timings import timings
 from lxml.etree import XMLParser
 from pathlib import Path
 
+__all__ = ["MSBUILD_NAMESPACE", "ProjectElementIndex", "ProjectEvidence", "ProjectInfo", "classify_project", "get_build_props_path", "get_xpath", "scan_project"]
+
+MSBUILD_NAMESPACE = "http://schemas.microsoft.com/developer/msbuild/2003"
+
+# compiled XPath objects serialize their evaluations, every project job thread compiles its own
+compiled_xpaths = threading.local()
+
+def get_xpath(path):
+    xpaths = getattr(compiled_xpaths, "xpaths", None)
+    if xpaths is None:
+        xpaths = compiled_xpaths.xpaths = dict()
+    xpath = xpaths.get(path)
+    if xpath is None:
+        xpath = xpaths[path] = lxml.etree.XPath(path, namespaces={"ns": MSBUILD_NAMESPACE})
+    return xpath
+
+def run_xpath(document, path):
+    timings.count("xpath_queries")
+    return get_xpath(path)(document)
+
+platform_targets = [b"Xamarin.Android.CSharp.targets", b"Xamarin.iOS.CSharp.targets"]
+
+def may_import_platform(content):
+    # False only when no Import of the file can name the android or ios targets: the names aren't in the bytes
+    # and nothing (character references, entities, a UTF-16/32 encoding) can spell them differently
+    return any(x in content for x in platform_targets) or b"&#" in content or b"<!ENTITY" in content or b"\0" in content
+
+class ProjectEvidence:
+    def __init__(self, may_import_platform=True):
+        self.is_android = False
+        self.is_ios = False
+        self.target_frameworks = []
+        self.use_maui = []
+        self.may_import_platform = may_import_platform
+
+    def is_decided(self):
+        # an android Import wins wherever it is, so a file that may still import android or ios is read to the end;
+        # otherwise the scan stops once neither "exactly one" rule (xamarin, then maui) can hold any more
+        if self.is_android:
+            return True
+        if self.may_import_platform:
+            return False
+        target_frameworks = self.target_frameworks
+        is_not_xamarin = len(target_frameworks) > 1 or (len(target_frameworks) == 1 and target_frameworks[0] != "netstandard2.0")
+        return is_not_xamarin and len(self.use_maui) > 1
+
+def get_build_props_path(proj_file_path):
+    proj_dir = os.path.dirname(proj_file_path)
+    path = Path(proj_dir)
+    return os.path.join(path.parent.absolute(), "Directory.Build.props")
+
+def scan_project(proj_file_path):
+    content = document_cache.read_bytes(proj_file_path)
+    evidence = ProjectEvidence(may_import_platform(content))
+    import_tag = f"{{{MSBUILD_NAMESPACE}}}Import"
+    property_group_depth = 0
+    with io.BytesIO(content) as f:
+        for (event, element) in lxml.etree.iterparse(f, events=("start", "end"), tag=[import_tag, "PropertyGroup", "TargetFramework", "UseMaui"]):
+            if event == "start":
+                if element.tag == "PropertyGroup":
+                    property_group_depth += 1
+                elif element.tag == import_tag:
+                    project = element.get("Project", "")
+                    evidence.is_android = evidence.is_android or "Xamarin.Android.CSharp.targets" in project
+                    evidence.is_ios = evidence.is_ios or "Xamarin.iOS.CSharp.targets" in project
+                continue
+            if element.tag == "PropertyGroup":
+                property_group_depth -= 1
+                element.clear()
+            elif property_group_depth > 0 and element.tag == "TargetFramework":
+                evidence.target_frameworks.append(element.text)
+            elif property_group_depth > 0 and element.tag == "UseMaui":
+                evidence.use_maui.append(element.text)
+            if evidence.is_decided():
+                break
+    return evidence
+
+def classify_project(proj_file_path):
+    evidence = scan_project(proj_file_path)
+    if evidence.is_android:
+        return "android"
+    if evidence.is_ios:
+        return "ios"
+    if len(evidence.target_frameworks) == 1 and evidence.target_frameworks[0] == "netstandard2.0":
+        return "xamarin"
+    use_maui = evidence.use_maui
+    if len(use_maui) < 2:
+        build_props_path = get_build_props_path(proj_file_path)
+        if os.path.exists(build_props_path):
+            use_maui = use_maui + [x.text for x in run_xpath(document_cache.parse(build_props_path), "//PropertyGroup//UseMaui")]
+    if len(use_maui) == 1 and use_maui[0] is not None and use_maui[0].lower() == "true":
+        return "maui"
+    return None
+
+class ProjectElementIndex:
+    # PackageReference, Reference, ProjectReference and ItemGroup elements of one document in document order and by Include.
+    # ProjectInfo updates it on every edit, so lookups don't run XPath over the whole document.
+    # Only elements with the queried tag are indexed: like the XPath queries, a namespaced project doesn't see
+    # the namespace-less elements added by conv.
+    kinds = ["PackageReference", "Reference", "ProjectReference", "ItemGroup"]
+
+    def __init__(self, root, namespace):
+        self.tags = dict((kind, f"{{{namespace}}}{kind}" if namespace is not None else kind) for kind in self.kinds)
+        self.kind_by_tag = dict((tag, kind) for (kind, tag) in self.tags.items())
+        self.elements = dict((kind, []) for kind in self.kinds)
+        self.members = dict((kind, set()) for kind in self.kinds)
+        self.includes = dict((kind, dict()) for kind in self.kinds)
+        for element in root.iter(*self.tags.values()):
+            self.insert(element, len(self.elements[self.kind_by_tag[element.tag]]))
+
+    def get_elements(self, kind):
+        return list(self.elements[kind])
+
+    def has_include(self, kind, include):
+        return include in self.includes[kind]
+
+    def insert(self, element, position):
+        kind = self.kind_by_tag[element.tag]
+        self.elements[kind].insert(position, element)
+        self.members[kind].add(element)
+        self.includes[kind].setdefault(element.get("Include"), []).append(element)
+
+    def add(self, element):
+        kind = self.kind_by_tag.get(element.tag)
+        if kind is None:
+            return
+        next_element = self.find_next(element, kind)
+        self.insert(element, len(self.elements[kind]) if next_element is None else self.elements[kind].index(next_element))
+
+    def remove(self, element):
+        kind = self.kind_by_tag.get(element.tag)
+        if kind is None or element not in self.members[kind]:
+            return
+        self.elements[kind].remove(element)
+        self.members[kind].discard(element)
+        include = element.get("Include")
+        elements = self.includes[kind][include]
+        elements.remove(element)
+        if len(elements) == 0:
+            del self.includes[kind][include]
+
+    def find_next(self, element, kind):
+        # first indexed element of the same kind after this one in document order, new elements are mostly appended
+        node = element
+        while node is not None:
+            for sibling in node.itersiblings():
+                for candidate in sibling.iter(self.tags[kind]):
+                    if candidate in self.members[kind]:
+                        return candidate
+            node = node.getparent()
+        return None
+
 class ProjectInfo:
-    msbuild_namespaces = {"ns":"http://schemas.microsoft.com/developer/msbuild/2003"}
+    msbuild_namespaces = {"ns":MSBUILD_NAMESPACE}
+    backup_store = BackupStore()
 
     def __init__(self, proj_file_path):
         self.proj_file_path = proj_file_path
         parser = XMLParser(remove_blank_text=True)
-        self.document = lxml.etree.parse(proj_file_path, parser)
+        self.original_content = document_cache.read_bytes(proj_file_path)
+        self.document = lxml.etree.fromstring(self.original_content, parser).getroottree()
+        timings.count("projects_loaded")
         self.build_props_documents = self.get_build_props(proj_file_path, parser)
         self.root = self.document.getroot()
         self.use_namespace = len(self.root.nsmap) > 0
+        self.index = None
+        self.patch = None
 
     def save(self):
-        indx = 0
-        backup_path = f"{self.proj_file_path}.bak"
-        while(os.path.exists(backup_path)):
-            indx += 1
-            backup_path = f"{self.proj_file_path}.bak{indx}"
-        os.rename(self.proj_file_path, backup_path)
-        self.document.write(self.proj_file_path, pretty_print=True, encoding="utf-8")
+        content = self.render()
+        with open(self.proj_file_path, "rb") as f:
+            original_content = f.read()
+        if content == original_content:
+            print(f"Skip save {self.proj_file_path}, reason - nothing changed")
+            timings.count("projects_unchanged")
+            return False
+        with timings.phase("write"):
+            self.backup_store.backup(self.proj_file_path, original_content)
+            write_file_atomic(self.proj_file_path, content)
+        timings.count("projects_written")
+        timings.count("bytes_written", len(content))
+        return True
+
+    def render(self):
+        if self.patch is None or not self.patch.is_edited:
+            return self.original_content
+        content = self.patch.render()
+        if content is not None:
+            timings.count("projects_patched")
+            return content
+        return lxml.etree.tostring(self.document, pretty_print=True, encoding="utf-8")
+
+    def begin_edit(self):
+        # spans of the original elements are mapped before the first edit, untouched parts are written back as they were
+        if self.patch is None:
+            self.patch = ProjectPatch(self.original_content, self.root)
+
+    def inserted(self, element):
+        self.get_index().add(element)
+        self.patch.record(element.getparent())
+
+    def removed(self, parent, element):
+        self.get_index().remove(element)
+        self.patch.record(parent)
 
     def get_build_props(self, proj_file_path, parser: XMLParser):
         build_props = []
-        proj_dir = os.path.dirname(proj_file_path)
-        path = Path(proj_dir)
-        build_props_file_name = os.path.join(path.parent.absolute(), "Directory.Build.props")
+        build_props_file_name = get_build_props_path(proj_file_path)
         if not os.path.exists(build_props_file_name):
             return build_props
-        build_props.append(lxml.etree.parse(build_props_file_name, parser))
+        build_props.append(document_cache.parse(build_props_file_name))
         return build_props
 
     def has_maui_android_platform(self):
@@ -51,15 +239,15 @@ class ProjectInfo:
         return False
 
     def is_android(self):
-        nodes = self.document.xpath("//ns:Import[contains(@Project, 'Xamarin.Android.CSharp.targets')]", namespaces=self.msbuild_namespaces)
+        nodes = run_xpath(self.document, "//ns:Import[contains(@Project, 'Xamarin.Android.CSharp.targets')]")
         return len(nodes) > 0
     
     def is_ios(self):
-        nodes = self.document.xpath("//ns:Import[contains(@Project, 'Xamarin.iOS.CSharp.targets')]", namespaces=self.msbuild_namespaces)
+        nodes = run_xpath(self.document, "//ns:Import[contains(@Project, 'Xamarin.iOS.CSharp.targets')]")
         return len(nodes) > 0
 
     def is_xamarin(self):
-        nodes = self.document.xpath("//PropertyGroup//TargetFramework")
+        nodes = run_xpath(self.document, "//PropertyGroup//TargetFramework")
         return len(nodes) == 1 and nodes[0].text == "netstandard2.0"
 
     def is_maui(self):
@@ -68,10 +256,10 @@ class ProjectInfo:
 
     def search_nodes(self, path):
         result = []
-        nodes = self.document.xpath(path)
+        nodes = run_xpath(self.document, path)
         result.extend(nodes)
         for build_props_document in self.build_props_documents:
-            nodes = build_props_document.xpath(path)
+            nodes = run_xpath(build_props_document, path)
             result.extend(nodes)
         return result
 
@@ -114,8 +302,8 @@ class ProjectInfo:
             self.add_package_reference(package, version, platform)
 
     def add_package_reference(self, package, version, platform=""):
-        packages = self.get_package_references()
-        if package in packages:
+        self.begin_edit()
+        if self.get_index().has_include("PackageReference", package):
             print(f"Skip add package {package}, reason - already exist")
             return
         package_ref_nodes = self.get_packagereference_nodes()
@@ -133,11 +321,14 @@ class ProjectInfo:
             if (platform != ""):
                 content_node.attrib["Condition"] = f"$(TargetFramework.Contains('-{condition}'))"
             project_node.append(content_node)
+            self.inserted(content_node)
                         
         package_node = lxml.etree.Element("PackageReference")
         content_node.append(package_node)
         package_node.attrib["Include"] = package
         package_node.attrib["Version"] = version        
+        self.inserted(package_node)
+        timings.count("package_references_added")
         print(f"Add package {package}")
 
     def is_no_condition(self, elemnt, condition):
@@ -151,6 +342,7 @@ class ProjectInfo:
         return condition_attr.replace(" ", "") == condition.replace(" ", "")
 
     def add_references(self, references, repo_path, platform="", use_dll=False):
+        self.begin_edit()
         package_ref_nodes = self.get_packagereference_nodes()
         condition = None
         if platform != "":
@@ -166,11 +358,15 @@ class ProjectInfo:
             project_node.append(ref_content_node)
         else:
             item_group_node.addnext(ref_content_node)
+        self.inserted(ref_content_node)
         for ref in references:
             hint_path = ref.path
             if hint_path == None:
                 print(f"Can't find hint path for {ref}")
                 continue
+            if not use_dll and ref.project_path is None:
+                print(f"Can't find project for {ref}")
+                continue
             ref_node = lxml.etree.SubElement(ref_content_node, "Reference" if use_dll else "ProjectReference")
             if use_dll:
                 ref_node.attrib["Include"] = ref.reference
@@ -178,28 +374,38 @@ class ProjectInfo:
                 ref_abs_path = os.path.join(os.path.expanduser(repo_path), hint_path)
                 ref_rel_path = os.path.relpath(ref_abs_path, os.path.dirname(self.proj_file_path))
                 hint_path_node.text = self.patch_path(ref_rel_path)
+                self.inserted(ref_node)
+                timings.count("references_added")
                 print(f"Add reference {ref.reference}")
             else:
                 ref_node.attrib["Include"] = ref.project_path
+                self.inserted(ref_node)
+                timings.count("references_added")
                 print(f"Add project reference {ref.reference} - {ref.project_path}")
 
     def remove_package_references(self, packages_to_remove):
+        self.begin_edit()
         package_ref_nodes = self.get_packagereference_nodes()
         for element in package_ref_nodes:
             package_name = element.attrib["Include"]
             if package_name in packages_to_remove:
                 parent = element.getparent()
                 parent.remove(element)
+                self.removed(parent, element)
+                timings.count("package_references_removed")
                 print(f"Remove package {package_name}")
 
     def clean_empty_groups(self):
+        self.begin_edit()
         item_groups = self.get_group_nodes()
         for item_group in item_groups:
             if len(item_group.getchildren()) == 0:
                 parent = item_group.getparent()
                 parent.remove(item_group)
+                self.removed(parent, item_group)
 
     def remove_references(self, references_to_remove):
+        self.begin_edit()
         reference_nodes = self.get_reference_nodes()
         for element in reference_nodes:
             reference_name = element.attrib["Include"]
@@ -213,75 +419,76 @@ class ProjectInfo:
                 references = references_to_remove[platform]
                 if reference_name in references:
                     group_node.remove(element)
+                    self.removed(group_node, element)
+                    timings.count("references_removed")
                     print(f"Remove reference {reference_name}")
 
+    def get_reference_items(self):
+        # Reference and ProjectReference elements with absolute hint and project paths, by element
+        items = dict()
+        project_dir = os.path.dirname(os.path.abspath(self.proj_file_path))
+        hint_path_tag = f"{{{MSBUILD_NAMESPACE}}}HintPath" if self.use_namespace else "HintPath"
+        for element in self.get_reference_nodes():
+            include = element.get("Include")
+            if include is None:
+                continue
+            hint_path_node = element.find(hint_path_tag)
+            hint_path = None
+            if hint_path_node is not None and hint_path_node.text:
+                hint_path = self.get_absolute_path(project_dir, hint_path_node.text)
+            items[element] = ReferenceInfo(include.split(",")[0].strip(), hint_path, None)
+        for element in self.get_project_reference_nodes():
+            include = element.get("Include")
+            if include is None:
+                continue
+            project_path = self.get_absolute_path(project_dir, include)
+            items[element] = ReferenceInfo(os.path.basename(project_path).replace(".Refs.csproj", "").replace(".csproj", ""), None, project_path)
+        return items
+
+    def remove_reference_elements(self, elements):
+        self.begin_edit()
+        for element in elements:
+            parent = element.getparent()
+            if parent is None:
+                continue
+            parent.remove(element)
+            self.removed(parent, element)
+            timings.count("references_removed")
+            print(f"Remove reference {element.get('Include')}")
+
+    def get_absolute_path(self, project_dir, path):
+        return os.path.normpath(os.path.join(project_dir, path.strip().replace("\\", "/")))
+
     def get_property(self, property_name):
         return self.get_property_matches(self.proj_file_path, property_name)
 
     def get_property_matches(self, project_path, property_name, is_end_point=False):
-        if not os.path.exists(project_path):
-            return None
-
-        with open(project_path, 'r') as f:
-            content = f.read()
-        content = re.sub(r'<!--.*?-->', '', content, flags=re.DOTALL)
-
-        # Find in current project
-        property_match = re.findall(fr'<{property_name}\s?.*>(.*?)<\/{property_name}>\s*\n', content)
-        if len(property_match) > 0:
-            return property_match
-
-        import_regex = re.compile(r'<Import\s+Project\s*=\s*"(.+?)"')
-        # Find in imported project
-        for import_match in import_regex.finditer(content):
-            base_path = os.path.dirname(project_path)
-            imported_project_name = import_match.group(1).replace('$(MSBuildThisFileDirectory)', '')
-            imported_project_path = os.path.join(base_path, imported_project_name).replace('\\', '/')
-
-            if not os.path.exists(imported_project_path):
-                imported_project_path = import_match.group(1).replace('\\', '/')
-            if not os.path.exists(imported_project_path):
-                return None
-
-            imported_project_property_matches = self.get_property_matches(imported_project_path, property_name, is_end_point)
-            if imported_project_property_matches is not None:
-                return imported_project_property_matches
-
-        # Already at the end of the import chain
-        if is_end_point:
-            return None
-
-        # Find in Directory.Build.props
-        props_file = self.get_directory_props_path(os.path.dirname(project_path))
-        if props_file is None:
-            return None
-
-        return self.get_property_matches(props_file, property_name, True)
-    
-    def get_directory_props_path(self, workspace_path):
-        prop_files = [f for f in os.listdir(workspace_path) if f == 'Directory.Build.props']
-        if len(prop_files) > 0:
-            return os.path.join(workspace_path, prop_files[0])
-
-        parent_directory = os.path.dirname(workspace_path)
-        if parent_directory == workspace_path:
-            return None
-        return self.get_directory_props_path(parent_directory)
+        return get_property_matches(project_path, property_name, is_end_point)
     
+    def get_index(self):
+        if self.index is None:
+            self.index = ProjectElementIndex(self.root, MSBUILD_NAMESPACE if self.use_namespace else None)
+        return self.index
+
     def get_packagereference_nodes(self):
-        return self.get_document_packagereference_nodes(self.document)
+        return self.get_index().get_elements("PackageReference")
 
     def get_document_packagereference_nodes(self, document):
-        return document.xpath("//ns:PackageReference", namespaces=self.msbuild_namespaces) if self.use_namespace else document.xpath("//PackageReference")
+        if document is self.document:
+            return self.get_packagereference_nodes()
+        return run_xpath(document, "//ns:PackageReference") if self.use_namespace else run_xpath(document, "//PackageReference")
 
     def get_group_nodes(self):
-        return self.document.xpath("//ns:ItemGroup", namespaces=self.msbuild_namespaces) if self.use_namespace else self.document.xpath("//ItemGroup")
+        return self.get_index().get_elements("ItemGroup")
 
     def get_reference_nodes(self):
-        return self.document.xpath("//ns:Reference", namespaces=self.msbuild_namespaces) if self.use_namespace else self.document.xpath("//Reference")
+        return self.get_index().get_elements("Reference")
+
+    def get_project_reference_nodes(self):
+        return self.get_index().get_elements("ProjectReference")
 
     def get_project_node(self):
-        nodes = self.document.xpath("ns:Project", namespaces=self.msbuild_namespaces) if self.use_namespace else self.document.xpath("//Project")
+        nodes = run_xpath(self.document, "/ns:Project") if self.use_namespace else run_xpath(self.document, "//Project")
         return nodes[0]
 
     def patch_path(self, path):
@@ -0,0 +1,82 @@
+import argparse
+import os
+
+# the parser is part of conv startup, the index modules are imported when a query runs
+
+__all__ = ["add_query_parser", "run_query"]
+
+def add_query_parser(commands):
+    parser = commands.add_parser("query", description="Query the package index of a repository.", help="Query the package index (conv query --help).")
+    # -w, --index and -j may come before or after "query", a value given before it is kept
+    parser.add_argument("-w", "--workpath", dest="repo_path", default=argparse.SUPPRESS)
+    parser.add_argument("--index", dest="index_path", default=argparse.SUPPRESS, help="SQLite index file, the conv cache folder by default.")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=argparse.SUPPRESS, help="Number of worker processes while the index is built.")
+    parser.add_argument("--rebuild", dest="rebuild", action="store_true", help="Rebuild the index even if it is up to date.")
+    commands = parser.add_subparsers(dest="query_command", required=True)
+    deps = commands.add_parser("deps", help="Packages the given package depends on.")
+    deps.add_argument("package")
+    rdeps = commands.add_parser("rdeps", help="Packages that depend on the given package.")
+    rdeps.add_argument("package")
+    for command in [deps, rdeps]:
+        command.add_argument("--platform", choices=["common", "android", "ios"], default="common", help="Dependency group (common by default).")
+        command.add_argument("--direct", dest="direct", action="store_true", help="Only direct dependencies.")
+    owner = commands.add_parser("owner", help="Packages that ship a reference (assembly name, dll file name or full path).")
+    owner.add_argument("reference")
+    owner.add_argument("--platform", choices=["common", "android", "ios"])
+    owner.add_argument("--transitive", dest="transitive", action="store_true", help="Also list the packages that pull the owners in.")
+    return parser
+
+def open_database(args):
+    from conv_package.cache import get_repo_cache_path
+    from conv_package.database import PackageDatabase, get_index_path, get_projects_fingerprint, list_source_files
+    from conv_package.discovery import DirectoryIndex, find_reference_projects
+    repo_path = os.path.expanduser(args.repo_path)
+    index_path = args.index_path or get_index_path(repo_path)
+    database = PackageDatabase(index_path)
+    if not args.rebuild:
+        project_index = DirectoryIndex(get_repo_cache_path(repo_path, "projects"))
+        projects_fingerprint = get_projects_fingerprint(find_reference_projects(repo_path, project_index))
+        project_index.save()
+        if database.is_current(list_source_files(os.path.join(repo_path, "nuspec"), os.path.join(repo_path, "scripts/nuget")), projects_fingerprint):
+            return database
+    # building the index needs the nuspec parser (and lxml), a current index is queried without it
+    from conv_package.conversion import create_package_builder
+    builder = create_package_builder(args)
+    builder.export_index(builder.build_packages(), index_path)
+    print(f"Package index written to {index_path}")
+    database.close()
+    return database
+
+def run_query(args):
+    database = open_database(args)
+    try:
+        if args.query_command in ["deps", "rdeps"]:
+            package_id = database.find_package(args.package)
+            if package_id is None:
+                print(f"Unknown package {args.package}")
+                return 1
+            if args.query_command == "deps":
+                result = database.get_closure(package_id, args.platform, args.direct)
+            else:
+                result = database.get_dependents(package_id, args.platform, args.direct)
+            for x in result:
+                print(x)
+            return 0
+        owners = database.find_owners(args.reference, args.platform)
+        if len(owners) == 0:
+            print(f"No package contains {args.reference}")
+            return 1
+        for (package_id, platform, reference, path, project_path) in owners:
+            print(f"{package_id} {platform} {reference} {path}" + (f" ({project_path})" if project_path is not None else ""))
+        if args.transitive:
+            dependents = set()
+            for owner_id in set(x[0] for x in owners):
+                dependents.update(database.get_dependents(owner_id))
+            dependents.difference_update(x[0] for x in owners)
+            if len(dependents) > 0:
+                print("Pulled in by:")
+                for x in sorted(dependents):
+                    print(f"  {x}")
+        return 0
+    finally:
+        database.close()
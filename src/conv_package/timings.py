@@ -0,0 +1,110 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+__all__ = ["Timings", "timings", "run_instrumented"]
+
+PROFILE_FUNCTIONS = 30
+
+class Timings:
+    # Wall time per phase and plain counters; always on, a phase costs two perf_counter calls.
+    # Project jobs run on threads, phase times of concurrent jobs add up.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.start_time = time.perf_counter()
+        self.phases = dict()
+        self.counters = dict()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                entry = self.phases.get(name)
+                if entry is None:
+                    entry = self.phases[name] = [0.0, 0]
+                entry[0] += seconds
+                entry[1] += 1
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def take(self):
+        with self.lock:
+            result = (self.phases, self.counters)
+            self.phases = dict()
+            self.counters = dict()
+        return result
+
+    def merge(self, taken):
+        (phases, counters) = taken
+        with self.lock:
+            for (name, (seconds, calls)) in phases.items():
+                entry = self.phases.setdefault(name, [0.0, 0])
+                entry[0] += seconds
+                entry[1] += calls
+        for (name, value) in counters.items():
+            self.count(name, value)
+
+    def get_report(self):
+        return {
+            "total_seconds": time.perf_counter() - self.start_time,
+            "phases": {name: {"seconds": seconds, "calls": calls} for (name, (seconds, calls)) in self.phases.items()},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def print_report(self):
+        report = self.get_report()
+        print(f"Timings (total {report['total_seconds'] * 1000:.1f} ms):")
+        for (name, phase) in report["phases"].items():
+            print(f"  {name:<28} {phase['seconds'] * 1000:10.1f} ms {phase['calls']:8} calls")
+        for (name, value) in report["counters"].items():
+            print(f"  {name:<28} {value:10}")
+
+timings = Timings()
+
+def get_profile_report(profiler, profile_path):
+    import pstats
+    stats = pstats.Stats(profiler).stats
+    functions = []
+    for ((file_name, line, function_name), (primitive_calls, calls, total_time, cumulative_time, callers)) in stats.items():
+        functions.append({
+            "function": f"{file_name}:{line}({function_name})",
+            "calls": calls,
+            "total_seconds": total_time,
+            "cumulative_seconds": cumulative_time,
+        })
+    functions.sort(key=lambda x: x["cumulative_seconds"], reverse=True)
+    return {"path": profile_path, "functions": functions[:PROFILE_FUNCTIONS]}
+
+def run_instrumented(args, run):
+    timings.clear()
+    profiler = None
+    if args.profile_path is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        return run()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile_path)
+            print(f"Profile written to {args.profile_path}")
+        if args.timings:
+            timings.print_report()
+        if args.timings_path is not None:
+            report = timings.get_report()
+            if profiler is not None:
+                report["profile"] = get_profile_report(profiler, os.path.abspath(args.profile_path))
+            with open(args.timings_path, "w") as f:
+                json.dump(report, f, indent=2)
@@ -0,0 +1,131 @@
+import os
+import pytest
+from conv_package.cache import BackupStore
+from conv_package.project import ProjectInfo
+
+NUSPEC_NAMESPACE = "http://schemas.microsoft.com/packaging/2013/05/nuspec.xsd"
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="\n") as f:
+        f.write(content)
+
+def write_maui_nuspec(repo_path, package_id, dependencies=[]):
+    dependency_nodes = "".join(f'<dependency id="{x}" version="22.2.1" />' for x in dependencies)
+    write_file(os.path.join(repo_path, "nuspec", f"{package_id}.nuspec"), f'''<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="{NUSPEC_NAMESPACE}">
+  <metadata>
+    <id>{package_id}</id>
+    <version>22.2.1</version>
+    <dependencies>
+      <group targetFramework="net6.0-android31.0">{dependency_nodes}</group>
+      <group targetFramework="net6.0-ios15.4">{dependency_nodes}</group>
+    </dependencies>
+  </metadata>
+  <files>
+    <file src="..\\bin\\android\\{package_id}.dll" target="lib\\net6.0-android31.0\\{package_id}.dll" />
+    <file src="..\\bin\\ios\\{package_id}.dll" target="lib\\net6.0-ios15.4\\{package_id}.dll" />
+  </files>
+</package>
+''')
+
+def write_xamarin_nuspec(repo_path, package_id, dependencies=[]):
+    dependency_nodes = "".join(f'<dependency id="{x}" version="22.2.1" />' for x in dependencies)
+    write_file(os.path.join(repo_path, "nuspec", f"{package_id}.nuspec"), f'''<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="{NUSPEC_NAMESPACE}">
+  <metadata>
+    <id>{package_id}</id>
+    <version>22.2.1</version>
+    <dependencies>
+      <group>{dependency_nodes}</group>
+    </dependencies>
+    <references>
+      <group><reference file="{package_id}.dll" /></group>
+      <group targetFramework="MonoAndroid"><reference file="{package_id}.Android.dll" /></group>
+      <group targetFramework="Xamarin.iOS"><reference file="{package_id}.iOS.dll" /></group>
+    </references>
+  </metadata>
+  <files>
+    <file src="bin\\{package_id}.dll" target="lib\\netstandard2.0" />
+    <file src="bin\\{package_id}.Android.dll" target="lib\\MonoAndroid" />
+    <file src="bin\\{package_id}.iOS.dll" target="lib\\Xamarin.iOS" />
+  </files>
+</package>
+''')
+
+def write_reference_project(repo_path, folder, name):
+    path = os.path.join(repo_path, "xamarin", "maui", folder, f"{name}.csproj")
+    write_file(path, '<Project Sdk="Microsoft.NET.Sdk">\n</Project>\n')
+    return path
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    # cache files, indexes and backups of a test stay in its own folder
+    cache_path = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_path))
+    monkeypatch.setattr(ProjectInfo, "backup_store", BackupStore(str(cache_path / "conv" / "backups")))
+    return cache_path
+
+@pytest.fixture
+def repo(tmp_path):
+    repo_path = str(tmp_path / "repo")
+    write_maui_nuspec(repo_path, "DevExpress.Maui.Core")
+    write_maui_nuspec(repo_path, "DevExpress.Maui.Editors", ["DevExpress.Maui.Core"])
+    os.makedirs(os.path.join(repo_path, "scripts", "nuget"))
+    write_reference_project(repo_path, "Core", "DevExpress.Maui.Core")
+    return repo_path
+
+def write_maui_app(solution_path, packages):
+    package_nodes = "\n".join(f'    <PackageReference Include="{x}" Version="22.2.1" />' for x in packages)
+    path = os.path.join(solution_path, "App", "App.csproj")
+    write_file(path, f'''<Project Sdk="Microsoft.NET.Sdk">
+  <PropertyGroup>
+    <TargetFrameworks>net6.0-android;net6.0-ios</TargetFrameworks>
+    <OutputType>Exe</OutputType>
+    <UseMaui>true</UseMaui>
+  </PropertyGroup>
+  <ItemGroup>
+{package_nodes}
+  </ItemGroup>
+</Project>
+''')
+    return path
+
+def write_xamarin_solution(solution_path, packages):
+    # a netstandard common project with the packages and android and ios heads that reference it
+    package_nodes = "\n".join(f'    <PackageReference Include="{x}" Version="22.2.1" />' for x in packages)
+    write_file(os.path.join(solution_path, "App", "App.csproj"), f'''<Project Sdk="Microsoft.NET.Sdk">
+  <PropertyGroup>
+    <TargetFramework>netstandard2.0</TargetFramework>
+  </PropertyGroup>
+  <ItemGroup>
+{package_nodes}
+  </ItemGroup>
+</Project>
+''')
+    for (head, targets) in [("Android", "Xamarin.Android.CSharp.targets"), ("iOS", "Xamarin.iOS.CSharp.targets")]:
+        write_file(os.path.join(solution_path, f"App.{head}", f"App.{head}.csproj"), f'''<?xml version="1.0" encoding="utf-8"?>
+<Project ToolsVersion="15.0" xmlns="http://schemas.microsoft.com/developer/msbuild/2003">
+  <PropertyGroup>
+    <OutputType>Exe</OutputType>
+  </PropertyGroup>
+  <ItemGroup>
+    <Reference Include="System" />
+  </ItemGroup>
+  <ItemGroup>
+    <ProjectReference Include="..\\App\\App.csproj" />
+  </ItemGroup>
+  <Import Project="$(MSBuildExtensionsPath)\\Xamarin\\{targets}" />
+</Project>
+''')
+    return [os.path.join(solution_path, x, f"{x}.csproj") for x in ["App", "App.Android", "App.iOS"]]
+
+@pytest.fixture
+def xamarin_repo(repo):
+    # xamarin packages next to the maui ones, every assembly has its project under xamarin/maui
+    write_xamarin_nuspec(repo, "DevExpress.XamarinForms.Core")
+    write_xamarin_nuspec(repo, "DevExpress.XamarinForms.Editors", ["DevExpress.XamarinForms.Core"])
+    for package_id in ["DevExpress.XamarinForms.Core", "DevExpress.XamarinForms.Editors"]:
+        for name in [package_id, f"{package_id}.Android", f"{package_id}.iOS"]:
+            write_reference_project(repo, package_id, name)
+    return repo
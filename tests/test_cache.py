@@ -0,0 +1,87 @@
+import os
+import pickle
+from conftest import write_file
+from conv_package.cache import CACHE_VERSION, BackupStore, FileCache, write_file_atomic
+
+def set_mtime(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_lookup_after_store(tmp_path):
+    source_path = str(tmp_path / "a.nuspec")
+    write_file(source_path, "a")
+    cache = FileCache(str(tmp_path / "cache.pickle"))
+    assert cache.lookup(source_path) == (False, None)
+    cache.store(source_path, {"id": "A"})
+    assert cache.lookup(source_path) == (True, {"id": "A"})
+
+def test_changed_content_is_a_miss(tmp_path):
+    source_path = str(tmp_path / "a.nuspec")
+    write_file(source_path, "a")
+    cache = FileCache(str(tmp_path / "cache.pickle"))
+    cache.store(source_path, "A")
+    write_file(source_path, "b")
+    set_mtime(source_path, os.stat(source_path).st_mtime_ns + 1000)
+    assert cache.lookup(source_path) == (False, None)
+
+def test_same_content_with_new_mtime_is_a_hit(tmp_path):
+    source_path = str(tmp_path / "a.nuspec")
+    write_file(source_path, "a")
+    cache = FileCache(str(tmp_path / "cache.pickle"))
+    cache.store(source_path, "A")
+    cache.save()
+    set_mtime(source_path, os.stat(source_path).st_mtime_ns + 1000)
+    assert cache.lookup(source_path) == (True, "A")
+    # the entry takes the new mtime, the next run doesn't hash the file again
+    assert cache.is_dirty
+    assert cache.entries[source_path][0] == os.stat(source_path).st_mtime_ns
+
+def test_save_and_load(tmp_path):
+    source_path = str(tmp_path / "a.nuspec")
+    write_file(source_path, "a")
+    cache_path = str(tmp_path / "cache.pickle")
+    cache = FileCache(cache_path)
+    cache.store(source_path, "A")
+    cache.save()
+    assert not cache.is_dirty
+    assert FileCache(cache_path).lookup(source_path) == (True, "A")
+
+def test_other_version_and_broken_files_are_ignored(tmp_path, capsys):
+    cache_path = str(tmp_path / "cache.pickle")
+    with open(cache_path, "wb") as f:
+        pickle.dump((CACHE_VERSION - 1, {"a": (0, 0, "", b"")}), f)
+    assert FileCache(cache_path).entries == dict()
+    with open(cache_path, "wb") as f:
+        f.write(b"broken")
+    assert FileCache(cache_path).entries == dict()
+    assert "Ignore broken cache file" in capsys.readouterr().out
+
+def test_retain_drops_removed_files(tmp_path):
+    cache = FileCache(str(tmp_path / "cache.pickle"))
+    for name in ["a", "b"]:
+        write_file(str(tmp_path / name), name)
+        cache.store(str(tmp_path / name), name)
+    cache.save()
+    cache.retain([str(tmp_path / "b")])
+    assert list(cache.entries) == [str(tmp_path / "b")]
+    assert cache.is_dirty
+
+def test_write_file_atomic_keeps_mode(tmp_path):
+    path = str(tmp_path / "App.csproj")
+    write_file(path, "old")
+    os.chmod(path, 0o640)
+    write_file_atomic(path, b"new")
+    with open(path, "rb") as f:
+        assert f.read() == b"new"
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ["App.csproj"]
+
+def test_backups_are_stored_once_per_content(tmp_path):
+    store = BackupStore(str(tmp_path / "backups"))
+    path = str(tmp_path / "App.csproj")
+    first = store.backup(path, b"content")
+    second = store.backup(path, b"content")
+    store.backup(str(tmp_path / "Other.csproj"), b"other")
+    assert first == second
+    with open(first, "rb") as f:
+        assert f.read() == b"content"
+    assert [x[1] for x in store.get_backups(path)] == [first, first]
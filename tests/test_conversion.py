@@ -0,0 +1,129 @@
+import os
+import re
+import pytest
+from conftest import write_file, write_maui_app, write_reference_project, write_xamarin_solution
+import conv_package.conversion
+from conv_package.conv import build_parser
+from conv_package.conversion import build_package_storage, convert, prepare_solution
+
+@pytest.fixture
+def data_version_lookups(monkeypatch):
+    lookups = []
+    monkeypatch.setattr(conv_package.conversion, "find_data_package_version", lambda repo_path: lookups.append(repo_path) or "22.2.3")
+    return lookups
+
+def test_maui_solution_looks_up_data_version(repo, tmp_path, data_version_lookups):
+    write_maui_app(str(tmp_path / "sol"), ["DevExpress.Maui.Editors"])
+    (projects, data_package_version) = prepare_solution(str(tmp_path / "sol"), build_parser().parse_args(["-w", repo]), 1)
+    assert [len(x) for x in projects] == [0, 0, 0, 1]
+    assert (data_version_lookups, data_package_version) == ([repo], "22.2.3")
+
+@pytest.mark.parametrize("argv", [["--reverse"], []])
+def test_data_version_is_not_looked_up_without_maui_conversion(repo, tmp_path, data_version_lookups, argv):
+    solution_path = str(tmp_path / "sol")
+    if len(argv) > 0:
+        write_maui_app(solution_path, ["DevExpress.Maui.Editors"])
+    else:
+        write_file(os.path.join(solution_path, "Lib", "Lib.csproj"), '<Project Sdk="Microsoft.NET.Sdk">\n  <PropertyGroup>\n    <TargetFramework>net6.0</TargetFramework>\n  </PropertyGroup>\n</Project>\n')
+    (projects, data_package_version) = prepare_solution(solution_path, build_parser().parse_args(["-w", repo] + argv), 1)
+    assert (data_version_lookups, data_package_version) == ([], None)
+
+@pytest.mark.parametrize("jobs", ["1", "3"])
+def test_convert_maui_project(repo, tmp_path, monkeypatch, data_version_lookups, jobs):
+    write_reference_project(repo, "Editors", "DevExpress.Maui.Editors")
+    project_path = write_maui_app(str(tmp_path / "sol"), ["DevExpress.Maui.Editors"])
+    monkeypatch.chdir(tmp_path / "sol")
+    assert convert(build_parser().parse_args(["-w", repo, "-j", jobs])) == 0
+    with open(project_path) as f:
+        content = f.read()
+    assert 'PackageReference Include="DevExpress.Maui.Editors"' not in content
+    assert 'PackageReference Include="DevExpress.Data" Version="22.2.3"' in content
+    for (folder, name) in [("Core", "DevExpress.Maui.Core"), ("Editors", "DevExpress.Maui.Editors")]:
+        assert f'<ProjectReference Include="{os.path.join(repo, "xamarin", "maui", folder, name)}.csproj"/>' in content
+
+def test_worker_context_without_forkserver(monkeypatch):
+    # Windows has no forkserver, the nuspec workers use the default context there
+    monkeypatch.setattr(conv_package.conversion.multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+    assert conv_package.conversion.get_worker_context() is None
+
+def test_worker_context_with_forkserver(monkeypatch):
+    monkeypatch.setattr(conv_package.conversion.multiprocessing, "get_all_start_methods", lambda: ["fork", "spawn", "forkserver"])
+    assert conv_package.conversion.get_worker_context().get_start_method() == "forkserver"
+
+def read_file(path):
+    with open(path) as f:
+        return f.read()
+
+def get_items(content):
+    return sorted(re.findall(r'<(PackageReference|Reference|ProjectReference) Include="([^"]*)"', content))
+
+def get_reference_project_path(repo_path, package_id, name):
+    return os.path.join(repo_path, "xamarin", "maui", package_id, f"{name}.csproj")
+
+@pytest.mark.parametrize("jobs", ["1", "3"])
+def test_convert_xamarin_solution(xamarin_repo, tmp_path, monkeypatch, jobs):
+    (common_path, android_path, ios_path) = write_xamarin_solution(str(tmp_path / "sol"), ["DevExpress.XamarinForms.Editors"])
+    monkeypatch.chdir(tmp_path / "sol")
+    assert convert(build_parser().parse_args(["-w", xamarin_repo, "-j", jobs])) == 0
+    (common, android, ios) = [read_file(x) for x in [common_path, android_path, ios_path]]
+    for content in [common, android, ios]:
+        assert 'PackageReference Include="DevExpress.XamarinForms.Editors"' not in content
+        assert 'Include="None"' not in content
+    for (content, suffix) in [(common, ""), (android, ".Android"), (ios, ".iOS")]:
+        for package_id in ["DevExpress.XamarinForms.Core", "DevExpress.XamarinForms.Editors"]:
+            assert f'<ProjectReference Include="{get_reference_project_path(xamarin_repo, package_id, package_id + suffix)}"/>' in content
+    assert 'PackageReference Include="Xamarin.Kotlin.StdLib"' in android
+
+def test_xamarin_common_reference_without_project_is_skipped(xamarin_repo, tmp_path, monkeypatch, capsys):
+    os.remove(get_reference_project_path(xamarin_repo, "DevExpress.XamarinForms.Core", "DevExpress.XamarinForms.Core"))
+    (common_path, android_path, ios_path) = write_xamarin_solution(str(tmp_path / "sol"), ["DevExpress.XamarinForms.Editors"])
+    monkeypatch.chdir(tmp_path / "sol")
+    assert convert(build_parser().parse_args(["-w", xamarin_repo, "-j", "3"])) == 0
+    common = read_file(common_path)
+    assert "Can't find project for DevExpress.XamarinForms.Core " in capsys.readouterr().out
+    assert "DevExpress.XamarinForms.Core" not in common
+    assert f'<ProjectReference Include="{get_reference_project_path(xamarin_repo, "DevExpress.XamarinForms.Editors", "DevExpress.XamarinForms.Editors")}"/>' in common
+
+@pytest.mark.parametrize("argv", [[], ["-d"], ["-p"]])
+def test_reverse_xamarin_solution(xamarin_repo, tmp_path, monkeypatch, argv):
+    project_paths = write_xamarin_solution(str(tmp_path / "sol"), ["DevExpress.XamarinForms.Editors"])
+    original = [read_file(x) for x in project_paths]
+    monkeypatch.chdir(tmp_path / "sol")
+    assert convert(build_parser().parse_args(["-w", xamarin_repo, "-j", "3"] + argv)) == 0
+    assert [read_file(x) for x in project_paths] != original
+    assert convert(build_parser().parse_args(["-w", xamarin_repo, "-j", "3", "--reverse"])) == 0
+    (common, android, ios) = [read_file(x) for x in project_paths]
+    assert get_items(common) == get_items(original[0])
+    # the heads get the package of the common project, their own references are kept
+    for (content, original_content) in [(android, original[1]), (ios, original[2])]:
+        assert get_items(content) == [("PackageReference", "DevExpress.XamarinForms.Editors")] + get_items(original_content)
+        assert "<HintPath>" not in content
+        assert content.count("<ItemGroup") == original_content.count("<ItemGroup") + 1
+
+def test_batch_workers_split_jobs(repo, tmp_path, monkeypatch, data_version_lookups):
+    write_reference_project(repo, "Editors", "DevExpress.Maui.Editors")
+    for name in ["sol1", "sol2"]:
+        write_maui_app(str(tmp_path / "batch" / name), ["DevExpress.Maui.Editors"])
+        write_file(str(tmp_path / "batch" / name / f"{name}.sln"), "")
+    worker_jobs = []
+    convert_solution_job = conv_package.conversion.convert_solution
+    monkeypatch.setattr(conv_package.conversion, "convert_solution", lambda solution_dir, package_storage, args, prepared=None: worker_jobs.append(args.jobs) or convert_solution_job(solution_dir, package_storage, args, prepared))
+    monkeypatch.setattr(conv_package.conversion, "ProcessPoolExecutor", lambda max_workers, initializer, initargs, **kwargs: InlineExecutor(initializer, initargs))
+    args = build_parser().parse_args(["-w", repo, "-j", "5", "--batch", str(tmp_path / "batch")])
+    assert conv_package.conversion.convert_batch(args, build_package_storage(args), str(tmp_path)) == 0
+    assert worker_jobs == [2, 2]
+    assert args.jobs == 5
+
+class InlineExecutor:
+    # runs the batch jobs in this process, the worker state is set up like in a pool process
+    def __init__(self, initializer, initargs):
+        initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def map(self, job, items):
+        return [job(x) for x in items]
@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import pytest
+from conftest import write_file, write_maui_nuspec, write_reference_project
+import conv_package.conversion
+import conv_package.daemon
+from conv_package.conv import build_parser, main
+from conv_package.conversion import create_package_builder
+from conv_package.daemon import ConvDaemon
+from conv_package.package import PackageStorage
+
+def get_project_references(daemon, package_id):
+    return daemon.package_storage.package_info_list[package_id].android_project_references
+
+def test_refresh_finds_added_project(repo):
+    daemon = ConvDaemon(build_parser().parse_args(["-w", repo, "-j", "1"]))
+    assert get_project_references(daemon, "DevExpress.Maui.Editors") == dict()
+    project_path = write_reference_project(repo, "Editors", "DevExpress.Maui.Editors")
+    daemon.refresh()
+    assert get_project_references(daemon, "DevExpress.Maui.Editors") == {"DevExpress.Maui.Editors": project_path}
+
+def test_refresh_follows_moved_project(repo):
+    daemon = ConvDaemon(build_parser().parse_args(["-w", repo, "-j", "1"]))
+    old_path = os.path.join(repo, "xamarin", "maui", "Core", "DevExpress.Maui.Core.csproj")
+    assert get_project_references(daemon, "DevExpress.Maui.Core") == {"DevExpress.Maui.Core": old_path}
+    new_path = os.path.join(repo, "xamarin", "maui", "Moved", "DevExpress.Maui.Core.csproj")
+    os.makedirs(os.path.dirname(new_path))
+    os.replace(old_path, new_path)
+    daemon.refresh()
+    assert get_project_references(daemon, "DevExpress.Maui.Core") == {"DevExpress.Maui.Core": new_path}
+
+def test_refresh_keeps_index_without_changes(repo, capsys):
+    daemon = ConvDaemon(build_parser().parse_args(["-w", repo, "-j", "1"]))
+    package_storage = daemon.package_storage
+    capsys.readouterr()
+    daemon.refresh()
+    assert daemon.package_storage is package_storage
+    assert "Reload" not in capsys.readouterr().out
+
+def write_bundle(repo_path, name, package_id, source, target):
+    write_file(os.path.join(repo_path, "scripts", "nuget", f"{name}.json"), json.dumps({"bundle": {"id": package_id, "components": [{"source": source, "target": target}]}}))
+
+def get_package_states(packages):
+    return dict((package_id, package.__getstate__()) for (package_id, package) in packages.items())
+
+def assert_matches_full_build(daemon, repo):
+    packages = create_package_builder(build_parser().parse_args(["-w", repo, "-j", "1", "--no-cache"])).build_packages()
+    assert get_package_states(daemon.package_storage.package_info_list) == get_package_states(packages)
+    assert daemon.package_storage.dependency_graph.closures == PackageStorage(packages).dependency_graph.closures
+
+def test_refresh_matches_full_build(repo):
+    daemon = ConvDaemon(build_parser().parse_args(["-w", repo, "-j", "1"]))
+    write_maui_nuspec(repo, "DevExpress.Maui.Grid", ["DevExpress.Maui.Editors"])
+    daemon.refresh()
+    assert_matches_full_build(daemon, repo)
+    write_bundle(repo, "core", "DevExpress.Maui.Core", "bin/Release/DevExpress.Maui.Core.dll", ".\\..\\bin\\android\\DevExpress.Maui.Core.dll")
+    daemon.refresh()
+    assert daemon.package_storage.package_info_list["DevExpress.Maui.Core"].android_references["DevExpress.Maui.Core"] == os.path.join(repo, "bin/Release/DevExpress.Maui.Core.dll")
+    assert_matches_full_build(daemon, repo)
+    write_bundle(repo, "core", "DevExpress.Maui.Editors", "bin/Release/DevExpress.Maui.Editors.dll", ".\\..\\bin\\ios\\DevExpress.Maui.Editors.dll")
+    daemon.refresh()
+    assert_matches_full_build(daemon, repo)
+    write_maui_nuspec(repo, "DevExpress.Maui.Core", ["DevExpress.Maui.Grid"])
+    os.remove(os.path.join(repo, "scripts", "nuget", "core.json"))
+    daemon.refresh()
+    assert_matches_full_build(daemon, repo)
+    os.remove(os.path.join(repo, "nuspec", "DevExpress.Maui.Grid.nuspec"))
+    daemon.refresh()
+    assert "DevExpress.Maui.Grid" not in daemon.package_storage.package_info_list
+    assert_matches_full_build(daemon, repo)
+
+def test_refresh_keeps_unaffected_resolutions(repo, capsys):
+    write_maui_nuspec(repo, "DevExpress.Maui.Charts")
+    daemon = ConvDaemon(build_parser().parse_args(["-w", repo, "-j", "1"]))
+    package_storage = daemon.package_storage
+    charts = package_storage.resolve_references(["DevExpress.Maui.Charts"])
+    package_storage.resolve_references(["DevExpress.Maui.Editors"])
+    charts_closure = package_storage.dependency_graph.get_closure("DevExpress.Maui.Charts")
+    write_maui_nuspec(repo, "DevExpress.Maui.Core", ["DevExpress.Maui.Grid"])
+    daemon.refresh()
+    assert "Reload packages DevExpress.Maui.Core, changed files: 1, dropped closures: 2" in capsys.readouterr().out
+    assert daemon.package_storage is package_storage
+    assert package_storage.resolve_references(["DevExpress.Maui.Charts"]) is charts
+    assert list(package_storage.resolved_references) == [("DevExpress.Maui.Charts",)]
+    assert package_storage.dependency_graph.get_closure("DevExpress.Maui.Charts") is charts_closure
+    assert package_storage.get_dependent_packages("DevExpress.Maui.Editors") == {"DevExpress.Maui.Core", "DevExpress.Maui.Grid"}
+
+@pytest.mark.parametrize("argv", [["--index", "index.sqlite"], ["--no-cache"]])
+def test_index_options_are_not_sent_to_daemon(repo, tmp_path, monkeypatch, argv):
+    monkeypatch.setattr(conv_package.daemon, "run_in_daemon", lambda args, argv: pytest.fail("sent to the daemon"))
+    monkeypatch.setattr(conv_package.conversion, "convert", lambda args: 0)
+    monkeypatch.setattr(sys, "argv", ["conv", "-w", repo, "-j", "1"] + argv)
+    monkeypatch.chdir(tmp_path)
+    assert main() == 0
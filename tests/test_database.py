@@ -0,0 +1,61 @@
+import os
+from conftest import write_maui_nuspec, write_reference_project
+from conv_package.conv import build_parser
+from conv_package.conversion import build_package_storage, create_package_builder
+from conv_package.database import PackageDatabase
+
+def build_index(repo, index_path):
+    builder = create_package_builder(build_parser().parse_args(["-w", repo, "-j", "1"]))
+    packages = builder.build_packages()
+    builder.export_index(packages, index_path)
+    return (builder, packages)
+
+def load_index(repo, index_path):
+    return create_package_builder(build_parser().parse_args(["-w", repo, "-j", "1"])).load_index(index_path)
+
+def test_loaded_packages_match_built_ones(xamarin_repo, tmp_path):
+    index_path = str(tmp_path / "index.sqlite")
+    (builder, packages) = build_index(xamarin_repo, index_path)
+    loaded = load_index(xamarin_repo, index_path)
+    assert list(loaded) == list(packages)
+    assert loaded["DevExpress.XamarinForms.Core"].project_references == {"DevExpress.XamarinForms.Core": os.path.join(xamarin_repo, "xamarin", "maui", "DevExpress.XamarinForms.Core", "DevExpress.XamarinForms.Core.csproj")}
+    for (package_id, package) in packages.items():
+        assert loaded[package_id].__getstate__() == package.__getstate__()
+
+def test_index_is_stale_after_nuspec_change(repo, tmp_path):
+    index_path = str(tmp_path / "index.sqlite")
+    build_index(repo, index_path)
+    nuspec_path = os.path.join(repo, "nuspec", "DevExpress.Maui.Core.nuspec")
+    stat = os.stat(nuspec_path)
+    os.utime(nuspec_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert load_index(repo, index_path) is None
+
+def test_index_is_stale_after_new_package(repo, tmp_path):
+    index_path = str(tmp_path / "index.sqlite")
+    build_index(repo, index_path)
+    write_maui_nuspec(repo, "DevExpress.Maui.Grid")
+    assert load_index(repo, index_path) is None
+
+def test_index_is_stale_after_project_added(repo, tmp_path):
+    index_path = str(tmp_path / "index.sqlite")
+    build_index(repo, index_path)
+    assert load_index(repo, index_path) is not None
+    project_path = write_reference_project(repo, "Editors", "DevExpress.Maui.Editors")
+    assert load_index(repo, index_path) is None
+    args = build_parser().parse_args(["-w", repo, "-j", "1", "--index", index_path])
+    package_storage = build_package_storage(args)
+    assert package_storage.package_info_list["DevExpress.Maui.Editors"].android_project_references == {"DevExpress.Maui.Editors": project_path}
+    assert load_index(repo, index_path)["DevExpress.Maui.Editors"].android_project_references == {"DevExpress.Maui.Editors": project_path}
+
+def test_queries(repo, tmp_path):
+    index_path = str(tmp_path / "index.sqlite")
+    build_index(repo, index_path)
+    database = PackageDatabase(index_path)
+    try:
+        assert database.find_package("devexpress.maui.core") == "DevExpress.Maui.Core"
+        assert database.get_closure("DevExpress.Maui.Editors") == ["DevExpress.Maui.Core"]
+        assert database.get_dependents("DevExpress.Maui.Core") == ["DevExpress.Maui.Editors"]
+        owners = database.find_owners("DevExpress.Maui.Core.dll", "android")
+        assert [(x[0], x[1], x[4]) for x in owners] == [("DevExpress.Maui.Core", "android", os.path.join(repo, "xamarin", "maui", "Core", "DevExpress.Maui.Core.csproj"))]
+    finally:
+        database.close()
@@ -0,0 +1,115 @@
+import os
+from conftest import write_file
+from conv_package.discovery import DirectoryIndex, find_project_files, read_solution_projects, walk_files
+from conv_package.timings import timings
+
+PROJECT = '<Project Sdk="Microsoft.NET.Sdk">\n</Project>\n'
+
+SOLUTION = '''
+Microsoft Visual Studio Solution File, Format Version 12.00
+Project("{2150E333-8FDC-42A3-9474-1A3956D46DE8}") = "Shared", "Shared", "{8F1A0B2C-0000-0000-0000-000000000001}"
+EndProject
+Project("{9A19103F-16F7-4668-BE54-9A1E7A4F7556}") = "App", "App\\App.csproj", "{8F1A0B2C-0000-0000-0000-000000000002}"
+EndProject
+Project("{9A19103F-16F7-4668-BE54-9A1E7A4F7556}") = "Core", "..\\libs\\Core\\Core.csproj", "{8F1A0B2C-0000-0000-0000-000000000003}"
+EndProject
+Project("{F184B08F-C81C-45F6-A57F-5ABD9991F28F}") = "Legacy", "Legacy\\Legacy.vbproj", "{8F1A0B2C-0000-0000-0000-000000000004}"
+EndProject
+Project("{9A19103F-16F7-4668-BE54-9A1E7A4F7556}") = "Missing", "Missing\\Missing.csproj", "{8F1A0B2C-0000-0000-0000-000000000005}"
+EndProject
+Global
+EndGlobal
+'''
+
+def write_projects(root, paths):
+    for path in paths:
+        write_file(os.path.join(root, *path.split("/")), PROJECT)
+
+def set_mtimes(root, mtime_ns):
+    # older than the mtime resolution window, so the listings are reused
+    for (current_dir, _, _) in os.walk(root):
+        os.utime(current_dir, ns=(mtime_ns, mtime_ns))
+
+def test_solution_projects(tmp_path):
+    solution_dir = str(tmp_path / "solution")
+    write_projects(str(tmp_path), ["solution/App/App.csproj", "libs/Core/Core.csproj", "solution/Legacy/Legacy.vbproj", "solution/Other/Other.csproj"])
+    write_file(os.path.join(solution_dir, "App.sln"), SOLUTION)
+    # solution folders, other project types and missing projects are skipped, paths outside the solution directory are kept
+    assert read_solution_projects(os.path.join(solution_dir, "App.sln")) == [
+        os.path.join(solution_dir, "App", "App.csproj"), os.path.join(str(tmp_path), "libs", "Core", "Core.csproj")]
+    assert read_solution_projects(os.path.join(solution_dir, "App.sln"), ".vbproj") == [os.path.join(solution_dir, "Legacy", "Legacy.vbproj")]
+
+def test_projects_of_all_solutions(tmp_path):
+    solution_dir = str(tmp_path / "solution")
+    write_projects(str(tmp_path), ["solution/App/App.csproj", "libs/Core/Core.csproj", "solution/Other/Other.csproj"])
+    write_file(os.path.join(solution_dir, "B.sln"), SOLUTION)
+    write_file(os.path.join(solution_dir, "A.sln"), SOLUTION.replace("App\\App.csproj", "Other\\Other.csproj"))
+    assert find_project_files(solution_dir) == [os.path.join(solution_dir, "Other", "Other.csproj"),
+        os.path.join(str(tmp_path), "libs", "Core", "Core.csproj"), os.path.join(solution_dir, "App", "App.csproj")]
+
+def test_walk_without_solution(tmp_path):
+    root = str(tmp_path)
+    write_projects(root, ["App/App.csproj", "App/bin/Debug/Copy.csproj", "App/OBJ/Copy.csproj", "node_modules/x/X.csproj",
+        "Samples/Sample.csproj", "src/Samples/Nested.csproj", "src/Lib/Lib.csproj", "src/Lib/Lib.Tests.csproj", "Tools/Tool.csproj"])
+    write_file(os.path.join(root, ".convignore"), "# samples only at the top level\n/Samples/\n*.Tests.csproj\n\nTools\n")
+    assert find_project_files(root) == [os.path.join(root, "App", "App.csproj"),
+        os.path.join(root, "src", "Lib", "Lib.csproj"), os.path.join(root, "src", "Samples", "Nested.csproj")]
+    # directories in name order, pruned ones are never entered
+    assert walk_files(root, ".csproj", ignore_file_name="none") == [os.path.join(root, *x.split("/")) for x in
+        ["App/App.csproj", "Samples/Sample.csproj", "Tools/Tool.csproj", "src/Lib/Lib.Tests.csproj", "src/Lib/Lib.csproj", "src/Samples/Nested.csproj"]]
+
+def test_directory_index_lists_changed_directories_only(tmp_path):
+    root = str(tmp_path / "root")
+    cache_path = str(tmp_path / "index.cache")
+    write_projects(root, ["A/A.csproj", "B/B.csproj", "B/C/C.csproj"])
+    mtime_ns = os.stat(root).st_mtime_ns - 60 * 1000 * 1000 * 1000
+    set_mtimes(root, mtime_ns)
+    expected = walk_files(root, ".csproj")
+    timings.clear()
+    index = DirectoryIndex(cache_path)
+    assert index.walk_files(root, ".csproj") == expected
+    assert timings.counters["directories_listed"] == 4
+    index.save()
+
+    # a new file in B/C changes only its mtime
+    timings.clear()
+    write_file(os.path.join(root, "B", "C", "D.csproj"), PROJECT)
+    os.utime(os.path.join(root, "B", "C"), ns=(mtime_ns + 1, mtime_ns + 1))
+    index = DirectoryIndex(cache_path)
+    assert index.walk_files(root, ".csproj") == walk_files(root, ".csproj")
+    assert (timings.counters["directories_listed"], timings.counters["directories_reused"]) == (1, 3)
+    index.save()
+
+    # a removed directory is dropped with its subtree
+    timings.clear()
+    os.remove(os.path.join(root, "A", "A.csproj"))
+    os.rmdir(os.path.join(root, "A"))
+    os.utime(root, ns=(mtime_ns + 2, mtime_ns + 2))
+    index = DirectoryIndex(cache_path)
+    assert index.walk_files(root, ".csproj") == [os.path.join(root, "B", "B.csproj"), os.path.join(root, "B", "C", "C.csproj"), os.path.join(root, "B", "C", "D.csproj")]
+    assert (timings.counters["directories_listed"], timings.counters["directories_reused"]) == (1, 2)
+
+def test_directory_index_relists_recent_directories(tmp_path):
+    root = str(tmp_path / "root")
+    write_projects(root, ["A/A.csproj"])
+    index = DirectoryIndex(str(tmp_path / "index.cache"))
+    index.walk_files(root, ".csproj")
+    # changed within the mtime resolution: a file added with the same mtime must still be found
+    write_file(os.path.join(root, "A", "B.csproj"), PROJECT)
+    os.utime(os.path.join(root, "A"), ns=(os.stat(root).st_mtime_ns, os.stat(root).st_mtime_ns))
+    timings.clear()
+    assert index.walk_files(root, ".csproj") == [os.path.join(root, "A", "A.csproj"), os.path.join(root, "A", "B.csproj")]
+    assert timings.counters["directories_listed"] == 2
+
+def test_directory_index_settings_change(tmp_path):
+    root = str(tmp_path / "root")
+    write_projects(root, ["A/A.csproj", "B/B.csproj"])
+    set_mtimes(root, os.stat(root).st_mtime_ns - 60 * 1000 * 1000 * 1000)
+    index = DirectoryIndex(str(tmp_path / "index.cache"))
+    assert index.walk_files(root, ".csproj") == [os.path.join(root, "A", "A.csproj"), os.path.join(root, "B", "B.csproj")]
+    # the listings of the old ignore patterns aren't reused
+    mtime_ns = os.stat(root).st_mtime_ns
+    write_file(os.path.join(root, ".convignore"), "B\n")
+    os.utime(root, ns=(mtime_ns, mtime_ns))
+    assert index.walk_files(root, ".csproj") == [os.path.join(root, "A", "A.csproj")]
+    assert index.walk_files(root, ".csproj", prune_dirs=["a"]) == []
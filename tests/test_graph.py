@@ -0,0 +1,58 @@
+import random
+import pytest
+from conv_package.graph import DependencyCycleError, DependencyGraph
+
+def test_closures():
+    graph = DependencyGraph({"A": ["B", "C"], "B": ["C"], "C": [], "D": ["A", "External"]})
+    assert graph.get_closure("A") == {"B", "C"}
+    assert graph.get_closure("C") == frozenset()
+    # dependencies outside the repository are kept, but have no closure of their own
+    assert graph.get_closure("D") == {"A", "B", "C", "External"}
+    assert graph.get_closure("Unknown") == frozenset()
+    assert graph.topological_order.index("C") < graph.topological_order.index("B") < graph.topological_order.index("A")
+    assert graph.get_cycles() == []
+
+def test_cycles():
+    graph = DependencyGraph({"A": ["B"], "B": ["C"], "C": ["A"], "D": ["A"], "E": ["E"], "F": []})
+    assert graph.get_cycles() == [["A", "B", "C", "A"], ["E", "E"]]
+    assert graph.get_closure("F") == frozenset()
+    with pytest.raises(DependencyCycleError) as error:
+        graph.get_closure("B")
+    assert error.value.cycle == ["B", "C", "A", "B"]
+    assert str(error.value) == "Dependency cycle detected: B -> C -> A -> B"
+    # a package that depends on a cycle reports the cycle it reaches
+    with pytest.raises(DependencyCycleError) as error:
+        graph.get_closure("D")
+    assert error.value.cycle == ["A", "B", "C", "A"]
+
+def get_state(graph):
+    return (graph.closures, graph.cyclic_packages, graph.get_cycles())
+
+def test_update_rebuilds_dependents_only():
+    graph = DependencyGraph({"A": ["B"], "B": ["C"], "C": [], "D": []})
+    closure_d = graph.get_closure("D")
+    assert graph.update({"C": ["D"]}) == {"A", "B", "C"}
+    assert graph.get_closure("A") == {"B", "C", "D"}
+    assert graph.get_closure("D") is closure_d
+    assert graph.update({"E": ["A"], "D": None}) == {"A", "B", "C", "D", "E"}
+    assert graph.get_closure("E") == {"A", "B", "C", "D"}
+    # a cycle made by an update is reported like one found by a full build
+    assert graph.update({"C": ["A"]}) == {"A", "B", "C", "E"}
+    assert get_state(graph) == get_state(DependencyGraph({"A": ["B"], "B": ["C"], "C": ["A"], "E": ["A"]}))
+    assert graph.update({"C": []}) == {"A", "B", "C", "E"}
+    assert graph.get_closure("E") == {"A", "B", "C"}
+
+def test_update_matches_full_build():
+    rng = random.Random(1)
+    package_ids = [f"P{x}" for x in range(12)]
+    dependencies = dict((x, rng.sample(package_ids, rng.randint(0, 3))) for x in package_ids[:8])
+    graph = DependencyGraph(dict(dependencies))
+    for _ in range(200):
+        package_id = rng.choice(package_ids)
+        package_dependencies = None if rng.random() < 0.2 else rng.sample(package_ids, rng.randint(0, 3))
+        graph.update({package_id: package_dependencies})
+        if package_dependencies is None:
+            dependencies.pop(package_id, None)
+        else:
+            dependencies[package_id] = package_dependencies
+        assert get_state(graph) == get_state(DependencyGraph(dict(dependencies)))
@@ -0,0 +1,59 @@
+import os
+import threading
+from conftest import write_file
+from conv_package.msbuild import DocumentCache, PropertyEvaluator
+
+def write_props(path, properties, imports=[]):
+    import_nodes = "".join(f'  <Import Project="{x}" />\n' for x in imports)
+    property_nodes = "".join(f"    <{name}>{value}</{name}>\n" for (name, value) in properties.items())
+    write_file(path, f"<Project>\n{import_nodes}  <PropertyGroup>\n{property_nodes}  </PropertyGroup>\n</Project>\n")
+    return path
+
+def touch(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+def test_own_properties_then_imports_then_directory_props(tmp_path):
+    write_props(str(tmp_path / "Directory.Build.props"), {"A": "dir", "B": "dir", "C": "dir"})
+    write_props(str(tmp_path / "src" / "Common.props"), {"A": "import", "B": "import"})
+    project_path = write_props(str(tmp_path / "src" / "App.csproj"), {"A": "own"}, ["Common.props"])
+    evaluator = PropertyEvaluator(DocumentCache())
+    assert [evaluator.get_property(project_path, x) for x in ["A", "B", "C", "D"]] == [["own"], ["import"], ["dir"], None]
+
+def test_changed_import_is_evaluated_again(tmp_path):
+    props_path = write_props(str(tmp_path / "Common.props"), {"DevExpress_Data": "22.2.1"})
+    project_path = write_props(str(tmp_path / "App.csproj"), {}, ["Common.props"])
+    evaluator = PropertyEvaluator(DocumentCache())
+    assert evaluator.get_property(project_path, "DevExpress_Data") == ["22.2.1"]
+    write_props(props_path, {"DevExpress_Data": "22.2.3"})
+    touch(props_path)
+    assert evaluator.get_property(project_path, "DevExpress_Data") == ["22.2.3"]
+
+def test_added_directory_props_is_found(tmp_path):
+    write_props(str(tmp_path / "Directory.Build.props"), {"DevExpress_Data": "outer"})
+    project_path = write_props(str(tmp_path / "src" / "App" / "App.csproj"), {})
+    evaluator = PropertyEvaluator(DocumentCache())
+    assert evaluator.get_property(project_path, "DevExpress_Data") == ["outer"]
+    write_props(str(tmp_path / "src" / "Directory.Build.props"), {"DevExpress_Data": "inner"})
+    assert evaluator.get_property(project_path, "DevExpress_Data") == ["inner"]
+
+def test_import_cycle(tmp_path):
+    write_props(str(tmp_path / "A.props"), {"A": "a"}, ["B.props"])
+    write_props(str(tmp_path / "B.props"), {"B": "b"}, ["A.props"])
+    project_path = write_props(str(tmp_path / "App.csproj"), {}, ["A.props"])
+    evaluator = PropertyEvaluator(DocumentCache())
+    assert (evaluator.get_property(project_path, "A"), evaluator.get_property(project_path, "B")) == (["a"], ["b"])
+
+def test_threads_share_evaluator(tmp_path):
+    write_props(str(tmp_path / "Directory.Build.props"), {"Shared": "yes"})
+    project_paths = [write_props(str(tmp_path / f"P{i}" / f"P{i}.csproj"), {"Name": f"P{i}"}, ["../Directory.Build.props"]) for i in range(20)]
+    evaluator = PropertyEvaluator(DocumentCache())
+    results = dict()
+    def run(project_path):
+        results[project_path] = (evaluator.get_property(project_path, "Name"), evaluator.get_property(project_path, "Shared"))
+    threads = [threading.Thread(target=run, args=(x,)) for x in project_paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == dict((x, ([os.path.basename(x)[:-len(".csproj")]], ["yes"])) for x in project_paths)
@@ -0,0 +1,143 @@
+import os
+import pickle
+import random
+import sys
+import pytest
+from conftest import write_maui_nuspec, write_reference_project
+from conv_package.conv import build_parser
+from conv_package.conversion import build_package_storage, create_package_builder
+from conv_package.discovery import find_reference_projects
+from conv_package.package import MauiPackageInfo, ReferenceInfo
+
+@pytest.fixture
+def package_storage(repo):
+    write_maui_nuspec(repo, "DevExpress.Maui.Grid", ["DevExpress.Maui.Core"])
+    for name in ["Editors", "Grid"]:
+        write_reference_project(repo, name, f"DevExpress.Maui.{name}")
+    return build_package_storage(build_parser().parse_args(["-w", repo, "-j", "1"]))
+
+def test_packages_to_remove_keep_project_order(package_storage):
+    first = package_storage.resolve_references(["DevExpress.Maui.Grid", "DevExpress.Maui.Editors"])
+    second = package_storage.resolve_references(["DevExpress.Maui.Editors", "DevExpress.Maui.Grid"])
+    assert first.packages_to_remove == ["DevExpress.Maui.Grid", "DevExpress.Maui.Editors"]
+    assert second.packages_to_remove == ["DevExpress.Maui.Editors", "DevExpress.Maui.Grid"]
+    # the package set is resolved once
+    assert second.android_references is first.android_references
+    assert sorted(x.reference for x in first.android_references) == ["DevExpress.Maui.Core", "DevExpress.Maui.Editors", "DevExpress.Maui.Grid"]
+    # packages the repository doesn't build stay in the project
+    assert package_storage.resolve_references(["Newtonsoft.Json", "DevExpress.Maui.Core"]).packages_to_remove == ["DevExpress.Maui.Core"]
+
+def test_maui_partitions_keep_project_order(package_storage):
+    (common, android, ios, packages_to_remove) = package_storage.find_maui_partitions(["DevExpress.Maui.Grid", "DevExpress.Maui.Editors"])
+    assert packages_to_remove == ["DevExpress.Maui.Grid", "DevExpress.Maui.Editors"]
+    assert sorted(x.reference for x in common) == ["DevExpress.Maui.Core", "DevExpress.Maui.Editors", "DevExpress.Maui.Grid"]
+    (_, _, _, packages_to_remove) = package_storage.find_maui_partitions(["DevExpress.Maui.Editors", "DevExpress.Maui.Grid"])
+    assert packages_to_remove == ["DevExpress.Maui.Editors", "DevExpress.Maui.Grid"]
+
+def set_reference_path_by_scan(references, logical_reference_path, reference_path):
+    # the dict scan the slot index replaces: the first match of every platform is rewritten
+    result = False
+    for platform in ["android", "ios", "common"]:
+        for reference in references[platform]:
+            if references[platform][reference] == logical_reference_path:
+                references[platform][reference] = reference_path
+                result = True
+                break
+    return result
+
+def get_references(package):
+    return dict((x, dict(package.get_platform_references(x))) for x in MauiPackageInfo.platforms)
+
+def test_reference_slots_match_dict_scan():
+    random.seed(4)
+    for _ in range(50):
+        package = MauiPackageInfo("DevExpress.Maui.Core")
+        paths = [f"bin/{x}.dll" for x in range(4)]
+        for _ in range(12):
+            platform = random.choice(MauiPackageInfo.platforms)
+            package.set_reference_slot(platform, f"Assembly{random.randrange(6)}", random.choice(paths))
+        expected = get_references(package)
+        for index in range(12):
+            if random.random() < 0.3:
+                # a reference added while the slots are built moves to its new slot
+                platform = random.choice(MauiPackageInfo.platforms)
+                (reference, path) = (f"Assembly{random.randrange(6)}", random.choice(paths))
+                package.set_reference_slot(platform, reference, path)
+                expected[platform][reference] = path
+                continue
+            (logical_path, path) = (random.choice(paths), random.choice(paths + [f"/out/{index}.dll"]))
+            assert package.set_reference_path(logical_path, path) == set_reference_path_by_scan(expected, logical_path, path)
+            assert get_references(package) == expected
+        slots = dict((key, sorted(value)) for (key, value) in package.reference_slots.items())
+        package.reference_slots = None
+        assert slots == dict((key, sorted(value)) for (key, value) in package.get_reference_slots().items())
+
+def test_reference_projects_from_directory_index(repo, capsys):
+    duplicate = write_reference_project(repo, "Other", "DevExpress.Maui.Core")
+    args = build_parser().parse_args(["-w", repo, "-j", "1"])
+    packages = create_package_builder(args).build_packages()
+    first = packages["DevExpress.Maui.Core"].android_project_references["DevExpress.Maui.Core"]
+    assert first.endswith(os.path.join("Core", "DevExpress.Maui.Core.csproj"))
+    assert f"Duplicate project name DevExpress.Maui.Core, use {first}, skip {duplicate}" in capsys.readouterr().out
+    # the next build reads the saved listings and still sees a project added since
+    project_path = write_reference_project(repo, "Editors", "DevExpress.Maui.Editors")
+    builder = create_package_builder(args)
+    assert len(builder.project_index.roots) == 1
+    assert builder.find_reference_projects() == find_reference_projects(repo)
+    packages = builder.build_packages()
+    assert packages["DevExpress.Maui.Editors"].android_project_references == {"DevExpress.Maui.Editors": project_path}
+    assert packages["DevExpress.Maui.Core"].android_project_references["DevExpress.Maui.Core"] == first
+
+def is_interned(value):
+    return type(value) is str and sys.intern(value) is value
+
+def test_package_records_are_slotted_and_interned(package_storage):
+    package = package_storage.package_info_list["DevExpress.Maui.Grid"]
+    assert not hasattr(package, "__dict__")
+    assert not hasattr(ReferenceInfo("Core", "Core.dll", None), "__dict__")
+    values = [package.id, *package.android_dependencies, *package.ios_dependencies]
+    for references in [package.android_references, package.ios_references, package.android_project_references]:
+        values.extend(references)
+        values.extend(references.values())
+    assert len(values) > 4 and all(is_interned(x) for x in values)
+    # frozen once the bundles are applied
+    assert type(package.android_dependencies) is tuple and package.reference_slots is None
+    # the records are shared until the references change
+    infos = package.get_platform_reference_infos("android")
+    assert infos is package.get_platform_reference_infos("android")
+    loaded = pickle.loads(pickle.dumps(package))
+    assert loaded.id is package.id
+    assert all(is_interned(x) for x in list(loaded.android_references) + list(loaded.android_references.values()))
+    assert loaded.get_platform_reference_infos("android") == infos
+    loaded.add_android_reference("DevExpress.Maui.Charts", "/repo/bin/DevExpress.Maui.Charts.dll")
+    assert [x.reference for x in loaded.get_platform_reference_infos("android")] == [x.reference for x in infos] + ["DevExpress.Maui.Charts"]
+    with pytest.raises(AttributeError):
+        infos[0].project_path = None
+
+def split_references_by_nested_loop(android_references, ios_references):
+    # the android x ios loop the hash join replaces
+    common_references = set()
+    android_references = set(android_references)
+    ios_references = set(ios_references)
+    android_references_to_remove = set()
+    ios_references_to_remove = set()
+    for android_ref in android_references:
+        for ios_ref in ios_references:
+            if android_ref.project_path == ios_ref.project_path:
+                common_references.add(android_ref)
+                android_references_to_remove.add(android_ref)
+                ios_references_to_remove.add(ios_ref)
+    return (common_references, android_references - android_references_to_remove, ios_references - ios_references_to_remove)
+
+def get_records(references):
+    return sorted((x.reference, x.path, x.project_path or "") for x in references)
+
+def test_split_references_match_nested_loop(package_storage):
+    random.seed(22)
+    projects = [None] + [f"/repo/xamarin/maui/{x}/{x}.csproj" for x in range(5)]
+    for _ in range(100):
+        android_references = set(ReferenceInfo(f"A{x}", f"/repo/bin/android/A{x}.dll", random.choice(projects)) for x in range(random.randrange(8)))
+        ios_references = set(ReferenceInfo(f"I{x}", f"/repo/bin/ios/I{x}.dll", random.choice(projects)) for x in range(random.randrange(8)))
+        result = package_storage.split_references_by_project(android_references, ios_references)
+        expected = split_references_by_nested_loop(android_references, ios_references)
+        assert [get_records(x) for x in result] == [get_records(x) for x in expected]
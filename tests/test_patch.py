@@ -0,0 +1,92 @@
+import lxml.etree
+from conv_package.patch import ProjectPatch, scan_nodes
+from conv_package.project import ProjectInfo
+
+PROJECT = """<Project Sdk="Microsoft.NET.Sdk">\r
+\r
+    <!-- packages -->\r
+    <ItemGroup>\r
+        <PackageReference Include="DevExpress.Maui.Core" Version="22.2.1" />\r
+        <PackageReference Include="Newtonsoft.Json"   Version="13.0.1" />\r
+    </ItemGroup>\r
+</Project>\r
+"""
+
+def load_project(tmp_path, content):
+    path = str(tmp_path / "App.csproj")
+    with open(path, "wb") as f:
+        f.write(content.encode("utf-8"))
+    return ProjectInfo(path)
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8")
+
+def test_unchanged_project_is_not_saved(tmp_path):
+    project = load_project(tmp_path, PROJECT)
+    project.remove_package_references(["Unknown"])
+    assert project.save() is False
+    assert read(project.proj_file_path) == PROJECT
+
+def test_edits_keep_the_rest_of_the_file(tmp_path):
+    project = load_project(tmp_path, PROJECT)
+    project.remove_package_references(["DevExpress.Maui.Core"])
+    project.add_package_reference("DevExpress.Data", "22.2.3")
+    assert project.save() is True
+    assert read(project.proj_file_path) == PROJECT.replace(
+        '        <PackageReference Include="DevExpress.Maui.Core" Version="22.2.1" />\r\n', "").replace(
+        '   Version="13.0.1" />\r\n', '   Version="13.0.1" />\r\n        <PackageReference Include="DevExpress.Data" Version="22.2.3"/>\r\n')
+    # the backup has the original content
+    [(_, backup_path)] = project.backup_store.get_backups(project.proj_file_path)
+    assert read(backup_path) == PROJECT
+
+def test_new_group_uses_sibling_indentation(tmp_path):
+    project = load_project(tmp_path, PROJECT)
+    project.add_package_reference("DevExpress.Maui.Android", "22.2.3", "android")
+    project.save()
+    assert read(project.proj_file_path).endswith('''    </ItemGroup>\r
+    <ItemGroup Condition="$(TargetFramework.Contains('-android'))">\r
+        <PackageReference Include="DevExpress.Maui.Android" Version="22.2.3"/>\r
+    </ItemGroup>\r
+</Project>\r
+''')
+
+def test_unsupported_markup_falls_back_to_serialization(tmp_path):
+    content = '<?xml version="1.0"?>\n<!DOCTYPE Project [<!ENTITY v "22.2.1">]>\n<Project>\n  <ItemGroup>\n    <PackageReference Include="A" Version="&v;" />\n  </ItemGroup>\n</Project>\n'
+    assert scan_nodes(content.encode("utf-8")) is None
+    project = load_project(tmp_path, content)
+    project.add_package_reference("B", "1.0")
+    assert project.save() is True
+    saved = lxml.etree.fromstring(read(project.proj_file_path).encode("utf-8"))
+    assert [(x.get("Include"), x.get("Version")) for x in saved.iter("PackageReference")] == [("A", "22.2.1"), ("B", "1.0")]
+
+def test_reordered_children_are_not_patched():
+    content = b"<Project>\n  <A />\n  <B />\n</Project>\n"
+    root = lxml.etree.fromstring(content)
+    patch = ProjectPatch(content, root)
+    root.append(root[0])
+    patch.record(root)
+    assert patch.render() is None
+    patch = ProjectPatch(content, lxml.etree.fromstring(content))
+    patch.root.remove(patch.root[1])
+    patch.record(patch.root)
+    assert patch.render() == b"<Project>\n  <A />\n</Project>\n"
+
+def test_trailing_comment_keeps_its_line():
+    content = b'<Project>\n  <ItemGroup>\n    <PackageReference Include="A" Version="1" />\n    <PackageReference Include="B" Version="1" /> <!-- trailing -->\n  </ItemGroup>\n</Project>\n'
+    root = lxml.etree.fromstring(content)
+    patch = ProjectPatch(content, root)
+    group = root[0]
+    group.remove(group[1])
+    patch.record(group)
+    assert patch.render() == b'<Project>\n  <ItemGroup>\n    <PackageReference Include="A" Version="1" />\n    <!-- trailing -->\n  </ItemGroup>\n</Project>\n'
+
+def test_removed_nodes_on_one_line():
+    content = b'<Project>\n  <ItemGroup>\n    <A /> <B /> <!-- b -->\n    <C /> <D />\n  </ItemGroup>\n</Project>\n'
+    root = lxml.etree.fromstring(content)
+    patch = ProjectPatch(content, root)
+    group = root[0]
+    for element in [group[0], group[1], group[3], group[4]]:
+        group.remove(element)
+    patch.record(group)
+    assert patch.render() == b'<Project>\n  <ItemGroup>\n    <!-- b -->\n  </ItemGroup>\n</Project>\n'
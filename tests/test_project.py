@@ -0,0 +1,138 @@
+import lxml.etree
+import pytest
+from conftest import write_file
+from conv_package.package import ReferenceInfo
+from conv_package.project import MSBUILD_NAMESPACE, ProjectElementIndex, ProjectInfo, classify_project
+
+def write_project(path, items):
+    write_file(path, f'''<Project Sdk="Microsoft.NET.Sdk">
+  <PropertyGroup>
+    <TargetFramework>netstandard2.0</TargetFramework>
+  </PropertyGroup>
+{items}</Project>
+''')
+    return ProjectInfo(path)
+
+def test_add_references_skips_references_without_project(tmp_path, capsys):
+    project = write_project(str(tmp_path / "App" / "App.csproj"), "")
+    references = [ReferenceInfo("Core", "/repo/bin/Core.dll", None), ReferenceInfo("Editors", "/repo/bin/Editors.dll", "/repo/Editors/Editors.csproj")]
+    project.add_references(references, "/repo")
+    content = project.render().decode("utf-8")
+    assert "Can't find project for Core /repo/bin/Core.dll" in capsys.readouterr().out
+    assert '<ProjectReference Include="/repo/Editors/Editors.csproj"/>' in content
+    assert "Core" not in content
+
+def write_classified(tmp_path, name, body, namespace=False, build_props=None):
+    xmlns = ' xmlns="http://schemas.microsoft.com/developer/msbuild/2003"' if namespace else ""
+    path = str(tmp_path / name / "src" / f"{name}.csproj")
+    write_file(path, f'<Project Sdk="Microsoft.NET.Sdk"{xmlns}>\n{body}</Project>\n')
+    if build_props is not None:
+        write_file(str(tmp_path / name / "Directory.Build.props"), f"<Project>\n  <PropertyGroup>\n{build_props}  </PropertyGroup>\n</Project>\n")
+    return path
+
+def classify_with_xpath(path):
+    # the order of the ProjectInfo predicates the single pass scan replaces
+    project = ProjectInfo(path)
+    if project.is_android():
+        return "android"
+    if project.is_ios():
+        return "ios"
+    if project.is_xamarin():
+        return "xamarin"
+    if any(x.text is None for x in project.search_nodes("//PropertyGroup//UseMaui")):
+        return None
+    return "maui" if project.is_maui() else None
+
+# namespaced imports, so properties of a namespace-less project still count next to them
+ANDROID_IMPORT = '  <Import xmlns="http://schemas.microsoft.com/developer/msbuild/2003" Project="$(MSBuildExtensionsPath)\\Xamarin\\Android\\Xamarin.Android.CSharp.targets" />\n'
+IOS_IMPORT = '  <Import xmlns="http://schemas.microsoft.com/developer/msbuild/2003" Project="$(MSBuildExtensionsPath)\\Xamarin\\iOS\\Xamarin.iOS.CSharp.targets" />\n'
+MAUI_PROPERTIES = "  <PropertyGroup>\n    <TargetFramework>net6.0-android</TargetFramework>\n    <TargetFramework>net6.0-ios</TargetFramework>\n    <UseMaui>true</UseMaui>\n    <UseMaui>true</UseMaui>\n  </PropertyGroup>\n"
+
+CLASSIFIER_CASES = [
+    ("xamarin", "  <PropertyGroup>\n    <TargetFramework>netstandard2.0</TargetFramework>\n  </PropertyGroup>\n", False, None, "xamarin"),
+    ("two_frameworks", "  <PropertyGroup>\n    <TargetFramework>netstandard2.0</TargetFramework>\n  </PropertyGroup>\n  <PropertyGroup>\n    <TargetFramework>netstandard2.1</TargetFramework>\n  </PropertyGroup>\n", False, None, None),
+    ("framework_outside_group", "  <TargetFramework>netstandard2.0</TargetFramework>\n", False, None, None),
+    ("nested_group", "  <PropertyGroup>\n    <PropertyGroup>\n      <TargetFramework>netstandard2.0</TargetFramework>\n    </PropertyGroup>\n  </PropertyGroup>\n", False, None, "xamarin"),
+    ("android", "  <PropertyGroup>\n    <TargetFramework>netstandard2.0</TargetFramework>\n  </PropertyGroup>\n" + ANDROID_IMPORT, True, None, "android"),
+    ("android_before_ios", ANDROID_IMPORT + IOS_IMPORT, True, None, "android"),
+    ("ios", "  <PropertyGroup>\n    <UseMaui>true</UseMaui>\n  </PropertyGroup>\n" + IOS_IMPORT, False, None, "ios"),
+    ("namespaced_ios", "  <PropertyGroup>\n    <TargetFramework>netstandard2.0</TargetFramework>\n  </PropertyGroup>\n" + IOS_IMPORT, True, None, "ios"),
+    ("ios_after_properties", MAUI_PROPERTIES + IOS_IMPORT, False, None, "ios"),
+    ("android_after_properties", MAUI_PROPERTIES + ANDROID_IMPORT, False, None, "android"),
+    ("ios_character_reference", MAUI_PROPERTIES + IOS_IMPORT.replace("iOS.CSharp", "i&#79;S.CSharp"), False, None, "ios"),
+    ("import_without_namespace", MAUI_PROPERTIES.replace("<UseMaui>true</UseMaui>\n    ", "", 1) + IOS_IMPORT.replace(' xmlns="http://schemas.microsoft.com/developer/msbuild/2003"', ""), False, None, "maui"),
+    ("maui", "  <PropertyGroup>\n    <TargetFrameworks>net6.0-android;net6.0-ios</TargetFrameworks>\n    <UseMaui>true</UseMaui>\n  </PropertyGroup>\n", False, None, "maui"),
+    ("maui_upper_case", "  <PropertyGroup>\n    <UseMaui>True</UseMaui>\n  </PropertyGroup>\n", False, None, "maui"),
+    ("maui_false", "  <PropertyGroup>\n    <UseMaui>false</UseMaui>\n  </PropertyGroup>\n", False, None, None),
+    ("maui_twice", MAUI_PROPERTIES, False, None, None),
+    ("maui_empty", "  <PropertyGroup>\n    <UseMaui />\n  </PropertyGroup>\n", False, None, None),
+    ("maui_in_build_props", "  <PropertyGroup>\n    <TargetFramework>net6.0</TargetFramework>\n  </PropertyGroup>\n", False, "    <UseMaui>true</UseMaui>\n", "maui"),
+    ("maui_in_both", "  <PropertyGroup>\n    <UseMaui>true</UseMaui>\n  </PropertyGroup>\n", False, "    <UseMaui>true</UseMaui>\n", None),
+    ("xamarin_with_maui_build_props", "  <PropertyGroup>\n    <TargetFramework>netstandard2.0</TargetFramework>\n  </PropertyGroup>\n", False, "    <UseMaui>true</UseMaui>\n", "xamarin"),
+    ("namespaced_maui_in_build_props", "  <PropertyGroup>\n    <TargetFramework>net6.0</TargetFramework>\n  </PropertyGroup>\n", True, "    <UseMaui>true</UseMaui>\n", "maui"),
+    ("test_project", "  <PropertyGroup>\n    <TargetFramework>net6.0</TargetFramework>\n  </PropertyGroup>\n", False, None, None),
+]
+
+@pytest.mark.parametrize("name, body, namespace, build_props, expected", CLASSIFIER_CASES, ids=[x[0] for x in CLASSIFIER_CASES])
+def test_classify_project_matches_xpath_predicates(tmp_path, name, body, namespace, build_props, expected):
+    path = write_classified(tmp_path, name, body, namespace, build_props)
+    assert classify_with_xpath(path) == expected
+    assert classify_project(path) == expected
+
+def test_scan_stops_once_decided(tmp_path):
+    # the scan never reaches the malformed tail
+    path = write_classified(tmp_path, "android", ANDROID_IMPORT + "  <<broken\n")
+    assert classify_project(path) == "android"
+    path = write_classified(tmp_path, "maui", MAUI_PROPERTIES + "  <<broken\n")
+    assert classify_project(path) is None
+    path = write_classified(tmp_path, "xamarin", "  <PropertyGroup>\n    <TargetFramework>netstandard2.0</TargetFramework>\n  </PropertyGroup>\n  <<broken\n")
+    with pytest.raises(lxml.etree.XMLSyntaxError):
+        classify_project(path)
+
+INDEXED_PROJECT = '''<Project Sdk="Microsoft.NET.Sdk"{xmlns}>
+  <PropertyGroup>
+    <TargetFramework>netstandard2.0</TargetFramework>
+  </PropertyGroup>
+  <ItemGroup>
+    <PackageReference Include="DevExpress.Maui.Core" Version="22.2.1" />
+    <PackageReference Include="Newtonsoft.Json" Version="13.0.1" />
+    <PackageReference Include="DevExpress.Maui.Core" Version="22.2.1" Condition="'$(Configuration)' == 'Debug'" />
+  </ItemGroup>
+  <ItemGroup Condition="$(TargetFramework.Contains('-android'))">
+    <Reference Include="DevExpress.Maui.Core.Android"><HintPath>..\\bin\\DevExpress.Maui.Core.Android.dll</HintPath></Reference>
+    <Reference Include="System" />
+  </ItemGroup>
+  <ItemGroup>
+    <ProjectReference Include="..\\Core\\Core.csproj" />
+    <PackageReference Include="DevExpress.Maui.Editors" Version="22.2.1" />
+  </ItemGroup>
+  <ItemGroup />
+</Project>
+'''
+
+def assert_index_is_current(project):
+    index = project.get_index()
+    rebuilt = ProjectElementIndex(project.root, MSBUILD_NAMESPACE if project.use_namespace else None)
+    assert index.elements == rebuilt.elements
+    assert index.members == rebuilt.members
+    assert index.includes == rebuilt.includes
+
+@pytest.mark.parametrize("xmlns", ["", f' xmlns="{MSBUILD_NAMESPACE}"'])
+def test_element_index_follows_edits(tmp_path, xmlns):
+    path = str(tmp_path / "App" / "App.csproj")
+    write_file(path, INDEXED_PROJECT.format(xmlns=xmlns))
+    project = ProjectInfo(path)
+    assert_index_is_current(project)
+    project.add_package_reference("DevExpress.Maui.Grid", "22.2.1")
+    project.add_package_reference("DevExpress.Maui.Android", "22.2.1", "android")
+    assert_index_is_current(project)
+    project.remove_package_references(["DevExpress.Maui.Core", "DevExpress.Maui.Grid", "DevExpress.Maui.Editors"])
+    assert_index_is_current(project)
+    assert [x.get("Include") for x in project.get_packagereference_nodes()] == ["Newtonsoft.Json"] + (["DevExpress.Maui.Android"] if xmlns == "" else [])
+    project.remove_reference_elements(list(project.get_reference_items()))
+    assert_index_is_current(project)
+    assert project.get_reference_nodes() == [] and project.get_project_reference_nodes() == []
+    project.clean_empty_groups()
+    assert_index_is_current(project)
+    assert len(project.get_group_nodes()) == (2 if xmlns == "" else 1)
+    assert not project.get_index().has_include("ProjectReference", "..\\Core\\Core.csproj")
@@ -0,0 +1,26 @@
+import os
+from conv_package.conv import build_parser
+from conv_package.query import run_query
+
+def test_global_options_before_and_after_query(tmp_path):
+    index_path = str(tmp_path / "index.sqlite")
+    before = build_parser().parse_args(["-w", "/repo", "--index", index_path, "-j", "3", "query", "deps", "DevExpress.Maui.Core", "--direct"])
+    after = build_parser().parse_args(["query", "-w", "/repo", "--index", index_path, "-j", "3", "deps", "DevExpress.Maui.Core", "--direct"])
+    for args in [before, after]:
+        assert (args.command, args.query_command) == ("query", "deps")
+        assert (args.repo_path, args.index_path, args.jobs, args.package, args.direct) == ("/repo", index_path, 3, "DevExpress.Maui.Core", True)
+
+def test_conversion_arguments_have_no_command():
+    args = build_parser().parse_args(["-w", "/repo", "-d"])
+    assert args.command is None
+    assert args.use_dll
+
+def test_run_query(repo, capsys):
+    assert run_query(build_parser().parse_args(["-w", repo, "-j", "1", "query", "rdeps", "DevExpress.Maui.Core"])) == 0
+    assert capsys.readouterr().out.splitlines()[-1] == "DevExpress.Maui.Editors"
+    # the second query reads the index written by the first one
+    assert run_query(build_parser().parse_args(["query", "-w", repo, "owner", "DevExpress.Maui.Core.dll", "--platform", "ios"])) == 0
+    output = capsys.readouterr().out
+    assert "Package index written" not in output
+    assert output.startswith(f"DevExpress.Maui.Core ios DevExpress.Maui.Core {os.path.join(repo, 'bin', 'ios', 'DevExpress.Maui.Core.dll')}")
+    assert run_query(build_parser().parse_args(["-w", repo, "query", "deps", "DevExpress.Maui.Unknown"])) == 1